@@ -1,58 +1,73 @@
 import os
+import json
+import uuid
 import logging
-from datetime import datetime, time as dtime
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
 
 from fastapi import FastAPI, Request, HTTPException, Query
 from sqlalchemy import desc
+from sqlalchemy.exc import IntegrityError
 
-from app.storage.db import Base, engine, SessionLocal
+from app.storage.db import Base, engine, SessionLocal, ensure_columns
+from app.storage.locks import HeldLock
 from app.storage.models import Contact, Thread, Message
+from app.services import outbox, campaigns, schedule, phrases
 
 # Providers
 from app.providers.base import SmsProvider  # noop/dry-run provider
 from app.providers import infobip as infobip_mod
+from app.providers.routing import RoutingProvider
 
 from fastapi.staticfiles import StaticFiles
-from app.routers.admin import router as admin_router
-
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 # LLM
+from app.services import llm, llm_router
 from app.services.llm import classify_lt, generate_reply_lt
 from app.routers.admin import router as admin_router
 from app.routers.chat import router as chat_router
+from app.util import metrics
+
 # -----------------------------------------------------------------------------
-# App + DB
+# App
+#   Import stays cheap: pandas/openpyxl/rapidfuzz load on the first admin
+#   request, the OpenAI SDK on the first LLM call, and one-time work (schema,
+#   transport, workers, leader election) runs in lifespan() via _startup().
+#   python -m app.tools.bench_startup guards both.
 # -----------------------------------------------------------------------------
-app = FastAPI(title="SMS Bot")
-
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-
-app.include_router(admin_router, prefix="/admin")
-app.include_router(chat_router)
-
-
-# expose env flags for templates
-app.state.env = os.getenv("APP_ENV", "local")
-app.state.dry_run = os.getenv("DRY_RUN", "1") in ("1", "true", "True", 1, True)
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await _startup()
+    try:
+        yield
+    finally:
+        await _shutdown()
 
+app = FastAPI(title="SMS Bot", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Mount static for the tiny UI
-from pathlib import Path
 static_dir = Path(__file__).parent / "static"
 if static_dir.exists():
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
 
-# Admin UI routes
+# admin routes carry their own /admin prefix
 app.include_router(admin_router)
+app.include_router(chat_router)
+
+# expose env flags for templates
+app.state.env = os.getenv("APP_ENV", "local")
+app.state.dry_run = os.getenv("DRY_RUN", "1") in ("1", "true", "True", 1, True)
 
 # -----------------------------------------------------------------------------
 # Config
 # -----------------------------------------------------------------------------
 DRY_RUN = os.getenv("DRY_RUN", "1") == "1"
-PER_PERSON_MIN_SECONDS = int(os.getenv("PER_PERSON_MIN_SECONDS", "90"))
-SKIP_BH = os.getenv("SKIP_BUSINESS_HOURS", "0") == "1"
+PER_PERSON_MIN_SECONDS = schedule.PER_PERSON_MIN_SECONDS
+SKIP_BH = schedule.SKIP_BH
 
 # -----------------------------------------------------------------------------
 # Logging
@@ -63,10 +78,20 @@ logger = logging.getLogger("sms-bot")
 # -----------------------------------------------------------------------------
 # Provider selection
 #   If Infobip envs are present, use InfobipProvider; else use dry-run base.
+#   SMS_ROUTES=INFOBIP,INFOBIP_B lists Infobip accounts by env prefix; with
+#   more than one configured, sends go through RoutingProvider (failover by
+#   EWMA latency/success, optional hedging; see providers/routing.py).
 # -----------------------------------------------------------------------------
-if getattr(infobip_mod, "is_enabled", lambda: False)():
-    provider = infobip_mod.InfobipProvider(dry_run=DRY_RUN)
-    logger.info("Provider: Infobip (dry_run=%s)", DRY_RUN)
+SMS_ROUTES = [p.strip() for p in os.getenv("SMS_ROUTES", "INFOBIP").split(",") if p.strip()]
+_routes = [r for r in (infobip_mod.InfobipProvider(dry_run=DRY_RUN, env_prefix=p) for p in SMS_ROUTES)
+           if r.is_enabled()]
+
+if len(_routes) > 1:
+    provider = RoutingProvider([(r.name, r) for r in _routes])
+    logger.info("Provider: routing over %s (dry_run=%s)", ", ".join(r.name for r in _routes), DRY_RUN)
+elif _routes:
+    provider = _routes[0]
+    logger.info("Provider: Infobip %s (dry_run=%s)", provider.name, DRY_RUN)
 else:
     provider = SmsProvider(dry_run=True)  # base provider is always dry-run
     logger.warning("Provider: DRY-RUN base provider (Infobip not configured)")
@@ -86,230 +111,714 @@ def healthz_head():
 # Helpers
 # -----------------------------------------------------------------------------
 def within_business_hours() -> bool:
-    if SKIP_BH:
-        return True
-    now = datetime.now().time()
-    return dtime(9, 0) <= now < dtime(18, 0)
-
-def _ensure_contact_thread(db, phone: str):
-    c = db.query(Contact).filter_by(phone=phone).first()
-    if not c:
-        c = Contact(phone=phone)
-        db.add(c)
-        db.flush()
-    t = db.query(Thread).filter_by(phone=phone, status="open").first()
-    if not t:
-        t = Thread(phone=phone)
-        db.add(t)
-        db.flush()
-    return c, t
+    return schedule.is_open()
+
+def _hold_until(force: bool) -> datetime | None:
+    """Outside the business window, outbound is held until it opens (UTC for the outbox)."""
+    if force or schedule.is_open():
+        return None
+    now = datetime.now()
+    return datetime.utcnow() + (schedule.next_open(now) - now)
+
+def _queued_status(not_before: datetime | None) -> dict:
+    if not_before is None:
+        return {"status": "queued"}
+    return {"status": "scheduled", "not_before": not_before.isoformat(timespec="seconds") + "Z"}
+
+_ensure_contact_thread = outbox.ensure_contact_thread
 
 
 import asyncio
 import logging
 from app.providers import infobip as _infobip
+from app.services.coalescer import InboundCoalescer
+from app.services.keyed_executor import KeyedExecutor
+from app.services.inbound_poller import AdaptivePoller
+from app.services.dlr import DlrBatcher
+from app.services.dedup import RecentIds
+from app.services.leader import Leader
+from app.providers import transport
 
 log = logging.getLogger("poller")
 
 INFOBIP_PULL = os.getenv("INFOBIP_PULL", "0") == "1"
-INFOBIP_POLL_SECONDS = int(os.getenv("INFOBIP_POLL_SECONDS", "5"))
+INFOBIP_POLL_SECONDS = int(os.getenv("INFOBIP_POLL_SECONDS", "5"))            # max idle backoff
+INFOBIP_POLL_MIN_SECONDS = float(os.getenv("INFOBIP_POLL_MIN_SECONDS", "0.5"))
+INFOBIP_POLL_LIMIT = int(os.getenv("INFOBIP_POLL_LIMIT", "100"))
+INBOUND_COALESCE_MS = int(os.getenv("INBOUND_COALESCE_MS", "1500"))
+INBOUND_CONCURRENCY = int(os.getenv("INBOUND_CONCURRENCY", "8"))
+MO_ACK_FAST = os.getenv("MO_ACK_FAST", "1") == "1"   # /webhooks/mo: store, 200, reply in background
+INBOUND_MAX_INFLIGHT = int(os.getenv("INBOUND_MAX_INFLIGHT", "200"))  # background turns before intake waits
+INBOUND_STORE_ATTEMPTS = int(os.getenv("INBOUND_STORE_ATTEMPTS", "3"))
+INBOUND_SWEEP_SECONDS = float(os.getenv("INBOUND_SWEEP_SECONDS", "60"))
+INBOUND_SWEEP_GRACE_SECONDS = float(os.getenv("INBOUND_SWEEP_GRACE_SECONDS", "300"))  # older = turn was lost
+INBOUND_SWEEP_MAX_AGE_HOURS = float(os.getenv("INBOUND_SWEEP_MAX_AGE_HOURS", "24"))   # too late to answer
+INBOUND_SWEEP_LIMIT = int(os.getenv("INBOUND_SWEEP_LIMIT", "500"))
+
+GOODBYE_TX = "Supratau – daugiau netrukdysime. Gražios dienos!"
+STOP_INTENTS = {"stop", "not_interested", "do_not_contact", "unsubscribe"}
 
-async def _process_inbound_item(item: dict):
+# -----------------------------------------------------------------------------
+# Inbound pipeline (shared by webhook and poller)
+#   1) _store_inbound: persist MO, DNC / keyword checks (no LLM)
+#   2) coalescer: debounce bursts per phone into one turn
+#   3) _prepare_turn: classify + generate (cancellable, runs off the loop)
+#   4) _commit_turn: DNC or queue the reply in the outbox
+# MOs that need a turn are stored as status "pending" and _commit_turn marks
+# them "delivered"; _inbound_sweep re-runs turns lost to a restart or crash.
+# Steps 1 and 4 touch contact/thread rows and run through the per-msisdn
+# executor (ordered per phone, parallel across phones); step 3 only takes a
+# concurrency slot so a new fragment's store never waits behind generation.
+# -----------------------------------------------------------------------------
+# Inbound MOs are keyed on the provider messageId, outbound sends on userref;
+# the partial unique indexes on messages enforce both, these caches only
+# drop webhook retries / poll overlaps before they reach the DB.
+recent_mo = RecentIds()
+recent_sends = RecentIds()
+
+def _ref(kind: str) -> str:
+    """Unique userref for messages the bot sends on its own (replies, goodbyes)."""
+    return f"{kind}:{uuid.uuid4().hex[:16]}"
+
+def _mo_seen(db, provider_ids: list[str]) -> set[str]:
+    """Which of these provider messageIds are already stored as inbound rows."""
+    ids = [p for p in provider_ids if p]
+    if not ids:
+        return set()
+    rows = db.query(Message.provider_id).filter(Message.dir == "in", Message.provider_id.in_(ids))
+    return {pid for pid, in rows}
+
+inbound_executor = KeyedExecutor(concurrency=INBOUND_CONCURRENCY)
+
+async def _store_inbound(msisdn: str, text: str, provider_id: str | None = None) -> dict | None:
     """
-    Adapts pulled MO into the same flow as webhook.
+    Store the MO and handle everything that needs no LLM.
+    Returns a final response dict, or None when the text should go to the LLM.
+    A provider messageId seen before is dropped without a reply.
     """
-    from_ = item.get("from") or ""
-    text  = (item.get("text") or "").strip()
-    if not from_ or not text:
-        return
-
-    # Reuse your /webhooks/mo core by calling classify_and_reply_lt path directly
-    from app.storage.db import SessionLocal
-    from app.storage.models import Contact, Thread, Message
-    from app.services.llm import classify_and_reply_lt, INTENT_STOP_SET
-
+    duplicate = {"ok": True, "duplicate": True}
+    if provider_id and recent_mo.get(provider_id):
+        return duplicate
     db = SessionLocal()
     try:
-        c = db.query(Contact).filter_by(phone=from_).first()
-        if not c:
-            c = Contact(phone=from_); db.add(c)
-        t = db.query(Thread).filter_by(phone=from_, status="open").first()
-        if not t:
-            t = Thread(phone=from_); db.add(t); db.flush()
-
-        db.add(Message(thread_id=t.id, dir="in", body=text, status="delivered"))
-        db.commit()
+        if provider_id and _mo_seen(db, [provider_id]):
+            recent_mo.put(provider_id)
+            return duplicate
+        c, t = _ensure_contact_thread(db, msisdn)
+        # DNC / stop phrases (services/phrases.py; built-ins only as a short whole message)
+        hit = None if c.dnc else phrases.match(text)
+        status = "delivered" if c.dnc or hit else "pending"
+        db.add(Message(thread_id=t.id, dir="in", body=text, status=status, provider_id=provider_id))
+        try:
+            db.commit()
+        except IntegrityError:
+            # the same MO raced in through the other path (webhook vs poller)
+            db.rollback()
+            recent_mo.put(provider_id)
+            return duplicate
+        if provider_id:
+            recent_mo.put(provider_id)
 
         if c.dnc:
-            return
+            logger.info("MO ignored (DNC) from %s: %r", msisdn, text)
+            return {"ok": True, "ignored": "dnc"}
 
-        res = classify_and_reply_lt(from_, text)
-        intent = (res.get("intent") or "").lower()
-        reply  = (res.get("reply") or "").strip()
+        if hit:
+            logger.info("MO DNC phrase %r from %s", hit[0], msisdn)
+            c.dnc = True
+            outbox.enqueue(db, msisdn, GOODBYE_TX, userref=_ref("dnc-goodbye"), kind="dnc-goodbye", thread=t)
+            db.commit()
+            outbox.wake()
+            return {"ok": True, "dnc": True}
+        return None
+    finally:
+        db.close()
 
-        if intent in INTENT_STOP_SET:
-            c.dnc = True; db.commit()
-            await provider.send(from_, "Supratau – daugiau netrukdysime. Gražios dienos!", userref="dnc-goodbye")
-            return
+def _new_mos(db, mos: list[dict]) -> list[dict]:
+    """Drop MOs whose messageId was already stored (or repeats within the batch)."""
+    stored = _mo_seen(db, [m.get("provider_id") for m in mos if not recent_mo.get(m.get("provider_id") or "")])
+    out, seen = [], set()
+    for m in mos:
+        pid = m.get("provider_id")
+        if pid and (pid in seen or pid in stored or recent_mo.get(pid)):
+            recent_mo.put(pid)
+            continue
+        seen.add(pid)
+        out.append(m)
+    return out
+
+def _store_inbound_batch(mos: list[dict]) -> tuple[list[dict], int]:
+    """
+    _store_inbound() for a whole webhook batch in one transaction.
+    Returns (MOs that still need the LLM, how many were duplicates).
+    """
+    try:
+        return _store_inbound_batch_once(mos)
+    except IntegrityError:
+        # a concurrent delivery stored one of these first; the retry filters it out
+        return _store_inbound_batch_once(mos)
 
+def _store_inbound_batch_once(mos: list[dict]) -> tuple[list[dict], int]:
+    db = SessionLocal()
+    try:
+        fresh = _new_mos(db, mos)
+        if not fresh:
+            return [], len(mos)
+        threads = outbox.ensure_threads(db, [m["from"] for m in fresh])
+        contacts = {c.phone: c for c in db.query(Contact).filter(Contact.phone.in_(list(threads)))}
+        todo = []
+        for m in fresh:
+            msisdn, text = m["from"], m["text"]
+            c, t = contacts[msisdn], threads[msisdn]
+            hit = None if c.dnc else phrases.match(text)
+            db.add(Message(thread_id=t.id, dir="in", body=text, status="delivered" if c.dnc or hit else "pending",
+                           provider_id=m.get("provider_id") or None))
+            if c.dnc:
+                logger.info("MO ignored (DNC) from %s: %r", msisdn, text)
+                continue
+            if hit:
+                logger.info("MO DNC phrase %r from %s", hit[0], msisdn)
+                c.dnc = True
+                outbox.enqueue(db, msisdn, GOODBYE_TX, userref=_ref("dnc-goodbye"), kind="dnc-goodbye", thread=t)
+                continue
+            todo.append(m)
+        db.commit()
+        for m in fresh:
+            if m.get("provider_id"):
+                recent_mo.put(m["provider_id"])
+        return todo, len(mos) - len(fresh)
+    finally:
+        db.close()
+
+async def _prepare_turn(msisdn: str, text: str) -> dict:
+    # LLM calls are blocking; run them in a thread so a newer fragment can cancel the wait.
+    # Cancelling does not stop the thread: `stop` tells it to skip its remaining LLM stages.
+    stop = threading.Event()
+    started_at = datetime.utcnow()  # every fragment of this burst is stored by now
+    try:
+        cls = await asyncio.to_thread(classify_lt, text)  # {"intent": str, "confidence": float}
+        intent = (cls.get("intent") or "").lower()
+        if intent in STOP_INTENTS:
+            return {"intent": intent, "confidence": cls.get("confidence"), "dnc": True, "started_at": started_at}
+        reply = await asyncio.to_thread(generate_reply_lt, {"msisdn": msisdn, "cancelled": stop.is_set}, text)
+    except asyncio.CancelledError:
+        stop.set()
+        raise
+    return {"intent": intent, "confidence": cls.get("confidence"), "reply": reply, "started_at": started_at}
+
+def _mark_answered(db, thread_id: int, started_at: datetime | None) -> None:
+    """The turn's inbound rows are handled (in the same transaction as its reply)."""
+    q = db.query(Message).filter(Message.thread_id == thread_id, Message.dir == "in", Message.status == "pending")
+    if started_at is not None:
+        q = q.filter(Message.ts <= started_at)
+    q.update({Message.status: "delivered"}, synchronize_session=False)
+
+async def _commit_turn(msisdn: str, res: dict) -> dict:
+    started_at = res.pop("started_at", None)
+    db = SessionLocal()
+    try:
+        c, t = _ensure_contact_thread(db, msisdn)
+        _mark_answered(db, t.id, started_at)
+        if res.get("dnc"):
+            c.dnc = True
+            outbox.enqueue(db, msisdn, GOODBYE_TX, userref=_ref("dnc-goodbye"), kind="dnc-goodbye", thread=t)
+            db.commit()
+            outbox.wake()
+            return {"ok": True, **res}
+
+        reply = res.get("reply")
         if reply:
-            await provider.send(from_, reply, userref="llm-reply")
-            db.add(Message(thread_id=t.id, dir="out", body=reply, status="sent"))
+            outbox.enqueue(db, msisdn, reply, userref=_ref("llm-reply"), kind="llm-reply", thread=t)
+            db.commit()
+            outbox.wake()
+        else:
             db.commit()
+        return {"ok": True, **res}
     finally:
         db.close()
 
-async def _infobip_poller():
-    log.info("Infobip puller started (every %ss)", INFOBIP_POLL_SECONDS)
-    while True:
+coalescer = InboundCoalescer(
+    prepare=lambda msisdn, text: inbound_executor.bounded(lambda: _prepare_turn(msisdn, text)),
+    commit=lambda msisdn, res: inbound_executor.run(msisdn, lambda: _commit_turn(msisdn, res)),
+    window_s=INBOUND_COALESCE_MS / 1000,
+)
+
+async def _converse(msisdn: str, text: str) -> dict:
+    res = await coalescer.submit(msisdn, text)
+    if res is None:
+        return {"ok": True, "coalesced": True}
+    return res
+
+async def _handle_inbound(msisdn: str, text: str, provider_id: str | None = None) -> dict:
+    done = await inbound_executor.run(msisdn, lambda: _store_inbound(msisdn, text, provider_id))
+    if done is not None:
+        return done
+    return await _converse(msisdn, text)
+
+_background: set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+_turn_slots = asyncio.Semaphore(max(1, INBOUND_MAX_INFLIGHT))
+
+async def _spawn_turn(msisdn: str, text: str) -> None:
+    """
+    Run the conversation step for an already stored MO in the background.
+    Waits while INBOUND_MAX_INFLIGHT turns are running, so a flood slows
+    intake (the poller's next fetch, the webhook ack) instead of piling up tasks.
+    """
+    await _turn_slots.acquire()
+    task = _spawn(_converse(msisdn, text))
+    task.add_done_callback(lambda _: _turn_slots.release())
+
+async def _process_inbound_page(items: list[dict]):
+    """
+    Pulled MOs, same flow as the ack-fast webhook. Infobip pull is destructive
+    (each MO is returned once), so the whole page is stored before any
+    conversation starts; a crash after this point loses no MO.
+    """
+    mos = [{"from": it.get("from") or "", "text": (it.get("text") or "").strip(),
+            "provider_id": it.get("provider_id") or None} for it in items]
+    mos = [m for m in mos if m["from"] and m["text"]]
+    if not mos:
+        return
+    for attempt in range(1, INBOUND_STORE_ATTEMPTS + 1):
         try:
-            items, raw = _infobip.fetch_inbound(limit=100)
-            if items:
-                log.info("Pulled %d MO", len(items))
-                for it in items:
-                    await _process_inbound_item(it)
-        except Exception as e:
-            log.exception("Poller error")
-        await asyncio.sleep(INFOBIP_POLL_SECONDS)
+            todo, _ = await asyncio.to_thread(_store_inbound_batch, mos)
+            break
+        except Exception:
+            if attempt == INBOUND_STORE_ATTEMPTS:
+                # nothing else holds these any more: leave them in the log
+                logger.exception("Pulled MOs could not be stored: %s", json.dumps(mos, ensure_ascii=False))
+                return
+            logger.exception("Storing pulled MOs failed (attempt %d); retrying", attempt)
+            await asyncio.sleep(attempt)
+    outbox.wake()
+    for m in todo:
+        await _spawn_turn(m["from"], m["text"])
+
+def _unanswered_inbound(now: datetime) -> list[tuple[str, str]]:
+    """
+    (msisdn, text) of inbound rows still pending after the grace period,
+    oldest first. Rows past the max age, or from contacts that are DNC by
+    now, are closed instead of answered.
+    """
+    stale_before = now - timedelta(seconds=INBOUND_SWEEP_GRACE_SECONDS)
+    too_old = now - timedelta(hours=INBOUND_SWEEP_MAX_AGE_HOURS)
+    db = SessionLocal()
+    try:
+        pending = db.query(Message).filter(Message.dir == "in", Message.status == "pending")
+        expired = pending.filter(Message.ts < too_old).update({Message.status: "delivered"}, synchronize_session=False)
+        if expired:
+            logger.warning("Inbound sweep: %d MOs older than %.0fh left unanswered", expired, INBOUND_SWEEP_MAX_AGE_HOURS)
+        rows = (
+            db.query(Message.id, Thread.phone, Message.body, Contact.dnc)
+              .join(Thread, Thread.id == Message.thread_id)
+              .join(Contact, Contact.phone == Thread.phone)
+              .filter(Message.dir == "in", Message.status == "pending", Message.ts < stale_before)
+              .order_by(Message.ts, Message.id)
+              .limit(INBOUND_SWEEP_LIMIT)
+              .all()
+        )
+        dnc_ids = [mid for mid, _, _, dnc in rows if dnc]
+        if dnc_ids:
+            db.query(Message).filter(Message.id.in_(dnc_ids)).update({Message.status: "delivered"},
+                                                                     synchronize_session=False)
+        db.commit()
+        return [(phone, body or "") for _, phone, body, dnc in rows if not dnc]
+    finally:
+        db.close()
 
-@app.on_event("startup")
-async def _maybe_start_poller():
-    if INFOBIP_PULL:
-        asyncio.create_task(_infobip_poller())
+async def _inbound_sweep():
+    """
+    Singleton loop: turns for stored MOs can be lost (ack-fast webhook or poller
+    spawn them in memory, then the process restarts). Resubmit what is still
+    pending; the coalescer merges each phone's rows into one turn again.
+    """
+    while True:
+        due = await asyncio.to_thread(_unanswered_inbound, datetime.utcnow())
+        due = [(msisdn, text) for msisdn, text in due if not coalescer.active(msisdn)]
+        if due:
+            logger.warning("Inbound sweep: re-running turns for %d unanswered MOs from %d phones",
+                           len(due), len({m for m, _ in due}))
+        for msisdn, text in due:
+            await _spawn_turn(msisdn, text)
+        await asyncio.sleep(INBOUND_SWEEP_SECONDS)
+
+poller: AdaptivePoller | None = None
+
+async def _infobip_poller():
+    global poller
+    poller = AdaptivePoller(
+        fetch=lambda limit: _infobip.fetch_inbound_async(limit=limit),
+        handle=_process_inbound_page,
+        limit=INFOBIP_POLL_LIMIT,
+        min_s=INFOBIP_POLL_MIN_SECONDS,
+        max_s=INFOBIP_POLL_SECONDS,
+    )
+    await poller.run()
+
+outbox_workers = outbox.OutboxWorkers(provider)
+
+# Loops that must run once per deployment, in whichever worker leads
+leader = Leader()
+leader.singleton("outbox-maintenance", outbox.maintain)
+leader.singleton("campaigns", campaigns.supervise)
+leader.singleton("inbound-sweep", _inbound_sweep)
+if INFOBIP_PULL:
+    leader.singleton("infobip-poller", _infobip_poller)
+
+def _init_schema():
+    # N uvicorn workers start at once: one creates/migrates, the rest find it done
+    with HeldLock("schema"):
+        Base.metadata.create_all(bind=engine)
+        ensure_columns()
+
+async def _startup():
+    await asyncio.to_thread(_init_schema)
+    logger.info("LLM: %s", llm.prompt_info())
+    await transport.startup()
+    await outbox_workers.start()
+    await leader.start()
+
+async def _shutdown():
+    await leader.stop()
+    await outbox_workers.stop()
+    await dlr_batcher.flush()
+    await transport.shutdown()
+
+@app.get("/leader/stats")
+def leader_stats():
+    return leader.stats()
+
+@app.get("/poller/stats")
+def poller_stats():
+    return {
+        "enabled": INFOBIP_PULL,
+        "poll": dict(poller.stats) if poller else None,
+        # local backlog: fragments waiting in the coalescer + inbound tasks in flight
+        "local_backlog": {"coalescing": coalescer.pending(), "tasks": len(_background)},
+    }
+
+@app.get("/outbox/stats")
+def outbox_stats():
+    return {"workers": outbox_workers.workers, "tps": outbox_workers.bucket.rate,
+            "depth": outbox.depth(), **outbox_workers.stats, "lanes": outbox_workers.lane_stats}
+
+@app.get("/provider/stats")
+def provider_stats():
+    routes = provider.stats() if isinstance(provider, RoutingProvider) else None
+    return {"provider": type(provider).__name__, "routes": routes}
+
+@app.get("/llm/stats")
+def llm_stats():
+    # per stage:model calls/errors/latency, per stage escalation rate, token usage
+    return {**llm_router.route_stats(), "breaker": llm.breaker.state}
+
+# -----------------------------------------------------------------------------
+# Metrics
+#   Hot paths record into util/metrics.py as they run (HTTP middleware, SQL
+#   engine events, LLM calls, provider requests, poller lag); the stats the
+#   endpoints above already keep are read at scrape time.
+# -----------------------------------------------------------------------------
+def _route_health(key: str) -> dict:
+    if not isinstance(provider, RoutingProvider):
+        return {}
+    return {(name,): float(st[key]) for name, st in provider.stats().items() if st[key] is not None}
+
+def _llm_stages(key: str) -> dict:
+    return {(stage,): st[key] for stage, st in llm_router.route_stats()["stages"].items()}
+
+def _llm_routes(key: str) -> dict:
+    out = {}
+    for route, st in llm_router.route_stats()["routes"].items():
+        stage, _, model = route.partition(":")
+        out[(stage, model)] = st[key]
+    return out
+
+metrics.gauge("sms_outbox_depth", "Outbox rows by status.",
+              lambda: {(k,): v for k, v in outbox.depth().items()}, ("status",))
+metrics.gauge("sms_outbox_events_total", "Outbox worker outcomes in this process.",
+              lambda: {(k,): outbox_workers.stats[k] for k in ("batches", "sent", "retried", "failed", "errors")},
+              ("event",), kind="counter")
+metrics.gauge("sms_outbox_throttled_seconds_total", "Time outbox workers waited on the rate limiter.",
+              lambda: outbox_workers.stats["throttled_s"], kind="counter")
+metrics.gauge("sms_outbox_lane_due", "Due outbox rows per lane (last worker look).",
+              lambda: {(lane,): st["due"] for lane, st in outbox_workers.lane_stats.items()}, ("lane",))
+metrics.gauge("sms_outbox_lane_oldest_seconds", "Age of the oldest due row per lane.",
+              lambda: {(lane,): st["oldest_s"] for lane, st in outbox_workers.lane_stats.items()}, ("lane",))
+metrics.gauge("sms_poller_backlog", "Provider-side pending inbound messages at the last poll.",
+              lambda: poller.stats["backlog"] if poller else None)
+metrics.gauge("sms_poller_last_poll_age_seconds", "Seconds since the last successful poll.",
+              lambda: time.time() - poller.stats["last_poll_at"] if poller and poller.stats["last_poll_at"] else None)
+metrics.gauge("sms_inbound_coalescing", "Inbound fragments waiting in the coalescer.", lambda: coalescer.pending())
+metrics.gauge("sms_inbound_tasks", "Inbound turns in flight.", lambda: len(_background))
+metrics.gauge("sms_dlr_buffered", "Delivery reports waiting for the next batch flush.", lambda: dlr_batcher.buffered())
+metrics.gauge("sms_dlr_events_total", "Delivery reports by outcome.",
+              lambda: {(k,): dlr_batcher.stats[k] for k in ("received", "ignored", "applied", "unmatched", "errors")},
+              ("event",), kind="counter")
+metrics.gauge("sms_route_success", "EWMA send success per provider route.", lambda: _route_health("success"), ("route",))
+metrics.gauge("sms_route_latency_ms", "EWMA send latency per provider route.", lambda: _route_health("latency_ms"), ("route",))
+metrics.gauge("sms_route_available", "1 unless the route is parked.", lambda: _route_health("available"), ("route",))
+metrics.gauge("sms_llm_breaker_open", "1 while the LLM circuit breaker refuses calls.",
+              lambda: 0 if llm.breaker.state == "closed" else 1)
+metrics.gauge("sms_llm_stage_calls_total", "Logical LLM stage invocations (an escalated one counts once).",
+              lambda: _llm_stages("calls"), ("stage",), kind="counter")
+metrics.gauge("sms_llm_stage_escalations_total", "Stage invocations retried on the escalation model.",
+              lambda: _llm_stages("escalations"), ("stage",), kind="counter")
+metrics.gauge("sms_llm_route_calls_total", "LLM calls per stage and model.",
+              lambda: _llm_routes("calls"), ("stage", "model"), kind="counter")
+metrics.gauge("sms_llm_route_errors_total", "LLM calls per stage and model that gave up.",
+              lambda: _llm_routes("errors"), ("stage", "model"), kind="counter")
+metrics.gauge("sms_leader", "1 in the worker running the singleton loops.", lambda: int(leader.is_leader))
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 
 # -----------------------------------------------------------------------------
 # Outbound send (opener or manual)
 # -----------------------------------------------------------------------------
+def _check_can_send(db, to: str) -> None:
+    # DNC guard
+    c = db.query(Contact).filter_by(phone=to).first()
+    if c and c.dnc:
+        raise HTTPException(403, "DNC/STOP on this contact")
+
+    # Per-person throttle
+    last_out = (
+        db.query(Message)
+          .join(Thread, Thread.id == Message.thread_id)
+          .filter(Thread.phone == to, Message.dir == "out")
+          .order_by(desc(Message.ts))
+          .first()
+    )
+    if last_out and (datetime.utcnow() - last_out.ts).total_seconds() < PER_PERSON_MIN_SECONDS:
+        raise HTTPException(429, "Per-person throttle")
+
+
+def _original_send(db, userref: str | None) -> dict | None:
+    """
+    Response for a userref that was already accepted (idempotent retries).
+    The cache only remembers which message a userref became; its status is
+    read from the DB, since the outbox moves it on after the first answer.
+    """
+    if not userref:
+        return None
+    cached = recent_sends.get(userref)
+    hit = outbox.sent_by_id(db, cached) if cached else outbox.sent_by_userref(db, [userref]).get(userref)
+    if hit is None:
+        return None
+    recent_sends.put(userref, hit["id"])
+    return {**hit, "duplicate": True}
+
 @app.post("/send")
 async def send(payload: dict, force: bool = Query(False)):
-    if not force and not within_business_hours():
-        raise HTTPException(400, "Outside business hours (09:00–18:00)")
-    
     to = payload["to"]
     body = payload.get("body") or payload.get("text")
     if not body:
         raise HTTPException(400, "Missing body/text")
-    userref = payload.get("userref")
+    userref = payload.get("userref") or None
 
     db = SessionLocal()
     try:
-        # DNC guard
-        c = db.query(Contact).filter_by(phone=to).first()
-        if c and c.dnc:
-            raise HTTPException(403, "DNC/STOP on this contact")
-
-        # Per-person throttle
-        last_out = (
-            db.query(Message)
-              .join(Thread, Thread.id == Message.thread_id)
-              .filter(Thread.phone == to, Message.dir == "out")
-              .order_by(desc(Message.ts))
-              .first()
-        )
-        if last_out and (datetime.utcnow() - last_out.ts).total_seconds() < PER_PERSON_MIN_SECONDS:
-            raise HTTPException(429, "Per-person throttle")
-
-        # Ensure contact/thread
-        c, t = _ensure_contact_thread(db, to)
-
-        # Send via selected provider
-        prov_id = await provider.send(to, body, userref=userref)
-
-        # Persist message
-        m = Message(
-            thread_id=t.id,
-            dir="out",
-            body=body,
-            status="sent",
-            provider_id=prov_id,
-            userref=userref,
-        )
-        db.add(m)
-        db.commit()
-        return {"id": prov_id}
+        # a retried request gets the original id back before the throttle sees it
+        original = _original_send(db, userref)
+        if original:
+            return original
+        _check_can_send(db, to)
+
+        # Queue for the outbox workers (Message is stored as 'queued');
+        # outside business hours it waits for the window instead of failing
+        hold = _hold_until(force)
+        item = outbox.enqueue(db, to, body, userref=userref, kind="manual", not_before=hold)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            original = _original_send(db, userref)
+            if original:
+                return original
+            raise
+        outbox.wake()
+        res = {"id": item.message_id, "outbox_id": item.id, **_queued_status(hold)}
+        if userref:
+            recent_sends.put(userref, item.message_id)
+        return res
     finally:
         db.close()
 
+# -----------------------------------------------------------------------------
+# Delivery reports
+#   Provider.parse_dlr_batch → [{provider_id, status, ...}], acked right away;
+#   DlrBatcher applies final states in bulk UPDATEs keyed by provider_id
+# -----------------------------------------------------------------------------
+dlr_batcher = DlrBatcher()
+
+@app.post("/webhooks/dlr")
+async def dlr(req: Request):
+    payload = await req.json()
+    reports = provider.parse_dlr_batch(payload, req.headers)
+    accepted = dlr_batcher.submit(reports)
+    return {"ok": True, "received": len(reports), "accepted": accepted}
+
+@app.get("/dlr/stats")
+def dlr_stats():
+    return {**dlr_batcher.stats, "buffered": dlr_batcher.buffered()}
+
 # -----------------------------------------------------------------------------
 # Inbound webhook (MO)
-#   Provider.parse_mo → {from, text, ...}
-#   DNC keywords → set DNC and confirm
-#   Else LLM classify; stop -> DNC, else generate reply and send
+#   Provider.parse_mo_batch → [{from, text, ...}, ...] (Infobip batches results)
+#   DNC/stop phrases (services/phrases.py, no LLM) → set DNC and confirm
+#   Else (after coalescing) LLM classify; stop -> DNC, else generate reply and send
+#   Ack-fast (default): store the batch in one transaction, answer 200 and run
+#   the conversation in the background; ?wait=1 holds the request for the
+#   reply (CLI simulator).
 # -----------------------------------------------------------------------------
 @app.post("/webhooks/mo")
-async def mo(req: Request):
+async def mo(req: Request, wait: bool = Query(not MO_ACK_FAST)):
     payload = await req.json()
-    mo = provider.parse_mo(payload, req.headers)
-
-    msisdn = mo.get("from") or mo.get("msisdn") or ""
-    text = (mo.get("text") or "").strip()
-    text_l = text.lower()
+    mos = []
+    for m in provider.parse_mo_batch(payload, req.headers):
+        msisdn = m.get("from") or m.get("msisdn") or ""
+        if msisdn:
+            mos.append({**m, "from": msisdn, "text": (m.get("text") or "").strip()})
 
-    if not msisdn:
+    if not mos:
         raise HTTPException(400, "Missing sender")
 
-    db = SessionLocal()
-    try:
-        # Ensure contact/thread and store inbound
-        c, t = _ensure_contact_thread(db, msisdn)
-        db.add(Message(thread_id=t.id, dir="in", body=text, status="delivered"))
-        db.commit()
-
-        # If already DNC, do nothing
-        if c.dnc:
-            logger.info("MO ignored (DNC) from %s: %r", msisdn, text)
-            return {"ok": True, "ignored": "dnc"}
-
-        # Env-based DNC keywords (optional)
-        raw = os.getenv("DNC_PHRASES", "")
-        dnc_phrases = {p.strip().lower() for p in raw.split(",") if p.strip()}
-        if dnc_phrases and text_l in dnc_phrases:
-            c.dnc = True
-            db.commit()
-            await provider.send(msisdn, "Supratau – daugiau netrukdysime. Gražios dienos!", userref="dnc-goodbye")
-            return {"ok": True, "dnc": True}
-
-        # LLM classify
-        cls = classify_lt(text)  # {"intent": str, "confidence": float}
-        intent = (cls.get("intent") or "").lower()
-
-        if intent in {"stop", "not_interested", "do_not_contact", "unsubscribe"}:
-            c.dnc = True
-            db.commit()
-            await provider.send(msisdn, "Supratau – daugiau netrukdysime. Gražios dienos!", userref="dnc-goodbye")
-            return {"ok": True, "intent": intent, "confidence": cls.get("confidence"), "dnc": True}
+    if wait:
+        # Bursts from one phone are merged; only the last fragment's call carries the reply
+        if len(mos) == 1:
+            m = mos[0]
+            return await _handle_inbound(m["from"], m["text"], m.get("provider_id") or None)
+        results = await asyncio.gather(
+            *(_handle_inbound(m["from"], m["text"], m.get("provider_id") or None) for m in mos)
+        )
+        return {"ok": True, "results": results}
 
-        # LLM reply
-        reply = generate_reply_lt({"msisdn": msisdn}, text)
+    todo, duplicates = await asyncio.to_thread(_store_inbound_batch, mos)
+    outbox.wake()
+    for m in todo:
+        await _spawn_turn(m["from"], m["text"])
+    return {"ok": True, "accepted": len(mos), "duplicates": duplicates, "conversations": len(todo)}
 
-        if reply:
-            prov_id = await provider.send(msisdn, reply, userref="llm-reply")
-            db.add(Message(thread_id=t.id, dir="out", body=reply, status="sent", provider_id=prov_id))
-            db.commit()
+# -----------------------------------------------------------------------------
+# Batch sender
+#   Same guards as /send, but DNC/throttle state is prefetched per chunk and
+#   chunks are queued concurrently; results stream back as NDJSON lines in
+#   completion order, then one {"done": true, ...} summary line.
+# -----------------------------------------------------------------------------
+SEND_BATCH_CHUNK = int(os.getenv("SEND_BATCH_CHUNK", "200"))
+SEND_BATCH_CONCURRENCY = int(os.getenv("SEND_BATCH_CONCURRENCY", "4"))
 
-        return {"ok": True, "intent": intent, "confidence": cls.get("confidence"), "reply": reply}
+def _queue_batch_chunk(chunk: list[tuple[int, dict]], hold: datetime | None = None) -> list[dict]:
+    """Validate + enqueue one chunk in its own session; one result per item."""
+    results = {i: {"index": i, "to": item.get("to"), "ok": False} for i, item in chunk}
+    db = SessionLocal()
+    try:
+        dnc, last_out = outbox.recipient_state(db, [item["to"] for _, item in chunk if item.get("to")])
+        originals = outbox.sent_by_userref(db, [item.get("userref") for _, item in chunk])
+        now = datetime.utcnow()
+        accepted: list[tuple[int, dict]] = []
+        for i, item in chunk:
+            to = item.get("to")
+            body = item.get("body") or item.get("text")
+            ref = item.get("userref")
+            if ref and ref in originals:
+                results[i].update(ok=True, duplicate=True, **originals[ref])
+            elif not to:
+                results[i]["error"] = "Missing to"
+            elif not body:
+                results[i]["error"] = "Missing body/text"
+            elif to in dnc:
+                results[i]["error"] = "DNC/STOP on this contact"
+            elif to in last_out and (now - last_out[to]).total_seconds() < PER_PERSON_MIN_SECONDS:
+                results[i]["error"] = "Per-person throttle"
+            else:
+                accepted.append((i, {"to": to, "text": body, "userref": item.get("userref")}))
+
+        rows = [row for _, row in accepted]
+        items = outbox.enqueue_many(db, rows, kind="batch", not_before=hold) if accepted else []
+        db.commit()
+        for (i, row), ob in zip(accepted, items):
+            results[i].update(ok=True, id=ob.message_id, **_queued_status(hold))
+            if row["userref"]:
+                recent_sends.put(row["userref"], ob.message_id)
+    except Exception as e:
+        db.rollback()
+        logger.exception("send-batch chunk failed")
+        for r in results.values():
+            r.update(ok=False, error=str(e))
     finally:
         db.close()
+    return list(results.values())
 
-# -----------------------------------------------------------------------------
-# Batch sender (reuses /send)
-# -----------------------------------------------------------------------------
 @app.post("/send-batch")
-async def send_batch(payload: dict, force: bool = Query(False)):
+async def send_batch(payload: dict, force: bool = Query(False), stream: bool = Query(True)):
     """
     payload: { "items": [ { "to": "...", "body": "...", "userref": "..." }, ... ] }
+    ?stream=0 returns the old {"results": [...]} body (input order).
+    Outside business hours items are accepted as "scheduled" for the next window.
     """
-    results = []
-    for item in payload.get("items", []):
-        try:
-            r = await send(item, force=force)
-            results.append({"to": item["to"], "ok": True, "id": r["id"]})
-        except HTTPException as e:
-            results.append({"to": item.get("to"), "ok": False, "error": e.detail})
-        except Exception as e:
-            results.append({"to": item.get("to"), "ok": False, "error": str(e)})
-    return {"results": results}
+    items = payload.get("items", [])
+
+    hold = _hold_until(force)
+    early: list[dict] = []
+    todo: list[tuple[int, dict]] = []
+    seen: set[str] = set()
+    refs: set[str] = set()
+    for i, item in enumerate(items):
+        ref = item.get("userref")
+        if ref and ref in refs:
+            early.append({"index": i, "to": item.get("to"), "ok": False, "error": f"Duplicate userref {ref}"})
+        elif item.get("to") and item["to"] in seen:
+            # the throttle would reject the second one anyway
+            early.append({"index": i, "to": item.get("to"), "ok": False, "error": "Per-person throttle"})
+        else:
+            seen.add(item.get("to"))
+            if ref:
+                refs.add(ref)
+            todo.append((i, item))
+
+    sem = asyncio.Semaphore(max(1, SEND_BATCH_CONCURRENCY))
+
+    async def _run(chunk):
+        async with sem:
+            return await asyncio.to_thread(_queue_batch_chunk, chunk, hold)
+
+    chunk_size = max(1, SEND_BATCH_CHUNK)
+    tasks = [asyncio.create_task(_run(todo[k:k + chunk_size])) for k in range(0, len(todo), chunk_size)]
+
+    # chunks keep queuing even if the client stops reading the stream
+    async def _results():
+        if early:
+            yield early
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+            outbox.wake()
+
+    if not stream:
+        out: list[dict] = []
+        async for part in _results():
+            out.extend(part)
+        out.sort(key=lambda r: r["index"])
+        return {"results": [{k: v for k, v in r.items() if k != "index"} for r in out]}
+
+    async def _ndjson():
+        ok = failed = 0
+        async for part in _results():
+            ok += sum(1 for r in part if r["ok"])
+            failed += sum(1 for r in part if not r["ok"])
+            yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in part)
+        yield json.dumps({"done": True, "total": len(items), "ok": ok, "failed": failed}) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
 
 
 @app.get("/health")
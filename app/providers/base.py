@@ -13,15 +13,38 @@ class SmsProvider:
         print(f"[DRY_RUN SEND] to={to} userref={userref} body={body!r} -> id={fake_id}")
         return fake_id
 
+    async def send_many(self, items: list[dict]) -> list[dict]:
+        """
+        Bulk send. items: [{"to", "text", "userref"?}, ...]
+        Returns one result per item, in order:
+          {"to", "userref", "provider_id", "ok", "error"?}
+        Providers with a native bulk API override this; the default loops send().
+        """
+        out = []
+        for it in items:
+            pid = await self.send(it["to"], it["text"], userref=it.get("userref"))
+            out.append({"to": it["to"], "userref": it.get("userref"), "provider_id": pid, "ok": bool(pid)})
+        return out
+
     def parse_dlr(self, payload: dict, headers: dict) -> dict:
-        # normalize a fake DLR shape
+        # normalize a fake DLR shape; also takes an Infobip-style result
+        # ({"messageId", "to", "status": {"groupName", "name"}, "callbackData"})
+        status = payload.get("status", "DELIVERED")
+        if isinstance(status, dict):
+            status = status.get("groupName") or status.get("name") or ""
         return {
-            "provider_id": str(payload.get("id", "dev-dlr")),
-            "msisdn": str(payload.get("msisdn", "")),
-            "status": payload.get("status", "DELIVERED").upper(),
-            "userref": payload.get("userref")
+            "provider_id": str(payload.get("messageId") or payload.get("id") or "dev-dlr"),
+            "msisdn": str(payload.get("msisdn") or payload.get("to") or ""),
+            "status": str(status or "").upper(),
+            "userref": payload.get("userref") or payload.get("callbackData")
         }
 
+    def parse_dlr_batch(self, payload: dict, headers: dict) -> list[dict]:
+        # providers that batch reports override this
+        if isinstance(payload.get("results"), list):
+            return [self.parse_dlr(r, headers) for r in payload["results"]]
+        return [self.parse_dlr(payload, headers)]
+
     def parse_mo(self, payload: dict, headers: dict) -> dict:
         # normalize a fake inbound shape
         return {
@@ -29,3 +52,7 @@ class SmsProvider:
             "to": str(payload.get("receiver") or payload.get("to") or ""),
             "text": payload.get("message") or payload.get("text") or ""
         }
+
+    def parse_mo_batch(self, payload: dict, headers: dict) -> list[dict]:
+        # providers that batch inbound webhooks override this
+        return [self.parse_mo(payload, headers)]
@@ -1,30 +1,34 @@
 import os
 import json
 import time
-import logging
+import uuid
 import asyncio
-from typing import Optional, Dict, Any, List
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
+
+import httpx
 
-import requests
+from app.providers import transport
+from app.util import metrics
 
 # --------------------------------------------------------------------
-# Config (read at instantiation to allow env changes on container restarts)
+# Config (module-level helpers read env at import; the provider class
+# reads it at instantiation to allow env changes on container restarts)
 # --------------------------------------------------------------------
-TIMEOUT = (5, 15)  # connect, read
-log = logging.getLogger("infobip")
-
-
-
-import os, json, logging, time
-from typing import Optional, Dict, Any, List, Tuple
-import requests
-
-TIMEOUT = (5, 15)  # connect, read
-
 API_BASE = os.getenv("INFOBIP_API_BASE", "").rstrip("/")
 API_KEY  = os.getenv("INFOBIP_API_KEY", "")
 SENDER   = os.getenv("INFOBIP_SENDER", "")
 
+# Bulk sends: destinations per /sms/2/text/advanced request, requests in flight
+BULK_MAX_DESTINATIONS = int(os.getenv("INFOBIP_BULK_MAX_DESTINATIONS", "1000"))
+BULK_CONCURRENCY = int(os.getenv("INFOBIP_BULK_CONCURRENCY", "4"))
+# Infobip status groups that mean the message will not go out
+_REJECTED_GROUPS = {"REJECTED", "UNDELIVERABLE", "EXPIRED"}
+# transport errors raised before the request reached Infobip: safe to send again.
+# Anything else (read/write timeout, dropped connection) may have been accepted.
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 log = logging.getLogger("infobip")
 
 def is_enabled() -> bool:
@@ -37,50 +41,6 @@ def _headers() -> Dict[str, str]:
         "Accept": "application/json",
     }
 
-def send_text(to: str, text: str) -> Dict[str, Any]:
-    if not is_enabled():
-        return {"ok": False, "provider_id": None, "raw": {"reason": "disabled"}}
-
-    url = f"{API_BASE}/sms/2/text/advanced"
-    payload = {
-        "messages": [{
-            "from": SENDER,
-            "destinations": [{"to": str(to)}],
-            "text": text
-        }]
-    }
-    r = requests.post(url, headers=_headers(), data=json.dumps(payload), timeout=TIMEOUT)
-    try:
-        data = r.json()
-    except Exception:
-        data = {"_raw": r.text}
-
-    ok = r.status_code in (200, 201)
-    provider_id = None
-    try:
-        msgs = data.get("messages") or data.get("results") or []
-        if msgs and isinstance(msgs, list):
-            provider_id = msgs[0].get("messageId") or msgs[0].get("messageIdString")
-    except Exception:
-        pass
-
-    if not ok:
-        log.error("Infobip send failed %s %s", r.status_code, data)
-
-    return {"ok": ok, "provider_id": provider_id, "raw": data}
-
-def parse_inbound(payload: Dict[str, Any]) -> List[Dict[str, str]]:
-    results = payload.get("results") or payload.get("messages") or []
-    out = []
-    for r in results:
-        out.append({
-            "from": str(r.get("from") or r.get("sender") or ""),
-            "to": str(r.get("to") or r.get("destination") or ""),
-            "text": (r.get("message") or r.get("text") or "")[:1000],
-            "provider_id": str(r.get("messageId") or r.get("messageIdString") or ""),
-        })
-    return out
-
 # -----------------
 # PULL INBOUND API
 # -----------------
@@ -95,7 +55,34 @@ def fetch_inbound(limit: int = 100) -> Tuple[List[Dict[str,str]], Dict[str, Any]
 
     url = f"{API_BASE}/messages-api/1/inbound"
     params = {"channel": "SMS", "limit": min(max(limit, 1), 1000)}
-    r = requests.get(url, headers=_headers(), params=params, timeout=TIMEOUT)
+    r = transport.get_sync_client().get(url, headers=_headers(), params=params)
+    try:
+        data = r.json()
+    except Exception:
+        data = {"_raw": r.text, "_status": r.status_code}
+
+    if r.status_code != 200:
+        log.error("Infobip inbound fetch failed %s %s", r.status_code, data)
+        return ([], data)
+
+    return (_normalize_inbound(data), data)
+
+async def fetch_inbound_async(limit: int = 100, client: Optional[httpx.AsyncClient] = None) -> Tuple[List[Dict[str,str]], Dict[str, Any]]:
+    """
+    Non-blocking fetch_inbound() on the shared pooled transport.
+    Raises on transport errors so the caller can back off.
+    """
+    if not API_BASE or not API_KEY:
+        return ([], {"error": "missing-config"})
+
+    url = f"{API_BASE}/messages-api/1/inbound"
+    params = {"channel": "SMS", "limit": min(max(limit, 1), 1000)}
+    try:
+        r = await (client or transport.get_client()).get(url, headers=_headers(), params=params)
+    except Exception:
+        metrics.PROVIDER_REQUESTS.inc("infobip", "inbound", "error")
+        raise
+    metrics.PROVIDER_REQUESTS.inc("infobip", "inbound", str(r.status_code))
     try:
         data = r.json()
     except Exception:
@@ -105,6 +92,9 @@ def fetch_inbound(limit: int = 100) -> Tuple[List[Dict[str,str]], Dict[str, Any]
         log.error("Infobip inbound fetch failed %s %s", r.status_code, data)
         return ([], data)
 
+    return (_normalize_inbound(data), data)
+
+def _normalize_inbound(data: Dict[str, Any]) -> List[Dict[str, str]]:
     # Example response: {"results":[{...}], "messageCount": 1, "pendingMessageCount": 0}
     normalized = []
     for it in data.get("results", []):
@@ -113,8 +103,18 @@ def fetch_inbound(limit: int = 100) -> Tuple[List[Dict[str,str]], Dict[str, Any]
             "to": str(it.get("destination") or it.get("to") or ""),
             "text": (it.get("message") or it.get("text") or "")[:1000],
             "provider_id": str(it.get("messageId") or ""),
+            "received_at": _epoch(it.get("receivedAt")),
         })
-    return (normalized, data)
+    return normalized
+
+def _epoch(ts: Any) -> Optional[float]:
+    """Infobip timestamps ("2024-05-02T10:15:30.123+0000") → epoch seconds."""
+    if not ts:
+        return None
+    try:
+        return datetime.strptime(str(ts), "%Y-%m-%dT%H:%M:%S.%f%z").timestamp()
+    except ValueError:
+        return None
 
 # --------------------------------------------------------------------
 # Provider class
@@ -122,15 +122,18 @@ def fetch_inbound(limit: int = 100) -> Tuple[List[Dict[str,str]], Dict[str, Any]
 class InfobipProvider:
     """
     Minimal async-capable provider for Infobip:
-      - send(): async wrapper over requests via thread offload
+      - send(): async POST on the shared pooled transport (keep-alive, HTTP/2)
       - parse_mo(): normalizes both our CLI test payloads and Infobip webhooks
       - is_enabled(): checks presence of base/key/sender
+    env_prefix selects the account: "INFOBIP" reads INFOBIP_API_BASE/_API_KEY/
+    _SENDER, "INFOBIP_B" reads INFOBIP_B_API_BASE/... (a second route).
     """
 
-    def __init__(self, dry_run: bool = False):
-        self.api_base = (os.getenv("INFOBIP_API_BASE", "") or os.getenv("INFOBIP_BASE", "")).rstrip("/")
-        self.api_key = os.getenv("INFOBIP_API_KEY", "")
-        self.sender  = os.getenv("INFOBIP_SENDER", "")
+    def __init__(self, dry_run: bool = False, env_prefix: str = "INFOBIP"):
+        self.name = env_prefix.lower()
+        self.api_base = (os.getenv(f"{env_prefix}_API_BASE", "") or os.getenv(f"{env_prefix}_BASE", "")).rstrip("/")
+        self.api_key = os.getenv(f"{env_prefix}_API_KEY", "")
+        self.sender  = os.getenv(f"{env_prefix}_SENDER", "")
         self.dry_run = dry_run
 
     def is_enabled(self) -> bool:
@@ -142,6 +145,13 @@ class InfobipProvider:
     def _auth_header(key: str) -> str:
         return key if key.startswith("App ") else f"App {key}"
 
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": self._auth_header(self.api_key),
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+        }
+
     # ---------- outbound ----------
     async def send(self, to: str, text: str, userref: Optional[str] = None) -> str:
         """
@@ -161,17 +171,13 @@ class InfobipProvider:
                 "text": text
             }]
         }
-        headers = {
-            "Authorization": self._auth_header(self.api_key),
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        }
-
-        def _post():
-            return requests.post(url, headers=headers, data=json.dumps(payload), timeout=TIMEOUT)
-
+        t0 = time.perf_counter()
         try:
-            resp = await asyncio.to_thread(_post)
+            try:
+                resp = await transport.get_client().post(url, headers=self._headers(), content=json.dumps(payload))
+            finally:
+                metrics.PROVIDER_SECONDS.observe(time.perf_counter() - t0, self.name, "send")
+            metrics.PROVIDER_REQUESTS.inc(self.name, "send", str(resp.status_code))
             try:
                 data = resp.json()
             except Exception:
@@ -188,45 +194,204 @@ class InfobipProvider:
                 provider_id = msgs[0].get("messageId") or msgs[0].get("messageIdString")
             return provider_id or dev_id
         except Exception as e:
+            metrics.PROVIDER_REQUESTS.inc(self.name, "send", "error")
             log.exception("Infobip send error: %s", e)
             return dev_id
 
+    async def send_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Bulk send over /sms/2/text/advanced.
+          - identical texts are grouped into one message with many destinations
+          - destinations are chunked into requests of BULK_MAX_DESTINATIONS
+          - each destination carries our own messageId (the userref, else a
+            random id), so its DLRs match even if the response is lost
+        Returns one result per item, in input order:
+          {"to", "userref", "provider_id", "ok", "status"?, "error"?, "retryable"?, "unknown"?}
+        `retryable` marks failures where Infobip did not take the request
+        (connect errors, 5xx, 429). A timeout after the request went out is
+        `unknown`, not retryable: provider_id is still set, and the DLR
+        (keyed on it) tells whether it went out, instead of a second SMS.
+        """
+        results: List[Dict[str, Any]] = [
+            {"to": str(it["to"]), "userref": it.get("userref"), "provider_id": None, "ok": False}
+            for it in items
+        ]
+        message_ids = [it.get("userref") or uuid.uuid4().hex for it in items]
+        if not items:
+            return results
+
+        if self.dry_run or not self.is_enabled():
+            base = int(time.time() * 1000)
+            for i, (it, r) in enumerate(zip(items, results)):
+                log.info("[DRY_RUN SEND] to=%s userref=%s body=%r", it["to"], it.get("userref"), it["text"])
+                r.update(provider_id=f"dev-{base}-{i}", ok=True)
+            return results
+
+        # text → item indexes, first-seen order
+        groups: Dict[str, List[int]] = {}
+        for i, it in enumerate(items):
+            groups.setdefault(it["text"], []).append(i)
+
+        # pack groups into provider-sized requests; a big group may span several
+        chunks: List[List[Tuple[str, List[int]]]] = [[]]
+        room = max(1, BULK_MAX_DESTINATIONS)
+        for text, idxs in groups.items():
+            while idxs:
+                take, idxs = idxs[:room], idxs[room:]
+                chunks[-1].append((text, take))
+                room -= len(take)
+                if room == 0:
+                    chunks.append([])
+                    room = max(1, BULK_MAX_DESTINATIONS)
+        chunks = [c for c in chunks if c]
+
+        sem = asyncio.Semaphore(max(1, BULK_CONCURRENCY))
+
+        async def _post_chunk(chunk: List[Tuple[str, List[int]]]):
+            order = [i for _, idxs in chunk for i in idxs]  # destination order in the request
+            payload = {"messages": [
+                {"from": self.sender, "text": text,
+                 "destinations": [{"to": results[i]["to"], "messageId": message_ids[i]} for i in idxs]}
+                for text, idxs in chunk
+            ]}
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    resp = await transport.get_client().post(
+                        f"{self.api_base}/sms/2/text/advanced", headers=self._headers(), content=json.dumps(payload)
+                    )
+                    metrics.PROVIDER_SECONDS.observe(time.perf_counter() - t0, self.name, "bulk")
+                    metrics.PROVIDER_REQUESTS.inc(self.name, "bulk", str(resp.status_code))
+                    try:
+                        data = resp.json()
+                    except Exception:
+                        data = {"_raw": resp.text}
+                except Exception as e:
+                    metrics.PROVIDER_SECONDS.observe(time.perf_counter() - t0, self.name, "bulk")
+                    metrics.PROVIDER_REQUESTS.inc(self.name, "bulk", "error")
+                    if isinstance(e, _NOT_SENT):
+                        log.warning("Infobip bulk send not delivered to the API: %r", e)
+                        for i in order:
+                            results[i].update(error=str(e) or type(e).__name__, retryable=True)
+                    else:
+                        log.exception("Infobip bulk send outcome unknown: %r", e)
+                        for i in order:
+                            results[i].update(provider_id=message_ids[i], retryable=False, unknown=True,
+                                              error=f"outcome unknown: {type(e).__name__}")
+                    return
+
+            if resp.status_code not in (200, 201):
+                log.error("Infobip bulk send failed status=%s data=%s", resp.status_code, data)
+                retry = resp.status_code == 429 or resp.status_code >= 500
+                for i in order:
+                    results[i].update(error=f"http {resp.status_code}", retryable=retry)
+                return
+            self._map_bulk_response(order, data.get("messages") or [], results)
+
+        await asyncio.gather(*(_post_chunk(c) for c in chunks))
+        ok = sum(1 for r in results if r["ok"])
+        metrics.PROVIDER_MESSAGES.inc(self.name, "ok", amount=ok)
+        metrics.PROVIDER_MESSAGES.inc(self.name, "failed", amount=len(results) - ok)
+        return results
+
+    @staticmethod
+    def _map_bulk_response(order: List[int], msgs: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> None:
+        """
+        Infobip answers one entry per destination in request order; match by
+        position, and fall back to matching on `to` if the shapes disagree.
+        """
+        def _digits(x: Any) -> str:
+            return "".join(ch for ch in str(x or "") if ch.isdigit())
+
+        by_pos = len(msgs) == len(order) and all(
+            _digits(m.get("to")) == _digits(results[i]["to"]) for m, i in zip(msgs, order)
+        )
+        if by_pos:
+            pairs = list(zip(order, msgs))
+        else:
+            pool: Dict[str, List[Dict[str, Any]]] = {}
+            for m in msgs:
+                pool.setdefault(_digits(m.get("to")), []).append(m)
+            pairs = []
+            for i in order:
+                same_to = pool.get(_digits(results[i]["to"]))
+                pairs.append((i, same_to.pop(0) if same_to else None))
+
+        for i, m in pairs:
+            r = results[i]
+            if not m:
+                r["error"] = "missing in provider response"
+                continue
+            group = ((m.get("status") or {}).get("groupName") or "").upper()
+            r["provider_id"] = m.get("messageId") or m.get("messageIdString")
+            r["status"] = group or None
+            r["ok"] = bool(r["provider_id"]) and group not in _REJECTED_GROUPS
+            if not r["ok"]:
+                r["error"] = (m.get("status") or {}).get("description") or group or "rejected"
+
+    # ---------- delivery reports ----------
+    def parse_dlr(self, payload: Dict[str, Any], headers: Dict[str, Any]) -> Dict[str, Any]:
+        batch = self.parse_dlr_batch(payload, headers)
+        return batch[0] if batch else {"provider_id": "", "msisdn": "", "status": "", "userref": None}
+
+    def parse_dlr_batch(self, payload: Dict[str, Any], headers: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Infobip pushes {"results": [{"messageId", "to", "status": {"groupName", "name"}, "callbackData"}, ...]}.
+        Returns one {"provider_id", "msisdn", "status", "userref"} per result.
+        """
+        out = []
+        for r in payload.get("results") or []:
+            st = r.get("status") or {}
+            out.append({
+                "provider_id": str(r.get("messageId") or ""),
+                "msisdn": str(r.get("to") or ""),
+                "status": (st.get("groupName") or st.get("name") or "").upper(),
+                "userref": r.get("callbackData"),
+            })
+        return out
+
     # ---------- inbound ----------
     def parse_mo(self, payload: Dict[str, Any], headers: Dict[str, Any]) -> Dict[str, str]:
         """
         Normalize inbound into: {"from": "...", "to": "...", "text": "...", "provider_id": "..."}
+        First message only; webhooks can carry several, see parse_mo_batch().
+        """
+        return self.parse_mo_batch(payload, headers)[0]
+
+    def parse_mo_batch(self, payload: Dict[str, Any], headers: Dict[str, Any]) -> List[Dict[str, str]]:
+        """
+        Every inbound message in the payload, normalized like parse_mo().
         Supports:
           - Our CLI test: {"msisdn":"...", "message":"..."}
-          - Infobip webhook: {"results":[{"from":"...","to":"...","text":"...","messageId":"..."}]}
+          - Infobip webhook: {"results":[{"from":"...","to":"...","text":"...","messageId":"..."}, ...]}
           - Also tolerates {"messages":[...]} variant from some docs.
         """
         # CLI simulator path
         if "msisdn" in payload and "message" in payload:
-            return {
+            return [{
                 "from": str(payload.get("msisdn") or ""),
                 "to": str(payload.get("to") or ""),
                 "text": (payload.get("message") or "")[:1000],
                 "provider_id": "",
-            }
+            }]
 
         # Infobip webhook path
         results = payload.get("results") or payload.get("messages") or []
         if isinstance(results, list) and results:
-            r = results[0]
-            return {
+            return [{
                 "from": str(r.get("from") or r.get("sender") or ""),
                 "to": str(r.get("to") or r.get("destination") or ""),
                 "text": (r.get("message") or r.get("text") or "")[:1000],
                 "provider_id": str(r.get("messageId") or r.get("messageIdString") or ""),
-            }
+            } for r in results]
 
         # Fallback: best-effort
-        return {
+        return [{
             "from": str(payload.get("from") or ""),
             "to": str(payload.get("to") or ""),
             "text": (payload.get("text") or payload.get("message") or "")[:1000],
             "provider_id": str(payload.get("messageId") or ""),
-        }
+        }]
 
 # --------------------------------------------------------------------
 # Backward-compatible module-level helpers (used by older code)
@@ -243,22 +408,32 @@ def _provider() -> InfobipProvider:
 
 def send_text(to: str, text: str) -> Dict[str, Any]:
     """
-    Synchronous-ish façade for legacy callers; wraps async send().
+    Synchronous façade for legacy callers (no event loop needed); uses the
+    pooled sync client instead of spinning up a loop per message.
     Returns {ok: bool, provider_id: str|None, raw: dict} for compatibility.
     """
     prov = _provider()
-
-    async def _run():
-        pid = await prov.send(to, text)
-        return pid
-
+    if prov.dry_run or not prov.is_enabled():
+        log.info("[DRY_RUN SEND] to=%s body=%r", to, text)
+        return {"ok": True, "provider_id": f"dev-{int(time.time() * 1000)}", "raw": {}}
+
+    payload = {"messages": [{"from": prov.sender, "destinations": [{"to": str(to)}], "text": text}]}
+    r = transport.get_sync_client().post(
+        f"{prov.api_base}/sms/2/text/advanced", headers=prov._headers(), content=json.dumps(payload)
+    )
     try:
-        pid = asyncio.run(_run())
-    except RuntimeError:
-        # Already in event loop (FastAPI); delegate to thread
-        pid = asyncio.get_event_loop().run_until_complete(_run())
+        data = r.json()
+    except Exception:
+        data = {"_raw": r.text}
 
-    return {"ok": bool(pid), "provider_id": pid, "raw": {}}
+    ok = r.status_code in (200, 201)
+    provider_id = None
+    msgs = data.get("messages") or data.get("results") or []
+    if ok and isinstance(msgs, list) and msgs:
+        provider_id = msgs[0].get("messageId") or msgs[0].get("messageIdString")
+    if not ok:
+        log.error("Infobip send failed %s %s", r.status_code, data)
+    return {"ok": ok, "provider_id": provider_id, "raw": data}
 
 def parse_inbound(payload: Dict[str, Any]) -> List[Dict[str, str]]:
     """Legacy shape → list of messages."""
@@ -0,0 +1,222 @@
+# app/providers/routing.py
+"""
+Send through several SMS providers, routed by observed health.
+
+RoutingProvider wraps SmsProvider-like objects (send_many / parse_*) and
+keeps per-route EWMAs of send latency and success ratio:
+  - each send_many() goes to the healthiest route first (lowest
+    latency / success); retryable failures fail over to the next route
+    within the same call, so the outbox only backs off when every route
+    failed
+  - a route whose success EWMA drops below ROUTING_MIN_SUCCESS is parked
+    for ROUTING_COOLDOWN_SECONDS; after that its next call is a probe:
+    if it succeeds the route is back in rotation (success reset to at
+    least the threshold), if it fails the route is parked again
+  - ROUTING_HEDGE_MS > 0 hedges: if the first route has not answered
+    within the budget, the same batch is also sent through the next route
+    and the first complete answer wins. Off by default: the slower request
+    is cancelled but may still deliver, i.e. a hedged SMS can arrive twice.
+Inbound parsing (MO/DLR webhooks) is delegated to the first route.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+log = logging.getLogger("routing")
+
+ROUTING_EWMA_ALPHA = float(os.getenv("ROUTING_EWMA_ALPHA", "0.2"))
+ROUTING_MIN_SUCCESS = float(os.getenv("ROUTING_MIN_SUCCESS", "0.5"))
+ROUTING_COOLDOWN_S = float(os.getenv("ROUTING_COOLDOWN_SECONDS", "30"))
+ROUTING_HEDGE_MS = float(os.getenv("ROUTING_HEDGE_MS", "0"))  # 0 = no hedging
+
+
+def _failed(r: Dict[str, Any]) -> bool:
+    """Transport-level failure worth another route (not a per-number rejection)."""
+    return not r.get("ok") and bool(r.get("retryable"))
+
+
+class RouteHealth:
+    """EWMA latency / success of one route, plus parking after a bad streak."""
+
+    def __init__(self, name: str, provider: Any, alpha: float = ROUTING_EWMA_ALPHA):
+        self.name = name
+        self.provider = provider
+        self.alpha = alpha
+        self.latency_ms: Optional[float] = None
+        self.success = 1.0
+        self.down_until = 0.0
+        self.calls = 0
+        self.sent = 0
+        self.failed = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def score(self) -> float:
+        # expected latency per successful send; unmeasured routes go first
+        return (self.latency_ms or 0.0) / max(self.success, 0.05)
+
+    def _ewma(self, old: Optional[float], new: float) -> float:
+        return new if old is None else old + self.alpha * (new - old)
+
+    def observe(self, results: Sequence[Dict[str, Any]], latency_ms: float) -> None:
+        now = time.monotonic()
+        probe = bool(self.down_until) and self.available(now)
+        self.calls += 1
+        bad = sum(1 for r in results if _failed(r))
+        self.sent += sum(1 for r in results if r.get("ok"))
+        self.failed += bad
+        self.latency_ms = self._ewma(self.latency_ms, latency_ms)
+        if results:
+            self.success = self._ewma(self.success, 1 - bad / len(results))
+        if probe and results:
+            # first call after the cooldown: one good answer is enough to come back,
+            # the EWMA alone would need several and re-park the route meanwhile
+            self.down_until = 0.0
+            if 1 - bad / len(results) >= ROUTING_MIN_SUCCESS:
+                self.success = max(self.success, ROUTING_MIN_SUCCESS)
+                log.info("Route %s probe succeeded; back in rotation", self.name)
+                return
+        if self.success < ROUTING_MIN_SUCCESS and self.available(now):
+            self.down_until = time.monotonic() + ROUTING_COOLDOWN_S
+            log.warning("Route %s degraded (success=%.2f, latency=%.0fms); parked for %.0fs",
+                        self.name, self.success, self.latency_ms, ROUTING_COOLDOWN_S)
+
+    def observe_timeout(self, latency_ms: float) -> None:
+        """A hedged call that lost and was cancelled: count its latency only."""
+        self.latency_ms = self._ewma(self.latency_ms, latency_ms)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 1),
+            "success": round(self.success, 3),
+            "available": self.available(now),
+            "parked_s": round(max(0.0, self.down_until - now), 1),
+            "calls": self.calls, "sent": self.sent, "failed": self.failed,
+            "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+        }
+
+
+class RoutingProvider:
+    """
+    Provider facade over several routes; see the module docstring.
+    routes: [(name, provider), ...] in preference order (ties keep it).
+    """
+
+    def __init__(self, routes: Sequence[tuple], hedge_ms: float = ROUTING_HEDGE_MS):
+        if not routes:
+            raise ValueError("RoutingProvider needs at least one route")
+        self.routes = [RouteHealth(name, p) for name, p in routes]
+        self.hedge_s = max(0.0, hedge_ms / 1000)
+        self.dry_run = all(getattr(p, "dry_run", False) for _, p in routes)
+
+    @property
+    def primary(self) -> Any:
+        return self.routes[0].provider
+
+    def ranked(self, exclude: Sequence[str] = ()) -> List[RouteHealth]:
+        """Routes to try, best first; parked ones only after every live one."""
+        now = time.monotonic()
+        cand = [h for h in self.routes if h.name not in exclude]
+        return sorted(cand, key=lambda h: (not h.available(now), h.score()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {h.name: h.stats() for h in self.routes}
+
+    # ---------- outbound ----------
+    async def _call(self, h: RouteHealth, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        t0 = time.perf_counter()
+        try:
+            res = await h.provider.send_many(items)
+        except asyncio.CancelledError:
+            h.observe_timeout((time.perf_counter() - t0) * 1000)
+            raise
+        except Exception as e:
+            log.exception("Route %s send_many raised", h.name)
+            res = [{"to": it["to"], "userref": it.get("userref"), "provider_id": None, "ok": False,
+                    "error": str(e), "retryable": True} for it in items]
+        h.observe(res, (time.perf_counter() - t0) * 1000)
+        return [{**r, "route": h.name} for r in res]
+
+    async def _hedged(self, first: RouteHealth, backup: Optional[RouteHealth],
+                      items: List[Dict[str, Any]], used: List[str]) -> List[Dict[str, Any]]:
+        used.append(first.name)
+        if not self.hedge_s or backup is None:
+            return await self._call(first, items)
+
+        a = asyncio.ensure_future(self._call(first, items))
+        try:
+            done, _ = await asyncio.wait({a}, timeout=self.hedge_s)
+        except asyncio.CancelledError:
+            a.cancel()
+            raise
+        if done:
+            return a.result()
+
+        backup.hedges += 1
+        used.append(backup.name)
+        b = asyncio.ensure_future(self._call(backup, items))
+        try:
+            done, _ = await asyncio.wait({a, b}, return_when=asyncio.FIRST_COMPLETED)
+            win, other = (a, b) if a in done else (b, a)
+            res = win.result()
+            if any(_failed(r) for r in res):
+                # the winner failed some items: let the other answer and keep each item's better result
+                more = await other
+                res = [y if _failed(x) and not _failed(y) else x for x, y in zip(res, more)]
+            else:
+                other.cancel()
+        except asyncio.CancelledError:
+            a.cancel()
+            b.cancel()
+            raise
+        if win is b:
+            backup.hedge_wins += 1
+        return res
+
+    async def send_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Same contract as SmsProvider.send_many(); each result also carries
+        "route". Items that failed retryably are re-sent through the next
+        route; whatever failed on every route keeps its last error.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        todo = list(range(len(items)))
+        used: List[str] = []
+        while todo:
+            order = self.ranked(exclude=used)
+            if not order:
+                break
+            backup = order[1] if len(order) > 1 else None
+            res = await self._hedged(order[0], backup, [items[i] for i in todo], used)
+            retry = []
+            for i, r in zip(todo, res):
+                results[i] = r
+                if _failed(r):
+                    retry.append(i)
+            if retry and len(order) > 1:
+                log.info("Failing over %d of %d sends from %s", len(retry), len(todo), order[0].name)
+            todo = retry
+        return results  # type: ignore[return-value]
+
+    async def send(self, to: str, body: str, userref: Optional[str] = None) -> str:
+        res = await self.send_many([{"to": to, "text": body, "userref": userref}])
+        return res[0].get("provider_id") or ""
+
+    # ---------- inbound (webhooks are configured against the primary) ----------
+    def parse_dlr(self, payload: dict, headers: dict) -> dict:
+        return self.primary.parse_dlr(payload, headers)
+
+    def parse_dlr_batch(self, payload: dict, headers: dict) -> List[dict]:
+        return self.primary.parse_dlr_batch(payload, headers)
+
+    def parse_mo(self, payload: dict, headers: dict) -> dict:
+        return self.primary.parse_mo(payload, headers)
+
+    def parse_mo_batch(self, payload: dict, headers: dict) -> List[dict]:
+        return self.primary.parse_mo_batch(payload, headers)
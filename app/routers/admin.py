@@ -1,19 +1,21 @@
 # app/routers/admin.py
+# Excel parsing and matching (pandas, openpyxl, rapidfuzz) are imported on
+# first use: the API process only pays for them once someone opens the admin.
 from pathlib import Path
-import io
-import pandas as pd
+import json
+import asyncio
+from typing import TYPE_CHECKING
 from fastapi import APIRouter, Request, UploadFile, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-from app.services.storage import (
-    save_upload, latest_excel_path, load_sheets,
-    save_matches_df, load_matches
-)
-from app.services.matcher import build_matches
-from app.senders.infobip_client import send_sms
+from app.services import campaigns, schedule, outbox
+from app.storage.db import SessionLocal
 from app.util.logger import get_logger
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 log = get_logger("admin")
 router = APIRouter()
 
@@ -23,6 +25,7 @@ templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
 
 @router.get("/admin", response_class=HTMLResponse)
 def admin_home(request: Request):
+    from app.services.storage import latest_excel_path, load_matches
     last = latest_excel_path()
     have_matches = len(load_matches()) > 0
     return templates.TemplateResponse(
@@ -38,33 +41,38 @@ def admin_home(request: Request):
 
 @router.post("/admin/upload")
 async def admin_upload(file: UploadFile):
+    from app.services.storage import save_upload
     data = await file.read()
     path = save_upload(data, file.filename)
     log.info({"event": "upload_saved", "path": path})
     return RedirectResponse(url="/admin/parse", status_code=303)
 
+def _annotate_contacts(matches_df: "pd.DataFrame") -> "pd.DataFrame":
+    """Mark people who are already contacts (DNC, open thread): one query per upload."""
+    if matches_df.empty:
+        return matches_df
+    db = SessionLocal()
+    try:
+        state = outbox.contact_state(db, matches_df["Tel. nr"].tolist())
+    finally:
+        db.close()
+    phones = matches_df["Tel. nr"]
+    return matches_df.assign(
+        dnc=phones.map(lambda p: state.get(p, {}).get("dnc", False)),
+        thread_id=phones.map(lambda p: state.get(p, {}).get("thread_id") or ""),
+    )
+
 @router.get("/admin/parse", response_class=HTMLResponse)
 def admin_parse(request: Request):
+    from app.services.storage import latest_excel_path, load_sheets, save_matches_df, load_matches
+    from app.services.matcher import build_matches
     path = latest_excel_path()
     if not path:
         return RedirectResponse(url="/admin", status_code=303)
 
-    people, projects = load_sheets(path)
-    matches_df = build_matches(people, projects)
-
-    # safe save (dedup columns etc.) – see storage.py hardening
-    save_matches_df(matches_df)
-
-    records = load_matches()  # already JSON-safe list[dict]
-    cities = sorted({m.get("Miestas", "") for m in records})
-    profs  = sorted({m.get("Specialybė", "") for m in records})
-
     people, projects = load_sheets(path)
 
     # log shapes + columns to help debugging
-    import json
-    from app.util.logger import get_logger
-    log = get_logger("admin-parse")
     log.info({
     "event": "parse_loaded",
     "people_rows": len(people),
@@ -73,7 +81,7 @@ def admin_parse(request: Request):
     "projects_cols": (list(map(str, projects.columns)) if projects is not None else None),
     })
 
-    matches_df = build_matches(people, projects)
+    matches_df = _annotate_contacts(build_matches(people, projects))
 
     log.info({
     "event": "matches_built",
@@ -81,6 +89,13 @@ def admin_parse(request: Request):
     "cols": list(map(str, matches_df.columns)),
     })
 
+    # safe save (dedup columns etc.) – see storage.py hardening
+    save_matches_df(matches_df)
+
+    records = load_matches()  # already JSON-safe list[dict]
+    cities = sorted({m.get("Miestas", "") for m in records})
+    profs  = sorted({m.get("Specialybė", "") for m in records})
+
 
     return templates.TemplateResponse(
         "matches.html",
@@ -96,6 +111,7 @@ def admin_parse(request: Request):
 
 @router.post("/admin/preview", response_class=HTMLResponse)
 async def admin_preview(request: Request, city: str = Form(""), prof: str = Form(""), limit: int = Form(20)):
+    from app.services.storage import load_matches
     matches = load_matches()
     filt = [
         m for m in matches
@@ -116,11 +132,13 @@ async def admin_preview(request: Request, city: str = Form(""), prof: str = Form
             "limit": limit,
             "city_sel": city,
             "prof_sel": prof,
+            "plan": schedule.plan(min(len(filt), max(0, int(limit)))),
         },
     )
 
-@router.post("/admin/send", response_class=HTMLResponse)
+@router.post("/admin/send")
 async def admin_send(request: Request, city: str = Form(""), prof: str = Form(""), limit: int = Form(20)):
+    from app.services.storage import load_matches
     matches = load_matches()
     batch = [
         m for m in matches
@@ -128,22 +146,61 @@ async def admin_send(request: Request, city: str = Form(""), prof: str = Form(""
         and (not prof or m.get("Specialybė", "") == prof)
     ][: max(0, int(limit))]
 
-    results = []
-    for m in batch:
-        to = str(m.get("Tel. nr", "")).strip()
-        text = (m.get("sms_text") or m.get("Text") or "").strip()
-        if not to or not text:
-            results.append({"match_id": m.get("match_id"), "ok": False, "err": "missing to/text"})
-            continue
-        try:
-            resp = send_sms(to, text, None)
-            results.append({"match_id": m.get("match_id"), "ok": True, "resp": resp})
-        except Exception as e:
-            results.append({"match_id": m.get("match_id"), "ok": False, "err": str(e)})
-
-    ok = sum(1 for r in results if r["ok"])
-    fail = len(results) - ok
+    db = SessionLocal()
+    try:
+        name = " / ".join(x for x in (city, prof) if x) or "All"
+        camp = campaigns.create(db, batch, name=name, city=city, prof=prof)
+        db.commit()
+        camp_id = camp.id
+    finally:
+        db.close()
+    log.info({"event": "campaign_created", "id": camp_id, "recipients": len(batch)})
+    campaigns.start(camp_id)
+    return RedirectResponse(url=f"/admin/campaigns/{camp_id}", status_code=303)
+
+@router.get("/admin/campaigns", response_class=HTMLResponse)
+def admin_campaigns(request: Request):
     return templates.TemplateResponse(
-        "send_results.html",
-        {"request": request, "results": results, "ok": ok, "fail": fail},
+        "campaigns.html",
+        {"request": request, "campaigns": campaigns.list_campaigns()},
     )
+
+@router.get("/admin/campaigns/{camp_id}", response_class=HTMLResponse)
+def admin_campaign(request: Request, camp_id: int):
+    prog = campaigns.progress(camp_id)
+    if prog is None:
+        return RedirectResponse(url="/admin/campaigns", status_code=303)
+    return templates.TemplateResponse("campaign.html", {"request": request, "c": prog})
+
+@router.get("/admin/campaigns/{camp_id}/events")
+async def admin_campaign_events(request: Request, camp_id: int):
+    """Server-sent events: one progress snapshot per second until the campaign is finished."""
+    async def _events():
+        last = None
+        while not await request.is_disconnected():
+            prog = await asyncio.to_thread(campaigns.progress, camp_id)
+            if prog is None:
+                return
+            data = json.dumps(prog, ensure_ascii=False)
+            if data != last:
+                yield f"data: {data}\n\n"
+                last = data
+            else:
+                yield ": keep-alive\n\n"
+            if prog["finished"]:
+                return
+            await asyncio.sleep(1)
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/admin/campaigns/{camp_id}/pause")
+async def admin_campaign_pause(camp_id: int):
+    n = await campaigns.pause(camp_id)
+    log.info({"event": "campaign_paused", "id": camp_id, "taken_back": n})
+    return RedirectResponse(url=f"/admin/campaigns/{camp_id}", status_code=303)
+
+@router.post("/admin/campaigns/{camp_id}/resume")
+async def admin_campaign_resume(camp_id: int):
+    await campaigns.resume(camp_id)
+    return RedirectResponse(url=f"/admin/campaigns/{camp_id}", status_code=303)
@@ -1,29 +1,25 @@
 import asyncio
 from app.util.logger import get_logger
+from app.storage.db import SessionLocal
+from app.services import outbox
 
 log = get_logger("senders.infobip")
 
-try:
-    from app.providers.infobip import InfobipProvider, is_enabled
-except Exception:
-    InfobipProvider = None
-    def is_enabled() -> bool:
-        return False
-
-async def send_sms_async(to: str, body: str, userref: str | None = None):
-    if InfobipProvider and is_enabled():
-        provider = InfobipProvider(dry_run=True)
-        return await provider.send(to, body, userref=userref)
-    else:
-        log.info("DRY RUN send_sms to=%s userref=%s len=%d", to, userref, len(body))
-        return None
-
-def send_sms(to: str, body: str, userref: str | None = None):
+def send_sms(to: str, body: str, userref: str | None = None, kind: str = "manual"):
+    """
+    Queue an SMS in the durable outbox; the worker pool sends it through the
+    app's provider (DRY_RUN applies there). Returns the outbox id.
+    """
+    db = SessionLocal()
     try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = None
-    if loop and loop.is_running():
-        asyncio.create_task(send_sms_async(to, body, userref))
-        return None
-    return asyncio.run(send_sms_async(to, body, userref))
+        item = outbox.enqueue(db, to, body, userref=userref, kind=kind)
+        db.commit()
+        log.info("queued sms to=%s userref=%s len=%d outbox_id=%s", to, userref, len(body), item.id)
+        item_id = item.id
+    finally:
+        db.close()
+    outbox.wake()
+    return item_id
+
+async def send_sms_async(to: str, body: str, userref: str | None = None, kind: str = "manual"):
+    return await asyncio.to_thread(send_sms, to, body, userref, kind)
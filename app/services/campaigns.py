@@ -0,0 +1,363 @@
+# app/services/campaigns.py
+"""
+Admin blasts as tracked, resumable campaigns.
+
+create() stores the campaign and one CampaignRecipient per targeted match.
+A runner task per running campaign feeds pending recipients into the outbox
+(campaign lane) in batches. A recipient turns 'queued' in the same
+transaction as its outbox insert, so a crash never sends twice and a
+restart simply continues with whatever is still pending. From there on the
+recipient's delivery status is its outbox row's (sending/sent/failed).
+
+The runner only feeds inside the business window, at the rate from
+services/schedule.py (spread over the rest of the window, capped at
+CAMPAIGN_TPS; leftovers roll to the next window). A recipient messaged less
+than PER_PERSON_MIN_SECONDS ago is deferred, not skipped. At most
+CAMPAIGN_MAX_AHEAD campaign rows wait in the outbox; pause() takes back
+the ones not yet claimed by a worker.
+
+Runners live in one process only: supervise() is a leader singleton
+(services/leader.py) that starts a runner for every running campaign,
+whichever worker created or resumed it; start() elsewhere is a no-op.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_
+
+from app.storage.db import SessionLocal
+from app.storage.models import Campaign, CampaignRecipient, Message, OutboxItem
+from app.services import outbox, lanes, schedule
+
+log = logging.getLogger("campaigns")
+
+CAMPAIGN_BATCH = int(os.getenv("CAMPAIGN_BATCH", "200"))
+CAMPAIGN_MAX_AHEAD = int(os.getenv("CAMPAIGN_MAX_AHEAD", "400"))
+CAMPAIGN_TICK_S = float(os.getenv("CAMPAIGN_TICK_SECONDS", "1"))
+CAMPAIGN_SYNC_S = float(os.getenv("CAMPAIGN_SYNC_SECONDS", "5"))  # leader: pick up new/resumed campaigns
+
+_tasks: Dict[int, asyncio.Task] = {}
+_supervising = False
+
+
+# ==== DB steps (sync) ====
+def create(db, matches: List[Dict[str, Any]], *, name: str = "", city: str = "", prof: str = "") -> Campaign:
+    """Campaign + recipients for `matches` (rows with "Tel. nr", "sms_text", "match_id"). Caller commits."""
+    camp = Campaign(name=name or None, filter_city=city or None, filter_prof=prof or None, status="running")
+    db.add(camp)
+    db.flush()
+
+    seen: set = set()
+    rows = []
+    for m in matches:
+        to = str(m.get("Tel. nr", "")).strip()
+        text = (m.get("sms_text") or m.get("Text") or "").strip()
+        ref = m.get("match_id")
+        r = CampaignRecipient(campaign_id=camp.id, match_id=None if ref is None else str(ref), body=text)
+        if not to or not text:
+            r.status, r.error = "skipped", "missing to/text"
+        elif to in seen:
+            # phone is unique per campaign; keep the row for the report only
+            r.status, r.error = "skipped", f"duplicate phone {to}"
+        else:
+            seen.add(to)
+            r.phone, r.status = to, "pending"
+        rows.append(r)
+    db.add_all(rows)
+    camp.total = len(rows)
+    db.flush()
+    return camp
+
+
+def _pending(db, campaign_id: int):
+    return db.query(CampaignRecipient).filter(
+        CampaignRecipient.campaign_id == campaign_id, CampaignRecipient.status == "pending"
+    )
+
+
+def pending_count(campaign_id: int) -> int:
+    db = SessionLocal()
+    try:
+        return _pending(db, campaign_id).count()
+    finally:
+        db.close()
+
+
+def feed_batch(campaign_id: int, limit: int = CAMPAIGN_BATCH) -> int:
+    """
+    Move up to `limit` due pending recipients into the outbox; returns how
+    many were handled (queued or skipped). Marks the campaign done once no
+    pending recipient is left.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        camp = db.get(Campaign, campaign_id)
+        if camp is None or camp.status != "running":
+            return 0
+        recips = (
+            _pending(db, campaign_id)
+            .filter(or_(CampaignRecipient.not_before.is_(None), CampaignRecipient.not_before <= now))
+            .order_by(CampaignRecipient.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not recips:
+            if not _pending(db, campaign_id).first():
+                camp.status, camp.finished_at = "done", now
+                db.commit()
+                log.info("Campaign %s: all recipients queued", campaign_id)
+            return 0
+
+        dnc, last_out = outbox.recipient_state(db, [r.phone for r in recips])
+        send = []
+        for r in recips:
+            last = last_out.get(r.phone)
+            if r.phone in dnc:
+                r.status, r.error = "skipped", "dnc"
+            elif last and (now - last).total_seconds() < schedule.PER_PERSON_MIN_SECONDS:
+                r.not_before = last + timedelta(seconds=schedule.PER_PERSON_MIN_SECONDS)
+            else:
+                send.append(r)
+        items = outbox.enqueue_many(
+            db,
+            [{"to": r.phone, "text": r.body, "userref": f"c{campaign_id}-{r.id}"} for r in send],
+            kind="campaign",
+        ) if send else []
+        for r, item in zip(send, items):
+            r.status, r.outbox_id = "queued", item.id
+        db.commit()
+        return sum(1 for r in recips if r.status != "pending")
+    finally:
+        db.close()
+
+
+def backlog() -> int:
+    """Campaign-lane rows still waiting in the outbox (all campaigns)."""
+    db = SessionLocal()
+    try:
+        return (
+            db.query(func.count(OutboxItem.id))
+            .filter(OutboxItem.lane == lanes.CAMPAIGN, OutboxItem.status == "queued")
+            .scalar()
+        ) or 0
+    finally:
+        db.close()
+
+
+def progress(campaign_id: int) -> Optional[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        camp = db.get(Campaign, campaign_id)
+        if camp is None:
+            return None
+        state = func.coalesce(OutboxItem.status, CampaignRecipient.status)
+        counts = dict(
+            db.query(state, func.count(CampaignRecipient.id))
+            .select_from(CampaignRecipient)
+            .outerjoin(OutboxItem, OutboxItem.id == CampaignRecipient.outbox_id)
+            .filter(CampaignRecipient.campaign_id == campaign_id)
+            .group_by(state)
+            .all()
+        )
+        # delivery of what went out: Message.status is moved on by DLRs (services/dlr.py)
+        delivery = dict(
+            db.query(Message.status, func.count(Message.id))
+            .select_from(CampaignRecipient)
+            .join(OutboxItem, OutboxItem.id == CampaignRecipient.outbox_id)
+            .join(Message, Message.id == OutboxItem.message_id)
+            .filter(CampaignRecipient.campaign_id == campaign_id, OutboxItem.status == "sent")
+            .group_by(Message.status)
+            .all()
+        )
+        out = sum(delivery.values())
+        open_ = sum(counts.get(k, 0) for k in ("pending", "queued", "sending"))
+        left = counts.get("pending", 0) + counts.get("queued", 0)
+        return {
+            "id": camp.id,
+            "name": camp.name,
+            "status": camp.status,
+            "total": camp.total or 0,
+            "counts": counts,
+            "delivery": {
+                "delivered": delivery.get("delivered", 0),
+                "undelivered": delivery.get("failed", 0),
+                "awaiting_report": delivery.get("sent", 0),
+                "delivery_rate": round(delivery.get("delivered", 0) / out, 4) if out else None,
+            },
+            "finished": camp.status == "done" and open_ == 0,
+            "schedule": schedule.plan(left) if left else None,
+            "created_at": camp.created_at.isoformat() if camp.created_at else None,
+        }
+    finally:
+        db.close()
+
+
+def list_campaigns(limit: int = 50) -> List[Campaign]:
+    db = SessionLocal()
+    try:
+        return db.query(Campaign).order_by(Campaign.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+
+def _status(campaign_id: int) -> Optional[str]:
+    db = SessionLocal()
+    try:
+        camp = db.get(Campaign, campaign_id)
+        return camp.status if camp else None
+    finally:
+        db.close()
+
+
+def _set_status(campaign_id: int, status: str) -> bool:
+    db = SessionLocal()
+    try:
+        camp = db.get(Campaign, campaign_id)
+        if camp is None:
+            return False
+        camp.status = status
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def _take_back(campaign_id: int) -> int:
+    """
+    Return this campaign's still-queued outbox rows to 'pending'. A row a
+    worker claimed meanwhile (status no longer 'queued') is left to finish.
+    """
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(CampaignRecipient, OutboxItem.message_id)
+            .join(OutboxItem, OutboxItem.id == CampaignRecipient.outbox_id)
+            .filter(CampaignRecipient.campaign_id == campaign_id, OutboxItem.status == "queued")
+            .all()
+        )
+        n = 0
+        for r, message_id in rows:
+            outbox_id = r.outbox_id
+            won = (
+                db.query(OutboxItem)
+                .filter(OutboxItem.id == outbox_id, OutboxItem.status == "queued")
+                .update({"status": "cancelled"}, synchronize_session=False)
+            )
+            if not won:
+                continue
+            r.status, r.outbox_id = "pending", None
+            db.flush()  # drop the FK reference before deleting the rows it pointed at
+            db.query(OutboxItem).filter(OutboxItem.id == outbox_id).delete(synchronize_session=False)
+            db.query(Message).filter(Message.id == message_id).delete(synchronize_session=False)
+            n += 1
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+# ==== Runners ====
+async def _run(campaign_id: int) -> None:
+    log.info("Campaign %s: runner started", campaign_id)
+    credit, last = 1.0, time.monotonic()  # first recipient goes out right away
+    try:
+        while True:
+            if await asyncio.to_thread(_status, campaign_id) != "running":
+                return
+            now = datetime.now()
+            if not schedule.is_open(now):
+                credit, last = 1.0, time.monotonic()
+                wait = (schedule.next_open(now) - now).total_seconds()
+                await asyncio.sleep(min(60.0, max(CAMPAIGN_TICK_S, wait)))  # re-check status at least every minute
+                continue
+            if await asyncio.to_thread(backlog) >= CAMPAIGN_MAX_AHEAD:
+                await asyncio.sleep(CAMPAIGN_TICK_S)
+                continue
+
+            remaining = await asyncio.to_thread(pending_count, campaign_id)
+            if not remaining:
+                await asyncio.to_thread(feed_batch, campaign_id, 1)  # marks the campaign done
+                continue
+            rate = schedule.pace_rate(remaining, now)
+            t = time.monotonic()
+            credit = min(float(CAMPAIGN_BATCH), credit + rate * (t - last))
+            last = t
+            if credit >= 1:
+                n = await asyncio.to_thread(feed_batch, campaign_id, int(credit))
+                credit -= n
+                if n:
+                    outbox.wake()
+            await asyncio.sleep(CAMPAIGN_TICK_S)
+    except Exception:
+        log.exception("Campaign %s: runner failed (resumes on restart or resume)", campaign_id)
+
+
+def start(campaign_id: int) -> None:
+    if not _supervising:
+        return  # the leader's supervise() picks it up within CAMPAIGN_SYNC_SECONDS
+    task = _tasks.get(campaign_id)
+    if task is not None and not task.done():
+        return
+    task = asyncio.create_task(_run(campaign_id))
+    _tasks[campaign_id] = task
+    task.add_done_callback(lambda t, cid=campaign_id: _tasks.pop(cid, None) if _tasks.get(cid) is t else None)
+
+
+async def pause(campaign_id: int) -> int:
+    """Stop feeding and take back rows not yet claimed. Returns how many went back to pending."""
+    await asyncio.to_thread(_set_status, campaign_id, "paused")
+    task = _tasks.get(campaign_id)
+    if task is not None:
+        # the runner exits on its next status check; wait so a batch it is
+        # committing right now is taken back too
+        await asyncio.wait([task], timeout=30)
+    else:
+        # runner in the leader process: give it a tick to see the new status
+        await asyncio.sleep(2 * CAMPAIGN_TICK_S)
+    return await asyncio.to_thread(_take_back, campaign_id)
+
+
+async def resume(campaign_id: int) -> bool:
+    ok = await asyncio.to_thread(_set_status, campaign_id, "running")
+    if ok:
+        start(campaign_id)
+    return ok
+
+
+async def resume_all() -> None:
+    """Start a runner for every 'running' campaign without one (new, resumed, or left by a restart)."""
+    def _running() -> List[int]:
+        db = SessionLocal()
+        try:
+            return [cid for cid, in db.query(Campaign.id).filter(Campaign.status == "running")]
+        finally:
+            db.close()
+
+    for cid in await asyncio.to_thread(_running):
+        start(cid)
+
+
+async def supervise() -> None:
+    """Leader singleton: keep a runner going for every running campaign; stops them all when cancelled."""
+    global _supervising
+    _supervising = True
+    try:
+        while True:
+            await resume_all()
+            await asyncio.sleep(CAMPAIGN_SYNC_S)
+    finally:
+        _supervising = False
+        await stop_all()
+
+
+async def stop_all() -> None:
+    for t in list(_tasks.values()):
+        t.cancel()
+    if _tasks:
+        await asyncio.wait(list(_tasks.values()), timeout=5)
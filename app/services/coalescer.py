@@ -0,0 +1,94 @@
+# app/services/coalescer.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger("coalescer")
+
+Prepare = Callable[[str, str], Awaitable[Any]]
+Commit = Callable[[str, Any], Awaitable[dict]]
+
+
+class InboundCoalescer:
+    """
+    Per-key debounce buffer for inbound SMS bursts ("Taip" / "domina" / "kiek moka?").
+
+    Each fragment restarts a `window_s` timer for its key. When the timer
+    expires, the buffered fragments are joined into one turn and processed in
+    two phases:
+      - prepare(key, text): the expensive, side-effect free part (LLM calls).
+        A new fragment cancels it and the whole burst is prepared again.
+        Cancelling only discards the result: an LLM call already running in
+        a worker thread completes (and is billed); prepare() should check a
+        flag between stages to skip the rest (see main._prepare_turn).
+      - commit(key, result): sends/persists; never cancelled once started.
+    Only the caller whose fragment closed the burst gets the commit result;
+    superseded callers get None.
+    """
+
+    def __init__(self, prepare: Prepare, commit: Commit, window_s: float = 1.5):
+        self.prepare = prepare
+        self.commit = commit
+        self.window_s = max(0.0, float(window_s))
+        self._buffers: Dict[str, List[str]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._committing: Dict[str, asyncio.Task] = {}
+
+    def pending(self) -> int:
+        return sum(len(b) for b in self._buffers.values())
+
+    def active(self, key: str) -> bool:
+        """A burst for `key` is buffered, preparing or committing in this process."""
+        return key in self._buffers or key in self._tasks
+
+    async def submit(self, key: str, text: str) -> Optional[dict]:
+        self._buffers.setdefault(key, []).append(text)
+
+        prev = self._tasks.get(key)
+        if prev is not None and not prev.done() and self._committing.get(key) is not prev:
+            prev.cancel()  # still waiting or preparing → fold into this burst
+        prev_commit = self._committing.get(key)
+
+        task = asyncio.create_task(self._run(key, prev_commit))
+        self._tasks[key] = task
+        try:
+            # shield: a dropped webhook connection must not cancel the turn
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                return None  # superseded by a newer fragment
+            raise
+
+    async def _run(self, key: str, prev_commit: Optional[asyncio.Task]) -> dict:
+        me = asyncio.current_task()
+        try:
+            await asyncio.sleep(self.window_s)
+            if prev_commit is not None:
+                # an earlier burst is already sending; let it finish first
+                await asyncio.shield(prev_commit)
+
+            fragments = list(self._buffers.get(key) or [])
+            if not fragments:
+                return {}
+            merged = " ".join(f for f in fragments if f)
+            if len(fragments) > 1:
+                log.info("coalesced %d fragments from %s", len(fragments), key)
+
+            result = await self.prepare(key, merged)
+
+            # point of no return: from here on this task is not cancelled
+            self._committing[key] = me
+            try:
+                out = await self.commit(key, result)
+            finally:
+                buf = self._buffers.get(key)
+                if buf is not None:
+                    del buf[:len(fragments)]
+                    if not buf:
+                        self._buffers.pop(key, None)
+                if self._committing.get(key) is me:
+                    self._committing.pop(key, None)
+            return {**(out or {}), "fragments": len(fragments)}
+        finally:
+            if self._tasks.get(key) is me:
+                self._tasks.pop(key, None)
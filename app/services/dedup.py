@@ -0,0 +1,61 @@
+# app/services/dedup.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+DEFAULT_MAX = 50_000
+DEFAULT_TTL_S = 6 * 3600.0
+
+
+class RecentIds:
+    """
+    Bounded, TTL'd LRU of recently seen keys (provider messageIds, userrefs),
+    so webhook retries and poll overlaps are dropped before touching the DB.
+    The unique indexes on messages stay the source of truth; this only
+    saves the round-trip. Thread-safe (used from to_thread workers too).
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAX, ttl_s: float = DEFAULT_TTL_S):
+        self.maxsize = max(1, maxsize)
+        self.ttl_s = ttl_s
+        self._d: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        hit = self._d.get(key)
+        if hit is None:
+            return None
+        ts, value = hit
+        if time.monotonic() - ts > self.ttl_s:
+            del self._d[key]
+            return None
+        self._d.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        self._d[key] = (time.monotonic(), value)
+        self._d.move_to_end(key)
+        while len(self._d) > self.maxsize:
+            self._d.popitem(last=False)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key: Hashable, value: Any = True) -> None:
+        with self._lock:
+            self._put(key, value)
+
+    def seen(self, key: Hashable) -> bool:
+        """Check-and-add: True if `key` was already recorded."""
+        with self._lock:
+            if self._get(key) is not None:
+                return True
+            self._put(key, True)
+            return False
+
+    def __len__(self) -> int:
+        return len(self._d)
@@ -0,0 +1,152 @@
+# app/services/dlr.py
+"""
+Delivery report ingestion.
+
+/webhooks/dlr parses a provider batch, hands the rows to DlrBatcher and
+acks. The batcher merges reports from all requests for up to
+DLR_FLUSH_MS (or DLR_BATCH_MAX rows) and applies them with one
+
+    WITH v(provider_id, status) AS (VALUES …)
+    UPDATE messages SET status = v.status FROM v
+     WHERE messages.provider_id = v.provider_id
+
+per chunk (indexed provider_id; Postgres and SQLite ≥ 3.33). Only final
+states are applied, so out-of-order reports never move a message back.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.storage.db import engine
+
+log = logging.getLogger("dlr")
+
+DLR_FLUSH_MS = int(os.getenv("DLR_FLUSH_MS", "200"))
+DLR_BATCH_MAX = int(os.getenv("DLR_BATCH_MAX", "5000"))
+DLR_RETRY_S = float(os.getenv("DLR_RETRY_SECONDS", "2"))  # wait after a failed flush
+_VALUES_CHUNK = 500  # rows per statement (2 bind params each)
+
+# provider status (Infobip groupName / name) → Message.status
+_FINAL = {
+    "DELIVERED": "delivered",
+    "DELIVERED_TO_HANDSET": "delivered",
+    "UNDELIVERABLE": "failed",
+    "UNDELIVERED": "failed",
+    "REJECTED": "failed",
+    "EXPIRED": "failed",
+    "FAILED": "failed",
+}
+
+
+def final_status(raw: Optional[str]) -> Optional[str]:
+    return _FINAL.get((raw or "").upper())
+
+
+def apply(updates: Dict[str, str]) -> int:
+    """{provider_id: status} → rows updated."""
+    items = list(updates.items())
+    matched = 0
+    with engine.begin() as conn:
+        for k in range(0, len(items), _VALUES_CHUNK):
+            part = items[k:k + _VALUES_CHUNK]
+            values = ", ".join(f"(:p{i}, :s{i})" for i in range(len(part)))
+            params: Dict[str, Any] = {}
+            for i, (pid, st) in enumerate(part):
+                params[f"p{i}"], params[f"s{i}"] = pid, st
+            res = conn.execute(
+                text(
+                    f"WITH v(provider_id, status) AS (VALUES {values}) "
+                    "UPDATE messages SET status = v.status FROM v "
+                    "WHERE messages.provider_id = v.provider_id"
+                ),
+                params,
+            )
+            n = res.rowcount
+            if n is None or n < 0:
+                # pysqlite reports -1 for statements that start with WITH
+                n = conn.execute(text("SELECT changes()")).scalar() or 0
+            matched += n
+    return matched
+
+
+class DlrBatcher:
+    """Coalesces DLRs from concurrent webhook calls into bulk UPDATEs."""
+
+    def __init__(self, flush_ms: int = DLR_FLUSH_MS, batch_max: int = DLR_BATCH_MAX):
+        self.flush_s = max(0.0, flush_ms / 1000)
+        self.batch_max = max(1, batch_max)
+        self._pending: Dict[str, str] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats: Dict[str, Any] = {
+            "received": 0, "ignored": 0, "applied": 0, "unmatched": 0,
+            "flushes": 0, "errors": 0, "last_flush_ms": None, "by_status": {},
+        }
+
+    def buffered(self) -> int:
+        return len(self._pending)
+
+    def submit(self, reports: List[Dict[str, Any]]) -> int:
+        """Queue parsed reports ({"provider_id", "status"}); returns how many were accepted."""
+        st = self.stats
+        n = 0
+        for r in reports:
+            st["received"] += 1
+            status = final_status(r.get("status"))
+            pid = r.get("provider_id")
+            if not status or not pid:
+                st["ignored"] += 1
+                continue
+            self._pending[str(pid)] = status  # a later report for the same id wins
+            st["by_status"][status] = st["by_status"].get(status, 0) + 1
+            n += 1
+        if self._pending:
+            if len(self._pending) >= self.batch_max:
+                self._spawn(0.0)
+            else:
+                self._spawn(self.flush_s)
+        return n
+
+    def _spawn(self, delay: float) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        # runs until the buffer is empty: reports that arrive while writing
+        # and a batch kept after a failed write are picked up here, since
+        # submit() does not start a second flusher while this one runs
+        if delay:
+            await asyncio.sleep(delay)
+        while True:
+            ok = await self.flush()
+            if not self._pending:
+                return
+            await asyncio.sleep(self.flush_s if ok else max(self.flush_s, DLR_RETRY_S))
+
+    async def flush(self) -> bool:
+        """Write what is buffered; False if the write failed (the reports stay buffered)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._pending:
+                return True
+            batch, self._pending = self._pending, {}
+            t0 = time.perf_counter()
+            try:
+                matched = await asyncio.to_thread(apply, batch)
+            except Exception:
+                self.stats["errors"] += 1
+                log.exception("DLR flush failed (%d reports)", len(batch))
+                # keep them for the next flush; newer reports for the same id win
+                self._pending = {**batch, **self._pending}
+                return False
+            st = self.stats
+            st["flushes"] += 1
+            st["applied"] += matched
+            st["unmatched"] += len(batch) - matched
+            st["last_flush_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+            return True
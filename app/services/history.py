@@ -0,0 +1,70 @@
+# app/services/history.py
+import os, json, math
+from typing import Callable, Dict, List, Optional
+
+# ==== Config ====
+HISTORY_FETCH_LIMIT = int(os.getenv("LLM_HISTORY_FETCH_LIMIT", "40"))   # rows read from DB
+HISTORY_KEEP_TURNS = int(os.getenv("LLM_HISTORY_KEEP_TURNS", "6"))      # verbatim tail
+HISTORY_TOKEN_BUDGET = int(os.getenv("LLM_HISTORY_TOKEN_BUDGET", "400"))  # summary + tail, per call
+HISTORY_MIN_TURNS = 2
+_MSG_OVERHEAD = 4  # role/separator tokens per chat message
+
+# ==== Token estimate ====
+def estimate_tokens(text: str) -> int:
+    """
+    Local token estimate: ~4 UTF-8 bytes per token. Lithuanian diacritics are
+    2 bytes and tokenize worse than ASCII, which the byte count roughly captures.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+def estimate_messages(msgs: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + _MSG_OVERHEAD for m in msgs)
+
+# ==== Compaction ====
+Summarizer = Callable[[List[Dict[str, str]]], Dict]
+
+def _summary_tokens(summary: Optional[Dict]) -> int:
+    if not summary:
+        return 0
+    return estimate_tokens(json.dumps(summary, ensure_ascii=False)) + _MSG_OVERHEAD
+
+def _clip(content: str, max_tokens: int) -> str:
+    if estimate_tokens(content) <= max_tokens:
+        return content
+    # shrink proportionally, then step down until it fits
+    cut = max(1, int(len(content) * max_tokens / max(1, estimate_tokens(content))))
+    while cut > 1 and estimate_tokens(content[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return content[:cut].rstrip() + "…"
+
+def compact_history(
+    history: List[Dict[str, str]],
+    summarize: Summarizer,
+    keep_turns: int = HISTORY_KEEP_TURNS,
+    budget: int = HISTORY_TOKEN_BUDGET,
+) -> Dict:
+    """
+    Split history into {"summary": dict|None, "turns": [...]}:
+      - the last `keep_turns` messages are kept verbatim
+      - everything older is folded into summarize(older) (slots, interest, topics)
+      - if summary + tail exceed `budget`, the oldest tail turns are folded too
+        (keeping at least HISTORY_MIN_TURNS), then over-long messages are clipped
+    The result size depends on the budget, not on the thread length.
+    """
+    history = history or []
+    split = max(0, len(history) - max(0, keep_turns))
+    while True:
+        older, tail = history[:split], history[split:]
+        summary = summarize(older) if older else None
+        used = _summary_tokens(summary) + estimate_messages(tail)
+        if used <= budget or len(tail) <= HISTORY_MIN_TURNS:
+            break
+        split += 1
+
+    if used > budget and tail:
+        per_msg = max(8, (budget - _summary_tokens(summary)) // len(tail) - _MSG_OVERHEAD)
+        tail = [{"role": m["role"], "content": _clip(m.get("content") or "", per_msg)} for m in tail]
+
+    return {"summary": summary, "turns": [{"role": m["role"], "content": m.get("content") or ""} for m in tail]}
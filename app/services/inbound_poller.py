@@ -0,0 +1,105 @@
+# app/services/inbound_poller.py
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.util import metrics
+
+log = logging.getLogger("poller")
+
+Fetch = Callable[[int], Awaitable[Tuple[List[Dict[str, str]], Dict[str, Any]]]]
+Handle = Callable[[List[Dict[str, str]]], Awaitable[None]]
+
+
+class AdaptivePoller:
+    """
+    Pull loop for provider inbound APIs:
+      - re-polls immediately while the provider reports a backlog
+        (pendingMessageCount > 0) or a full `limit` page came back
+      - after a non-empty page, waits `min_s`
+      - when idle (or on errors) backs off exponentially up to `max_s`
+    handle(page) gets each non-empty page and is awaited before the next
+    fetch; pulls are destructive, so it should persist the page first.
+    Keeps latency/backlog stats for /poller/stats.
+    """
+
+    def __init__(self, fetch: Fetch, handle: Handle, limit: int = 100, min_s: float = 0.5, max_s: float = 5.0):
+        self.fetch = fetch
+        self.handle = handle
+        self.limit = limit
+        self.min_s = max(0.0, min_s)
+        self.max_s = max(self.min_s, max_s)
+        self.delay = self.min_s
+        self.stats: Dict[str, Any] = {
+            "polls": 0,
+            "errors": 0,
+            "messages": 0,
+            "last_latency_ms": None,
+            "avg_latency_ms": None,
+            "last_batch": 0,
+            "backlog": 0,              # provider-side pendingMessageCount
+            "last_poll_at": None,
+            "last_message_at": None,
+            "next_delay_s": self.delay,
+        }
+
+    def _next_delay(self, n_items: int, pending: int) -> float:
+        if pending > 0 or n_items >= self.limit:
+            return 0.0
+        if n_items:
+            return self.min_s
+        return min(self.max_s, max(self.min_s, self.delay * 2) or self.max_s)
+
+    def _back_off(self) -> None:
+        self.stats["errors"] += 1
+        self.delay = min(self.max_s, max(self.min_s, self.delay * 2) or self.max_s)
+        self.stats["next_delay_s"] = self.delay
+
+    async def poll_once(self) -> int:
+        t0 = time.perf_counter()
+        try:
+            items, raw = await self.fetch(self.limit)
+        except Exception:
+            log.exception("Poller error")
+            self._back_off()
+            return 0
+        ms = (time.perf_counter() - t0) * 1000
+        metrics.POLLER_FETCH_SECONDS.observe(ms / 1000)
+        st = self.stats
+        st["polls"] += 1
+        st["last_latency_ms"] = round(ms, 1)
+        avg = st["avg_latency_ms"]
+        st["avg_latency_ms"] = round(ms if avg is None else 0.9 * avg + 0.1 * ms, 1)
+        st["last_poll_at"] = time.time()
+        st["last_batch"] = len(items)
+        pending = int((raw or {}).get("pendingMessageCount") or 0)
+        st["backlog"] = pending
+
+        if items:
+            log.info("Pulled %d MO (pending=%d, %.0fms)", len(items), pending, ms)
+            st["messages"] += len(items)
+            st["last_message_at"] = st["last_poll_at"]
+            for it in items:
+                if it.get("received_at"):  # provider receivedAt → pulled here
+                    metrics.POLLER_LAG_SECONDS.observe(max(0.0, st["last_poll_at"] - it["received_at"]))
+            try:
+                await self.handle(items)
+            except Exception:
+                # the page is already pulled; handle() logs what it could not store
+                log.exception("Poller handler error (%d MO)", len(items))
+                self._back_off()
+                return len(items)
+
+        self.delay = self._next_delay(len(items), pending)
+        st["next_delay_s"] = self.delay
+        return len(items)
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        log.info("Infobip puller started (adaptive %.1fs..%.1fs)", self.min_s, self.max_s)
+        while stop is None or not stop.is_set():
+            await self.poll_once()
+            if self.delay > 0:
+                await asyncio.sleep(self.delay)
+            else:
+                await asyncio.sleep(0)  # yield to handlers between back-to-back pages
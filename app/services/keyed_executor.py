@@ -0,0 +1,50 @@
+# app/services/keyed_executor.py
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class KeyedExecutor:
+    """
+    Per-key actor execution on the event loop:
+      - work for the same key (msisdn) runs one at a time, in submission order
+        (asyncio.Lock hands over to waiters FIFO)
+      - different keys run in parallel, at most `concurrency` at once
+    The key lock is taken before a concurrency slot, so a busy conversation
+    never holds slots that other conversations could use.
+    """
+
+    def __init__(self, concurrency: int = 8):
+        self.concurrency = max(1, int(concurrency))
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refs: Dict[str, int] = {}
+        self.running = 0
+
+    def active_keys(self) -> int:
+        return len(self._locks)
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() serialized with other work for `key`."""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._refs[key] = self._refs.get(key, 0) + 1
+        try:
+            async with lock:
+                return await self.bounded(fn)
+        finally:
+            self._refs[key] -= 1
+            if not self._refs[key]:
+                del self._refs[key]
+                del self._locks[key]
+
+    async def bounded(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn() under the global concurrency limit only (no per-key ordering)."""
+        async with self._sem:
+            self.running += 1
+            try:
+                return await fn()
+            finally:
+                self.running -= 1
@@ -0,0 +1,59 @@
+# app/services/lanes.py
+import os
+from typing import Dict, Iterable, Optional
+
+# Outbox lanes, highest priority first
+CONVERSATION, MANUAL, CAMPAIGN = "conversation", "manual", "campaign"
+LANES = (CONVERSATION, MANUAL, CAMPAIGN)
+
+# outbox kind → lane; anything unlisted (batch, admin, campaign) is bulk
+LANE_OF_KIND = {
+    "llm-reply": CONVERSATION,
+    "dnc-goodbye": CONVERSATION,
+    "manual": MANUAL,
+}
+
+
+def lane_for(kind: Optional[str]) -> str:
+    return LANE_OF_KIND.get(kind or "", CAMPAIGN)
+
+
+def _parse_weights(raw: str) -> Dict[str, int]:
+    """'conversation:8,manual:3,campaign:1' → dict; unknown lanes ignored."""
+    out = {CONVERSATION: 8, MANUAL: 3, CAMPAIGN: 1}
+    for part in raw.split(","):
+        name, _, w = part.partition(":")
+        name = name.strip()
+        if name in out and w.strip().isdigit():
+            out[name] = max(1, int(w))
+    return out
+
+
+LANE_WEIGHTS = _parse_weights(os.getenv("OUTBOX_LANE_WEIGHTS", ""))
+
+
+class WeightedRoundRobin:
+    """
+    Smooth weighted round-robin (the nginx upstream algorithm) over the lanes
+    that currently have work: with weights 8/3/1 and all lanes busy, bulk
+    still gets 1 pick in 12, interleaved rather than in bursts; a lane with
+    nothing queued is skipped and its share goes to the others.
+    """
+
+    def __init__(self, weights: Dict[str, int]):
+        self.weights = dict(weights)
+        self._current = {k: 0 for k in self.weights}
+
+    def pick(self, ready: Iterable[str]) -> Optional[str]:
+        ready = [k for k in ready if k in self.weights]
+        if not ready:
+            return None
+        total = 0
+        best = None
+        for k in ready:
+            self._current[k] += self.weights[k]
+            total += self.weights[k]
+            if best is None or self._current[k] > self._current[best]:
+                best = k
+        self._current[best] -= total
+        return best
@@ -0,0 +1,102 @@
+# app/services/leader.py
+"""
+Leader election for singleton background loops.
+
+With `uvicorn --workers N` (or WEB_CONCURRENCY=N) every worker serves HTTP
+and runs outbox workers (claims are row-locked, so they share the queue),
+but loops that must run once per deployment (the Infobip poller, campaign
+runners, outbox maintenance) are registered here with singleton() and run
+only in the worker holding the "leader" lock (storage/locks.py:
+Postgres advisory lock, flock() for SQLite).
+
+Followers retry the lock every LEADER_RETRY_SECONDS; when the leader dies
+its lock goes with it and the next follower to retry takes over. The leader
+re-checks its Postgres session at the same interval and stops its loops if
+the session (and with it the lock) was lost.
+"""
+import os
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.storage.locks import HeldLock
+
+log = logging.getLogger("leader")
+
+LEADER_RETRY_S = float(os.getenv("LEADER_RETRY_SECONDS", "5"))
+
+
+class Leader:
+    def __init__(self, name: str = "leader", retry_s: float = LEADER_RETRY_S):
+        self.lock = HeldLock(name)
+        self.retry_s = retry_s
+        self.is_leader = False
+        self.since: Optional[float] = None
+        self.elections = 0
+        self._jobs: Dict[str, Callable[[], Awaitable[None]]] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def singleton(self, name: str, factory: Callable[[], Awaitable[None]]) -> None:
+        """
+        Run factory() while this worker leads. Jobs are long-running loops;
+        one that ends or crashes is restarted on the next check.
+        """
+        self._jobs[name] = factory
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self._demote()
+        await asyncio.to_thread(self.lock.release)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if not self.is_leader:
+                    if await asyncio.to_thread(self.lock.acquire):
+                        self.is_leader, self.since = True, time.time()
+                        self.elections += 1
+                        log.info("Leader: elected (pid %s, %s); starting %s",
+                                 os.getpid(), self.lock.backend, ", ".join(self._jobs) or "nothing")
+                elif not await asyncio.to_thread(self.lock.alive):
+                    log.error("Leader: lock lost; stopping singleton loops")
+                    await self._demote()
+                if self.is_leader:
+                    self._ensure_jobs()
+            except Exception:
+                log.exception("Leader: election check failed")
+            await asyncio.sleep(self.retry_s)
+
+    def _ensure_jobs(self) -> None:
+        for name, factory in self._jobs.items():
+            task = self._running.get(name)
+            if task is not None and not task.done():
+                continue
+            if task is not None and not task.cancelled() and task.exception() is not None:
+                log.error("Leader: %s crashed (%r); restarting", name, task.exception())
+            self._running[name] = asyncio.create_task(factory())
+
+    async def _demote(self) -> None:
+        self.is_leader, self.since = False, None
+        tasks = list(self._running.values())
+        self._running.clear()
+        for t in tasks:
+            t.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pid": os.getpid(),
+            "leader": self.is_leader,
+            "backend": self.lock.backend,
+            "since": self.since,
+            "elections": self.elections,
+            "jobs": {name: (name in self._running and not self._running[name].done()) for name in self._jobs},
+        }
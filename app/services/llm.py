@@ -1,15 +1,101 @@
 # app/services/llm.py
-import os, json, re, hashlib
+import os, json, re, hashlib, logging, time, threading
 from typing import List, Dict, Optional, Tuple
 from sqlalchemy import desc
-from openai import OpenAI
 
 from app.storage.db import SessionLocal
 from app.storage.models import Thread, Message
+from app.services.resilience import CircuitBreaker, call_with_retries
+from app.services.history import compact_history, HISTORY_FETCH_LIMIT
+from app.services import llm_router
+from app.services.postprocess import ReplyPostProcessor
+from app.services import segments
+from app.util import metrics
+
+log = logging.getLogger("llm")
 
 # ==== Models / client ====
-MODEL = os.getenv("LLM_REPLY_MODEL", os.getenv("LLM_MODEL", "gpt-4o-mini"))
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Per-stage models live in llm_router; MODEL is the reply model (shown by !prompt).
+MODEL = llm_router.model_for("generate")
+_client = None
+_client_lock = threading.Lock()
+_RETRYABLE: tuple = ()
+_ALIVE: tuple = ()
+
+def get_client():
+    """The OpenAI client; the SDK is imported and the client built on the first LLM call."""
+    global _client, _RETRYABLE, _ALIVE
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import (OpenAI, APIConnectionError, RateLimitError, InternalServerError,
+                                    BadRequestError, NotFoundError, ConflictError, UnprocessableEntityError)
+                _RETRYABLE = (APIConnectionError, RateLimitError, InternalServerError)  # APITimeoutError ⊂ APIConnectionError
+                # the API answered and rejected this request; auth/permission errors are not in here
+                _ALIVE = (BadRequestError, NotFoundError, ConflictError, UnprocessableEntityError)
+                # Retries are handled by _complete() below, not by the SDK.
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    return _client
+
+# ==== Resilience: per-stage deadlines, jittered retries, circuit breaker ====
+LLM_DEADLINES = {
+    "classify": float(os.getenv("LLM_CLASSIFY_DEADLINE", "6")),
+    "analyze":  float(os.getenv("LLM_ANALYZE_DEADLINE", "8")),
+    "generate": float(os.getenv("LLM_GENERATE_DEADLINE", "10")),
+}
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", "3"))
+
+breaker = CircuitBreaker(
+    "openai",
+    failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+    reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+)
+
+class LLMUnavailable(RuntimeError):
+    """The LLM could not answer in time (deadline, retries exhausted or breaker open)."""
+
+def _complete(stage: str, escalated: bool = False, **kwargs):
+    """
+    chat.completions.create() on the stage's routed model, within the stage
+    deadline; raises LLMUnavailable on give-up. Latency is recorded per route.
+    """
+    model = llm_router.model_for(stage, escalated)
+    t0 = time.perf_counter()
+    try:
+        client = get_client()
+        r = call_with_retries(
+            lambda remaining: client.chat.completions.create(model=model, timeout=remaining, **kwargs),
+            deadline_s=LLM_DEADLINES.get(stage, 10.0),
+            attempts=LLM_RETRY_ATTEMPTS,
+            retry_on=_RETRYABLE,
+            alive_on=_ALIVE,
+            breaker=breaker,
+            name=f"llm.{stage}",
+        )
+    except Exception as e:
+        dt = time.perf_counter() - t0
+        llm_router.stats.record(stage, model, dt, ok=False)
+        metrics.LLM_SECONDS.observe(dt, stage, model, "error")
+        log.warning("LLM %s unavailable (%s): %s", stage, type(e).__name__, e)
+        raise LLMUnavailable(stage) from e
+    dt = time.perf_counter() - t0
+    llm_router.stats.record(stage, model, dt)
+    metrics.LLM_SECONDS.observe(dt, stage, model, "ok")
+    _record_usage(stage, r)
+    return r
+
+def _record_usage(stage: str, r) -> None:
+    usage = getattr(r, "usage", None)
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    cached = getattr(details, "cached_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    llm_router.stats.record_usage(stage, prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion)
+    metrics.LLM_TOKENS.inc(stage, "prompt", amount=prompt)
+    metrics.LLM_TOKENS.inc(stage, "cached", amount=cached)
+    metrics.LLM_TOKENS.inc(stage, "completion", amount=completion)
 
 # ==== Constants ====
 VALUE_LINE = "Siūlome lanksčius grafikus, greitą pradžią ir paprastą procesą įsidarbinant."
@@ -67,10 +153,6 @@ Output:
 PROMPT_SHA = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
 def prompt_info() -> str:
     return f"PROMPT_SHA={PROMPT_SHA} MODEL={MODEL}"
-try:
-    print(f"[llm] {prompt_info()}", flush=True)
-except Exception:
-    pass
 
 # ==== DB history ====
 def _thread_history(phone: str, limit: int = 14) -> List[Dict[str, str]]:
@@ -97,9 +179,9 @@ def _thread_history(phone: str, limit: int = 14) -> List[Dict[str, str]]:
         db.close()
 
 # ==== Utilities ====
-def _final_sms(s: str) -> str:
-    s = re.sub(r"\s+", " ", (s or "")).strip()
-    return (s[:157].rstrip() + "…") if len(s) > 160 else s
+def _final_sms(s: str, max_segments: int = segments.SMS_MAX_SEGMENTS) -> str:
+    # budget in billed segments, not characters: one Lithuanian letter makes it UCS-2 (70/67 per segment)
+    return segments.finalize(s, max_segments)
 
 def _assistant_has(history: List[Dict[str,str]], needle: str) -> bool:
     n = (needle or "").lower()
@@ -226,6 +308,61 @@ def _strip_probes(reply: str) -> str:
     parts = [p for p in parts if not _PROBE_PAT.search(p)]
     return " ".join(parts).strip() if parts else reply
 
+# ==== History compaction (older turns → structured summary) ====
+_YES_PAT = re.compile(r"\b(taip|domina|įdomu|idomu|gerai|sutinku)\b", re.I)
+_HANDOFF_PAT = re.compile(r"\b(kolega|kolegė|paskambin\w*|telefonu)\b", re.I)
+_PROJECT_Q_PAT = re.compile(r"\b(projekt\w*|objekt\w*)\b", re.I)
+
+def _summarize_turns(older: List[Dict[str,str]]) -> dict:
+    """Short structured summary of turns that are no longer sent verbatim."""
+    interest = "unknown"
+    topics = []
+    def _topic(name: str):
+        if name not in topics:
+            topics.append(name)
+    for m in older:
+        c = m.get("content") or ""
+        if m["role"] == "user":
+            if _DECLINE_PAT.search(c):
+                interest = "no"
+            elif _MAYBE_LATER_PAT.search(c) or _is_hesitation(c):
+                interest = "unsure"
+            elif _YES_PAT.search(c):
+                interest = "yes"
+            if _SAL_KWS.search(c):
+                _topic("user_asked_pay")
+            if _PROJECT_Q_PAT.search(c):
+                _topic("user_asked_project")
+        else:
+            if VALUE_LINE.lower() in c.lower():
+                _topic("value_line_sent")
+            if _PROBE_PAT.search(c):
+                _topic("probe_used")
+            if _HANDOFF_PAT.search(c):
+                _topic("phone_handoff_mentioned")
+            which = _asked_which_slot(c)
+            if which:
+                _topic(f"asked_{which}")
+    slots = _inferred_slots(older)
+    return {
+        "older_turns": len(older),
+        "slots": {k: v for k, v in slots.items() if v},
+        "interest": interest,
+        "topics_covered": topics,
+    }
+
+def _compact(history: List[Dict[str,str]]) -> dict:
+    return compact_history(history, _summarize_turns)
+
+# ==== Prompt layout ====
+# Every stage starts with its static system prompt (a module constant, so the
+# first message is byte-identical across calls) and puts per-turn data after
+# it. Note OpenAI only caches prompts from 1024 tokens; SYSTEM_PROMPT (~760)
+# and ANALYZER_SYS (~340) are below that, so cached_tokens (recorded per stage
+# by _record_usage, see /llm/stats) stays 0 until a prefix grows past it.
+def _dynamic_turn(payload: dict) -> Dict[str,str]:
+    return {"role": "user", "content": json.dumps(payload, ensure_ascii=False, separators=(",", ":"))}
+
 # ==== Two-stage protocol: ANALYZER (semantic plan) ====
 ANALYZER_SYS = """
 You analyze a short SMS chat about construction/trades work for Valandinis.
@@ -250,16 +387,39 @@ Rules:
 Return JSON only.
 """
 
-def analyze(user_text: str, short_history: List[Dict[str,str]]) -> dict:
-    msgs = [{"role":"system","content":ANALYZER_SYS}]
-    msgs += short_history[-6:] if short_history else []
-    msgs.append({"role":"user","content":user_text})
-    r = client.chat.completions.create(model=MODEL, temperature=0, messages=msgs, max_tokens=220)
+def _analyze_raw(msgs: List[Dict[str,str]], escalated: bool = False) -> Optional[dict]:
+    """One analyzer call; None when the model didn't return parseable JSON."""
+    r = _complete("analyze", escalated=escalated, temperature=0, messages=msgs, max_tokens=220)
     raw = (r.choices[0].message.content or "").strip()
     try:
         obj = json.loads(raw)
     except Exception:
-        obj = {}
+        return None
+    return obj if isinstance(obj, dict) else None
+
+def _build_analyze_messages(user_text: str, short_history: List[Dict[str,str]]) -> List[Dict[str,str]]:
+    ctx = _compact(short_history)
+    msgs = [{"role":"system","content":ANALYZER_SYS}]
+    if ctx["summary"]:
+        msgs.append({"role":"system","content":"Earlier in this thread: " + json.dumps(ctx["summary"], ensure_ascii=False)})
+    msgs += ctx["turns"]
+    msgs.append({"role":"user","content":user_text})
+    return msgs
+
+def analyze(user_text: str, short_history: List[Dict[str,str]]) -> dict:
+    msgs = _build_analyze_messages(user_text, short_history)
+    escalated = False
+    try:
+        obj = _analyze_raw(msgs)
+        # Cheap model returned junk → one retry on the stronger route
+        if obj is None and llm_router.can_escalate("analyze"):
+            escalated = True
+            obj = _analyze_raw(msgs, escalated=True)
+    except LLMUnavailable:
+        return _fallback_plan(user_text)
+    finally:
+        llm_router.stats.record_turn("analyze", escalated)
+    obj = obj or {}
     plan = {
         "interest": (obj.get("interest") or "unknown"),
         "intent": (obj.get("intent") or "other"),
@@ -276,22 +436,76 @@ def analyze(user_text: str, short_history: List[Dict[str,str]]) -> dict:
             plan["interest"] = "yes"
     return plan
 
+# ==== Deterministic fallbacks (LLM down / breaker open) ====
+SLOT_QUESTIONS = {
+    "years": "Kiek metų patirties turite?",
+    "availability": "Nuo kada galėtumėte pradėti?",
+}
+INTEREST_QUESTION = "Ar domintų darbas per Valandinį?"
+DECLINE_TX = "Supratau, ačiū už atsakymą. Gražios dienos!"
+
+def _fallback_plan(user_text: str) -> dict:
+    """Regex-only plan with the same shape analyze() returns."""
+    t = user_text or ""
+    decline = bool(_DECLINE_PAT.search(t))
+    hesitant = not decline and (_is_hesitation(t) or bool(_MAYBE_LATER_PAT.search(t)))
+    years = _extract_years(t)
+    avail = _extract_availability(t)
+    if decline:
+        interest, intent = "no", "decline"
+    elif hesitant:
+        interest, intent = "unsure", "hesitant"
+    elif re.search(r"\b(taip|domina|įdomu|idomu)\b", t, re.I):
+        interest, intent = "yes", "accept"
+    else:
+        interest, intent = "unknown", "other"
+    return {
+        "interest": interest,
+        "intent": intent,
+        "slots": {"years": years, "availability_text": avail},
+        "phone_only_topics": [],
+        "asked_salary": bool(_SAL_KWS.search(t)),
+        "busy_until": None,
+        "decline": decline,
+        "hesitant": hesitant,
+    }
+
+def _fallback_reply(plan: dict, slots_hist: Dict[str, Optional[str]]) -> str:
+    """Template reply honouring the interest gate and slot order."""
+    if plan.get("decline") or plan.get("intent") == "decline":
+        return DECLINE_TX
+    slots = dict(slots_hist)
+    if plan.get("have_years"):
+        slots["years"] = slots.get("years") or "known"
+    if plan.get("have_availability"):
+        slots["availability"] = slots.get("availability") or "known"
+    nxt = _next_missing_slot(slots)
+    if nxt is None:
+        return CLOSE_TX
+    if plan.get("interest") != "yes" and not any(slots.values()):
+        return INTEREST_QUESTION
+    return SLOT_QUESTIONS[nxt]
+
 # ==== Two-stage protocol: GENERATOR (free-form LT SMS) ====
 GENERATOR_SYS = SYSTEM_PROMPT  # reuse strict behavior rules
 
-def generate_sms(plan: dict, short_history: List[Dict[str,str]]) -> str:
-    msgs = [{"role":"system","content":GENERATOR_SYS}]
-    msgs.append({"role":"user","content":json.dumps({
+def _build_generate_messages(plan: dict, short_history: List[Dict[str,str]]) -> List[Dict[str,str]]:
+    ctx = _compact(short_history)
+    return [{"role":"system","content":GENERATOR_SYS}, _dynamic_turn({
+        "earlier_summary": ctx["summary"],
+        "history_tail": ctx["turns"],
         "plan": plan,
-        "history_tail": [{"role":m["role"],"content":m["content"]} for m in (short_history[-6:] if short_history else [])]
-    }, ensure_ascii=False)})
-    r = client.chat.completions.create(model=MODEL, temperature=0.3, messages=msgs, max_tokens=140)
+    })]
+
+def generate_sms(plan: dict, short_history: List[Dict[str,str]], escalated: bool = False) -> str:
+    msgs = _build_generate_messages(plan, short_history)
+    r = _complete("generate", escalated=escalated, temperature=0.3, messages=msgs, max_tokens=140)
     return (r.choices[0].message.content or "").strip()
 
 # ==== Legacy single-call helpers (kept for compatibility) ====
 def _call(messages):
-    return client.chat.completions.create(
-        model=MODEL,
+    return _complete(
+        "generate",
         messages=messages,
         temperature=0.2,
         max_tokens=120
@@ -304,60 +518,34 @@ def _build_messages(history: List[Dict[str,str]], user_text: str) -> List[Dict[s
     msgs.append({"role": "user", "content": user_text})
     return msgs
 
-# ==== Main generator (two-stage with interest gate + probe/label/values fixes) ====
-def generate_reply_lt(ctx: dict, text: str) -> str:
-    t_raw = (text or "").strip()
-    if not t_raw:
-        return ""
-
-    t_lower = t_raw.lstrip("\\").lower()
-    if t_lower in {"!prompt", "!pf", "##prompt##"}:
-        return (f"{PROMPT_SHA} {MODEL}")[:160]
-
-    history = _thread_history((ctx or {}).get("msisdn",""), limit=14)
-
-    if _assistant_has(history, CLOSE_TX.lower()):
-        return ""
-
-    if re.search(r"\b(robot|bot|dirbtin|ai)\b", t_raw, re.I):
-        return _final_sms("Ne. Ar domintų dirbti per Valandinį?")
-
-    # Two-stage: 1) analyze
-    plan = analyze(t_raw, history)
-
-    # Merge slot memory from history
-    slots_hist = _inferred_slots(history)
-    have_years_hist = bool(slots_hist.get("years"))
-    have_avail_hist = bool(slots_hist.get("availability"))
-
-    # Compute gating flags passed to generator
-    plan["have_years"] = have_years_hist or (plan.get("slots") or {}).get("years") is not None
-    plan["have_availability"] = have_avail_hist or bool((plan.get("slots") or {}).get("availability_text"))
-    # If busy_until detected, availability considered known
-    if plan.get("busy_until"):
-        plan["have_availability"] = True
-
-    # Hard stop on complete info → close
-    if plan["have_years"] and plan["have_availability"]:
-        return _final_sms(CLOSE_TX)
-
-    # 2) generate natural LT SMS respecting interest gate
-    reply = generate_sms(plan, history)
+# ==== Legacy multi-pass guards (reference for tools/bench_postprocess.py) ====
+def _postprocess_legacy(reply: str, plan: dict, history: List[Dict[str,str]], t_raw: str) -> Tuple[str, bool]:
+    """
+    Apply the belt-and-braces guards to a generated reply.
+    Returns (reply, rewritten) where rewritten means a guard had to drop or
+    replace model content (label scrubbing alone doesn't count).
+    """
+    rewritten = False
 
-    # --- Post-processing guards ---
+    def _changed(before: str, after: str) -> bool:
+        return before.split() != after.split()
 
     # Belt guard: drop phone-only details if user didn't ask
     if not plan.get("asked_salary") and "salary" not in plan.get("phone_only_topics", []):
-        reply = _strip_phone_only_if_not_asked(t_raw, reply)
+        before, reply = reply, _strip_phone_only_if_not_asked(t_raw, reply)
+        rewritten |= _changed(before, reply)
 
     # Don’t allow availability question before years are known
     if ("kada galėtumėte pradėti" in reply.lower() or "koks grafikas tinka" in reply.lower()) and not plan["have_years"]:
         reply = "Kiek metų patirties turite?"
+        rewritten = True
 
     # Drop awkward labels like "atsargus/atsargi"
     reply = _LABEL_BAN_PAT.sub("", reply).strip()
     reply = re.sub(r"\s{2,}", " ", reply)
 
+    before = reply
+
     # Remove probe if we've already used a probe in this thread
     if _assistant_has_probe(history) and _PROBE_PAT.search(reply):
         reply = _strip_probes(reply)
@@ -385,8 +573,103 @@ def generate_reply_lt(ctx: dict, text: str) -> str:
     if re.search(r"[A-Za-z]{3,}", reply) and not re.search(r"[ĄČĘĖĮŠŲŪŽąčęėįšųūž]", reply):
         reply = "Atsakykite trumpai lietuviškai ir tęsime."
 
+    rewritten |= _changed(before, reply)
+    return reply, rewritten
+
+# ==== Main generator (two-stage with interest gate + probe/label/values fixes) ====
+def generate_reply_lt(ctx: dict, text: str) -> str:
+    t_raw = (text or "").strip()
+    if not t_raw:
+        return ""
+
+    t_lower = t_raw.lstrip("\\").lower()
+    if t_lower in {"!prompt", "!pf", "##prompt##"}:
+        return (f"{PROMPT_SHA} {MODEL}")[:160]
+
+    # Guards see the longer history; LLM calls get a compacted, budgeted view of it.
+    history = _thread_history((ctx or {}).get("msisdn",""), limit=HISTORY_FETCH_LIMIT)
+
+    if _assistant_has(history, CLOSE_TX.lower()):
+        return ""
+
+    if re.search(r"\b(robot|bot|dirbtin|ai)\b", t_raw, re.I):
+        return _final_sms("Ne. Ar domintų dirbti per Valandinį?")
+
+    # ctx["cancelled"]() turns true when the caller gave up on this turn (a newer
+    # fragment arrived): the running call still finishes, later stages are skipped
+    cancelled = (ctx or {}).get("cancelled") or (lambda: False)
+
+    # Two-stage: 1) analyze
+    plan = analyze(t_raw, history)
+    if cancelled():
+        return ""
+
+    # Merge slot memory from history
+    slots_hist = _inferred_slots(history)
+    have_years_hist = bool(slots_hist.get("years"))
+    have_avail_hist = bool(slots_hist.get("availability"))
+
+    # Compute gating flags passed to generator
+    plan["have_years"] = have_years_hist or (plan.get("slots") or {}).get("years") is not None
+    plan["have_availability"] = have_avail_hist or bool((plan.get("slots") or {}).get("availability_text"))
+    # If busy_until detected, availability considered known
+    if plan.get("busy_until"):
+        plan["have_availability"] = True
+
+    # Hard stop on complete info → close
+    if plan["have_years"] and plan["have_availability"]:
+        return _final_sms(CLOSE_TX)
+
+    # 2) generate natural LT SMS respecting interest gate
+    try:
+        reply, rewritten = _postprocess(generate_sms(plan, history), plan, history, t_raw)
+    except LLMUnavailable:
+        llm_router.stats.record_turn("generate", False)
+        return _final_sms(_fallback_reply(plan, slots_hist))
+
+    # Guards had to rewrite the cheap model's answer → one try on the stronger route
+    escalated = rewritten and llm_router.can_escalate("generate") and not cancelled()
+    if escalated:
+        try:
+            reply, _ = _postprocess(generate_sms(plan, history, escalated=True), plan, history, t_raw)
+        except LLMUnavailable:
+            pass  # keep the guarded first answer
+    llm_router.stats.record_turn("generate", escalated)
+
     return _final_sms(reply)
 
+# ==== Post-processing guards ====
+_POST = ReplyPostProcessor(
+    value_line=VALUE_LINE,
+    salary_pat=_SAL_KWS,
+    probe_pat=_PROBE_PAT,
+    label_pat=_LABEL_BAN_PAT,
+    years_question=SLOT_QUESTIONS["years"],
+    non_lt_reply="Atsakykite trumpai lietuviškai ir tęsime.",
+)
+
+def _postprocess(reply: str, plan: dict, history: List[Dict[str,str]], t_raw: str) -> Tuple[str, bool]:
+    """
+    Apply the belt-and-braces guards to a generated reply in one tokenize/tag pass.
+    Returns (reply, rewritten) where rewritten means a guard had to drop or
+    replace model content (label scrubbing alone doesn't count).
+    """
+    raw_lower = t_raw.lower()
+    return _POST.run(
+        reply,
+        # drop phone-only details if user didn't ask
+        strip_salary=(not plan.get("asked_salary")
+                      and "salary" not in plan.get("phone_only_topics", [])
+                      and not _SAL_KWS.search(t_raw or "")),
+        years_known=bool(plan["have_years"]),
+        history_has_probe=lambda: _assistant_has_probe(history),
+        history_has_value=lambda: _assistant_has(history, VALUE_LINE.lower()),
+        # decline / maybe later / unrelated, or answering an info question → no probe, no value line
+        strip_extras=(bool(_DECLINE_PAT.search(raw_lower) or _MAYBE_LATER_PAT.search(raw_lower))
+                      or plan.get("intent") == "unrelated"
+                      or (plan.get("intent") in ("project_question","direct_question") and not plan.get("hesitant"))),
+    )
+
 # ==== Classifier (unchanged) ====
 def classify_lt(text: str) -> dict:
     sys = (
@@ -395,14 +678,24 @@ def classify_lt(text: str) -> dict:
         "Pvz.: 'nedomina' -> not_interested; klausimai apie darbą -> questions; kita -> other. "
         "Atsakyk tik JSON."
     )
-    r = client.chat.completions.create(
-        model=MODEL, temperature=0,
-        messages=[{"role":"system","content":sys},{"role":"user","content":text}],
-        max_tokens=60
-    )
-    content = (r.choices[0].message.content or "").strip()
+    msgs = [{"role":"system","content":sys},{"role":"user","content":text}]
+    escalated = False
+    try:
+        obj = _classify_raw(msgs)
+        if obj is None and llm_router.can_escalate("classify"):
+            escalated = True
+            obj = _classify_raw(msgs, escalated=True)
+    except LLMUnavailable:
+        # Deterministic fallback. not_interested sets a permanent DNC, so a
+        # decline word ("ne, ačiū, bet ar yra kitas darbas?") is not enough
+        # without the model: the message stays stored for later review.
+        # Clear opt-outs never get here (services/phrases.py).
+        return {"intent": "other", "confidence": 0.0}
+    finally:
+        llm_router.stats.record_turn("classify", escalated)
+    if obj is None:
+        return {"intent": "other", "confidence": 0.5}
     try:
-        obj = json.loads(content)
         intent = (obj.get("intent") or "").lower().strip()
         conf = float(obj.get("confidence") or 0.6)
         if intent not in {"questions", "not_interested", "other"}:
@@ -411,9 +704,21 @@ def classify_lt(text: str) -> dict:
     except Exception:
         return {"intent": "other", "confidence": 0.5}
 
+def _classify_raw(msgs: List[Dict[str,str]], escalated: bool = False) -> Optional[dict]:
+    r = _complete("classify", escalated=escalated, temperature=0, messages=msgs, max_tokens=60)
+    content = (r.choices[0].message.content or "").strip()
+    try:
+        obj = json.loads(content)
+    except Exception:
+        return None
+    return obj if isinstance(obj, dict) else None
+
+# the opener carries the pitch; it may use more segments than a reply
+SMS_OPENER_MAX_SEGMENTS = int(os.getenv("SMS_OPENER_MAX_SEGMENTS", "3"))
+
 def project_opener(name: str, city: str, specialty: str) -> str:
     msg = (
         f"Sveiki, {name}! Čia Valandinis.lt — {city} turime objektą "
         f"{specialty} specialistui. Ar šiuo metu dirbate ar esate atviri naujam objektui? 🙂"
     )
-    return _final_sms(msg)
+    return _final_sms(msg, SMS_OPENER_MAX_SEGMENTS)
@@ -0,0 +1,102 @@
+# app/services/llm_router.py
+import os
+import threading
+from typing import Dict, Tuple
+
+# ==== Routes ====
+# One model per pipeline stage; unset stages fall back to LLM_REPLY_MODEL, then
+# LLM_MODEL (the old single-model behaviour). Escalation is off unless
+# LLM_ESCALATE_MODEL (or a per-stage LLM_<STAGE>_ESCALATE_MODEL) is set.
+_DEFAULT_MODEL = os.getenv("LLM_REPLY_MODEL", os.getenv("LLM_MODEL", "gpt-4o-mini"))
+_STAGE_ENV = {
+    "classify": "LLM_CLASSIFY",
+    "analyze": "LLM_ANALYZE",
+    "generate": "LLM_REPLY",
+}
+
+ROUTES: Dict[str, str] = {
+    stage: os.getenv(f"{prefix}_MODEL", _DEFAULT_MODEL) for stage, prefix in _STAGE_ENV.items()
+}
+ESCALATIONS: Dict[str, str] = {
+    stage: os.getenv(f"{prefix}_ESCALATE_MODEL", os.getenv("LLM_ESCALATE_MODEL", ""))
+    for stage, prefix in _STAGE_ENV.items()
+}
+
+def model_for(stage: str, escalated: bool = False) -> str:
+    if escalated and ESCALATIONS.get(stage):
+        return ESCALATIONS[stage]
+    return ROUTES.get(stage, _DEFAULT_MODEL)
+
+def can_escalate(stage: str) -> bool:
+    esc = ESCALATIONS.get(stage)
+    return bool(esc) and esc != ROUTES.get(stage)
+
+# ==== Per-route stats ====
+class RouteStats:
+    """Call count, errors, latency and escalations per (stage, model)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._stage_calls: Dict[str, int] = {}
+        self._stage_escalations: Dict[str, int] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def _row(self, stage: str, model: str) -> Dict[str, float]:
+        key = (stage, model)
+        row = self._routes.get(key)
+        if row is None:
+            row = self._routes[key] = {"calls": 0, "errors": 0, "latency_sum": 0.0, "latency_max": 0.0}
+        return row
+
+    def record(self, stage: str, model: str, latency_s: float, ok: bool = True) -> None:
+        with self._lock:
+            row = self._row(stage, model)
+            row["calls"] += 1
+            row["errors"] += 0 if ok else 1
+            row["latency_sum"] += latency_s
+            row["latency_max"] = max(row["latency_max"], latency_s)
+
+    def record_turn(self, stage: str, escalated: bool) -> None:
+        """One logical stage invocation (which may have used 1 or 2 model calls)."""
+        with self._lock:
+            self._stage_calls[stage] = self._stage_calls.get(stage, 0) + 1
+            if escalated:
+                self._stage_escalations[stage] = self._stage_escalations.get(stage, 0) + 1
+
+    def record_usage(self, stage: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+        """Token usage per stage; cached = served from the provider's prompt cache."""
+        with self._lock:
+            u = self._usage.get(stage)
+            if u is None:
+                u = self._usage[stage] = {"prompt_tokens": 0, "cached_tokens": 0, "uncached_tokens": 0, "completion_tokens": 0}
+            u["prompt_tokens"] += prompt_tokens
+            u["cached_tokens"] += cached_tokens
+            u["uncached_tokens"] += max(0, prompt_tokens - cached_tokens)
+            u["completion_tokens"] += completion_tokens
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            routes = {}
+            for (stage, model), row in self._routes.items():
+                calls = row["calls"] or 1
+                routes[f"{stage}:{model}"] = {
+                    **row,
+                    "latency_avg": row["latency_sum"] / calls,
+                }
+            stages = {}
+            for stage, n in self._stage_calls.items():
+                esc = self._stage_escalations.get(stage, 0)
+                stages[stage] = {"calls": n, "escalations": esc, "escalation_rate": esc / n if n else 0.0}
+            usage = {}
+            for stage, u in self._usage.items():
+                usage[stage] = {
+                    **u,
+                    "cache_hit_rate": u["cached_tokens"] / u["prompt_tokens"] if u["prompt_tokens"] else 0.0,
+                }
+            return {"routes": routes, "stages": stages, "usage": usage}
+
+stats = RouteStats()
+
+def route_stats() -> Dict[str, dict]:
+    return stats.snapshot()
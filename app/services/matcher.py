@@ -1,5 +1,5 @@
 from __future__ import annotations
-import re
+import os
 import unicodedata
 import pandas as pd
 from rapidfuzz import fuzz
@@ -70,12 +70,41 @@ def _pick_first(df: pd.DataFrame, names: list[str]) -> str | None:
             return n
     return None
 
+# Phones are keyed as E.164 digits without "+" ("37060012345"), the MSISDN
+# form Infobip uses for MOs, so uploaded people and inbound senders share
+# one Contact row.
+PHONE_COUNTRY_CODE = os.getenv("PHONE_COUNTRY_CODE", "370")
+PHONE_TRUNK_PREFIX = os.getenv("PHONE_TRUNK_PREFIX", "8")
+PHONE_NATIONAL_LEN = int(os.getenv("PHONE_NATIONAL_LEN", "8"))
+
+def normalize_phones(col: pd.Series) -> pd.Series:
+    """
+    Whole-column phone canonicalization (pandas string ops, no per-row Python):
+      860012345, 8 600 12345     → 37060012345   (national, trunk prefix)
+      60012345                   → 37060012345   (national number only)
+      +37060012345, 0037060012345, 37060012345, +370 (8) 600 12345
+                                 → 37060012345
+      +44 7700 900123            → 447700900123  (other countries need + / 00)
+    Anything else becomes "".
+    """
+    cc, trunk, n = PHONE_COUNTRY_CODE, PHONE_TRUNK_PREFIX, PHONE_NATIONAL_LEN
+    raw = col.fillna("").astype(str).str.strip().str.replace(r"\.0+$", "", regex=True)  # Excel floats
+    intl = raw.str.match(r"(\+|00)")
+    d = raw.str.replace(r"\D", "", regex=True)
+    d = d.mask(raw.str.startswith("00"), d.str[2:])
+    length = d.str.len()
+
+    out = pd.Series("", index=col.index, dtype=object)
+    out = out.mask(~intl & length.eq(n + len(trunk)) & d.str.startswith(trunk), cc + d.str[len(trunk):])
+    out = out.mask(~intl & length.eq(n), cc + d)
+    out = out.mask(length.eq(len(cc) + n) & d.str.startswith(cc), d)
+    out = out.mask(length.eq(len(cc) + len(trunk) + n) & d.str.startswith(cc + trunk),
+                   cc + d.str[len(cc) + len(trunk):])
+    out = out.mask(intl & length.between(8, 15) & ~d.str.startswith(cc), d)
+    return out
+
 def _clean_phone(x) -> str:
-    if pd.isna(x):
-        return ""
-    s = str(x).strip()
-    s = re.sub(r"[^\d+]", "", s)
-    return s
+    return normalize_phones(pd.Series([x], dtype=object)).iat[0]
 
 def _norm(s) -> str:
     if pd.isna(s):
@@ -104,13 +133,17 @@ def build_matches(people: pd.DataFrame, projects: pd.DataFrame) -> pd.DataFrame:
     proj["_active"] = pd.to_numeric(proj[pr_active], errors="coerce").fillna(0).astype(int)
     proj = proj[proj["_active"] > 0].copy()
 
+    # one row per person: the same number typed three ways is one recipient
+    people = people.assign(_phone=normalize_phones(people[p_phone]))
+    people = people[people["_phone"] != ""].drop_duplicates("_phone")
+
     rows = []
     match_id = 1
 
     for _, r in people.iterrows():
         city = _norm(r.get(p_city, ""))
         prof = _norm(r.get(p_prof, ""))
-        phone = _clean_phone(r.get(p_phone, ""))
+        phone = r["_phone"]
 
         if not prof or not phone:
             continue
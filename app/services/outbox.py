@@ -0,0 +1,515 @@
+# app/services/outbox.py
+"""
+Durable outbox for every outbound SMS.
+
+Senders call enqueue() inside their DB transaction: it writes the Message
+(status=queued) and an `outbox` row, so nothing is lost on restart. A pool
+of worker coroutines claims queued rows, spends tokens from a shared bucket
+(provider TPS) and pushes them through provider.send_many(); transient
+failures are retried with backoff, permanent ones marked failed.
+
+Rows carry a lane (conversation/manual/campaign, see services/lanes.py);
+workers pick the next lane by weighted round-robin over the lanes with due
+work, so live replies never queue behind a bulk blast.
+
+  queued → sending → sent
+                   ↘ queued (retry, next_attempt_at) … → failed
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+
+from app.storage.db import SessionLocal
+from app.storage.models import Contact, Thread, Message, OutboxItem
+from app.services.ratelimit import TokenBucket
+from app.services import lanes, segments
+from app.services.resilience import backoff_delay
+
+log = logging.getLogger("outbox")
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_TPS = float(os.getenv("OUTBOX_TPS", "10"))                  # provider throughput we may use
+OUTBOX_BURST = float(os.getenv("OUTBOX_BURST", str(OUTBOX_TPS)))
+# uvicorn --workers N (WEB_CONCURRENCY): each process drains the outbox with its share of the TPS
+OUTBOX_PROCESSES = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "50"))               # rows per claim (capped by burst)
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_BASE_S = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "2"))
+OUTBOX_RETRY_MAX_S = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "300"))
+OUTBOX_IDLE_S = float(os.getenv("OUTBOX_IDLE_SECONDS", "2"))      # re-check interval when nothing is queued
+OUTBOX_STALE_S = float(os.getenv("OUTBOX_STALE_SECONDS", "300"))  # 'sending' older than this was interrupted
+
+# the STOP confirmation is the one message that may go to a DNC contact
+DNC_EXEMPT_KINDS = {"dnc-goodbye"}
+
+
+# ==== Enqueue (caller's transaction) ====
+def ensure_contact_thread(db, phone: str):
+    c = db.query(Contact).filter_by(phone=phone).first()
+    if not c:
+        c = Contact(phone=phone)
+        db.add(c)
+        db.flush()
+    t = db.query(Thread).filter_by(phone=phone, status="open").first()
+    if not t:
+        t = _open_threads(db, [phone])[phone]
+    return c, t
+
+
+def _open_threads(db, phones: List[str]) -> Dict[str, Thread]:
+    """
+    Insert an open Thread per phone. When a concurrent transaction opened one
+    first (uq_threads_open_phone), only the savepoint is rolled back and that
+    thread is used instead.
+    """
+    new = [Thread(phone=p) for p in phones]
+    try:
+        with db.begin_nested():
+            db.add_all(new)
+    except IntegrityError:
+        theirs = {t.phone: t for t in db.query(Thread).filter(Thread.phone.in_(phones), Thread.status == "open")}
+        missing = [p for p in phones if p not in theirs]
+        if missing and len(missing) < len(phones):
+            theirs.update(_open_threads(db, missing))
+        elif missing:
+            raise
+        return theirs
+    return {t.phone: t for t in new}
+
+
+def enqueue(db, phone: str, body: str, *, userref: Optional[str] = None, kind: str = "manual",
+            thread: Optional[Thread] = None, not_before: Optional[datetime] = None) -> OutboxItem:
+    """
+    Queue one SMS: an outgoing Message (status=queued) plus its outbox row.
+    The caller commits, then calls wake() so an idle worker picks it up now
+    (or at not_before, UTC).
+    """
+    if thread is None:
+        _, thread = ensure_contact_thread(db, phone)
+    m = Message(thread_id=thread.id, dir="out", body=body, status="queued", userref=userref,
+                segments=segments.count(body))
+    db.add(m)
+    db.flush()
+    item = OutboxItem(message_id=m.id, phone=phone, body=body, userref=userref, kind=kind,
+                      lane=lanes.lane_for(kind), next_attempt_at=not_before or datetime.utcnow())
+    db.add(item)
+    db.flush()
+    return item
+
+
+# ==== Bulk enqueue (batches, campaigns) ====
+_IN_CHUNK = 500  # bind parameters per IN (...) query
+
+
+def _chunks(seq: List[Any], n: int = _IN_CHUNK):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
+
+def recipient_state(db, phones: List[str]) -> Tuple[set, Dict[str, datetime]]:
+    """DNC phones and last outgoing Message.ts per phone, a few queries for the whole list."""
+    dnc: set = set()
+    last_out: Dict[str, datetime] = {}
+    for part in _chunks(list(phones)):
+        dnc.update(p for p, in db.query(Contact.phone).filter(Contact.phone.in_(part), Contact.dnc.is_(True)))
+        last_out.update(
+            db.query(Thread.phone, func.max(Message.ts))
+            .join(Message, Message.thread_id == Thread.id)
+            .filter(Thread.phone.in_(part), Message.dir == "out")
+            .group_by(Thread.phone)
+            .all()
+        )
+    return dnc, last_out
+
+
+_ANNOTATE_CHUNK = 20000  # under SQLite's 32766 bind limit: one query for any realistic upload
+
+
+def contact_state(db, phones: List[str]) -> Dict[str, Dict[str, Any]]:
+    """{phone: {"dnc", "thread_id"}} for phones that already have a Contact (open thread or None)."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for part in _chunks(list(dict.fromkeys(phones)), _ANNOTATE_CHUNK):
+        rows = (
+            db.query(Contact.phone, Contact.dnc, func.max(Thread.id))
+            .outerjoin(Thread, (Thread.phone == Contact.phone) & (Thread.status == "open"))
+            .filter(Contact.phone.in_(part))
+            .group_by(Contact.phone, Contact.dnc)
+        )
+        for phone, dnc, thread_id in rows:
+            out[phone] = {"dnc": bool(dnc), "thread_id": thread_id}
+    return out
+
+
+def ensure_threads(db, phones: List[str]) -> Dict[str, Thread]:
+    """Bulk ensure_contact_thread(): {phone: open Thread}."""
+    phones = list(dict.fromkeys(phones))
+    have_contact: set = set()
+    threads: Dict[str, Thread] = {}
+    for part in _chunks(phones):
+        have_contact.update(p for p, in db.query(Contact.phone).filter(Contact.phone.in_(part)))
+        for t in db.query(Thread).filter(Thread.phone.in_(part), Thread.status == "open"):
+            threads.setdefault(t.phone, t)
+    db.add_all(Contact(phone=p) for p in phones if p not in have_contact)
+    db.flush()
+    missing = [p for p in phones if p not in threads]
+    if missing:
+        threads.update(_open_threads(db, missing))
+    return threads
+
+
+def enqueue_many(db, rows: List[Dict[str, Any]], *, kind: str,
+                 not_before: Optional[datetime] = None) -> List[OutboxItem]:
+    """
+    enqueue() for many rows ({"to", "text", "userref"?}) with two flushes in
+    total instead of two per row. Returns the outbox items in row order.
+    not_before (UTC) holds the rows until then.
+    """
+    threads = ensure_threads(db, [r["to"] for r in rows])
+    msgs = [
+        Message(thread_id=threads[r["to"]].id, dir="out", body=r["text"], status="queued", userref=r.get("userref"),
+                segments=segments.count(r["text"]))
+        for r in rows
+    ]
+    db.add_all(msgs)
+    db.flush()
+    lane = lanes.lane_for(kind)
+    items = [
+        OutboxItem(message_id=m.id, phone=r["to"], body=r["text"], userref=r.get("userref"), kind=kind, lane=lane,
+                   next_attempt_at=not_before or datetime.utcnow())
+        for r, m in zip(rows, msgs)
+    ]
+    db.add_all(items)
+    db.flush()
+    return items
+
+
+def _sent_rows(db, *criteria):
+    return (
+        db.query(Message.userref, Message.id, OutboxItem.id, func.coalesce(OutboxItem.status, Message.status))
+        .outerjoin(OutboxItem, OutboxItem.message_id == Message.id)
+        .filter(Message.dir == "out", *criteria)
+        .all()
+    )
+
+
+def sent_by_userref(db, userrefs: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Outgoing messages already recorded under these userrefs: {userref: {"id", "outbox_id", "status"}}."""
+    out: Dict[str, Dict[str, Any]] = {}
+    for part in _chunks([u for u in userrefs if u]):
+        for ref, mid, oid, status in _sent_rows(db, Message.userref.in_(part)):
+            out[ref] = {"id": mid, "outbox_id": oid, "status": status}
+    return out
+
+
+def sent_by_id(db, message_id: int) -> Optional[Dict[str, Any]]:
+    """Current {"id", "outbox_id", "status"} of one outgoing message (primary-key lookup)."""
+    rows = _sent_rows(db, Message.id == message_id)
+    if not rows:
+        return None
+    _, mid, oid, status = rows[0]
+    return {"id": mid, "outbox_id": oid, "status": status}
+
+
+# ==== Worker-side DB steps (sync; run via asyncio.to_thread) ====
+def _finish(db, item: OutboxItem, status: str, now: datetime, provider_id: Optional[str] = None,
+            error: Optional[str] = None) -> None:
+    item.status = status
+    item.provider_id = provider_id or item.provider_id
+    item.error = error
+    item.updated_at = now
+    if item.message_id:
+        db.query(Message).filter(Message.id == item.message_id).update(
+            {"status": status, "provider_id": item.provider_id}, synchronize_session=False
+        )
+
+
+def due_lanes() -> Dict[str, Tuple[int, Optional[datetime]]]:
+    """{lane: (due rows, oldest created_at)} for queued rows that may go now."""
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(OutboxItem.lane, func.count(OutboxItem.id), func.min(OutboxItem.created_at))
+            .filter(OutboxItem.status == "queued", OutboxItem.next_attempt_at <= now)
+            .group_by(OutboxItem.lane)
+            .all()
+        )
+        return {lane: (n, oldest) for lane, n, oldest in rows if lane}
+    finally:
+        db.close()
+
+
+def claim(limit: int, lane: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Move up to `limit` due rows (of `lane`, if given) from queued to sending.
+    Postgres: FOR UPDATE SKIP LOCKED lets workers/processes skip each other's
+    rows. SQLite ignores the lock clause; the conditional UPDATE below
+    (status still 'queued') makes the losing claimer update 0 rows instead.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        q = db.query(OutboxItem.id).filter(OutboxItem.status == "queued", OutboxItem.next_attempt_at <= now)
+        if lane is not None:
+            q = q.filter(OutboxItem.lane == lane)
+        ids = [r.id for r in q.order_by(OutboxItem.id).limit(limit).with_for_update(skip_locked=True)]
+        won = []
+        for i in ids:
+            n = (
+                db.query(OutboxItem)
+                .filter(OutboxItem.id == i, OutboxItem.status == "queued")
+                .update(
+                    {"status": "sending", "claimed_at": now, "updated_at": now,
+                     "attempts": OutboxItem.attempts + 1},
+                    synchronize_session=False,
+                )
+            )
+            if n:
+                won.append(i)
+        if not won:
+            db.commit()
+            return []
+
+        out = []
+        rows = (
+            db.query(OutboxItem, Contact.dnc)
+            .outerjoin(Contact, Contact.phone == OutboxItem.phone)
+            .filter(OutboxItem.id.in_(won))
+            .order_by(OutboxItem.id)
+            .all()
+        )
+        for item, dnc in rows:
+            if dnc and item.kind not in DNC_EXEMPT_KINDS:
+                # STOP arrived while this was queued
+                _finish(db, item, "failed", now, error="dnc")
+                continue
+            out.append({
+                "id": item.id, "to": item.phone, "text": item.body,
+                "userref": item.userref, "kind": item.kind, "lane": item.lane, "attempts": item.attempts,
+                "wait_s": (now - item.created_at).total_seconds() if item.created_at else 0.0,
+            })
+        db.commit()
+        return out
+    finally:
+        db.close()
+
+
+def record(sent: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> Dict[str, int]:
+    """Store send_many results: sent, re-queued with backoff, or failed."""
+    now = datetime.utcnow()
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    db = SessionLocal()
+    try:
+        for it, res in sent:
+            item = db.get(OutboxItem, it["id"])
+            if item is None:
+                continue
+            if res.get("ok"):
+                _finish(db, item, "sent", now, provider_id=res.get("provider_id"))
+                counts["sent"] += 1
+            elif res.get("retryable") and (item.attempts or 0) < OUTBOX_MAX_ATTEMPTS:
+                delay = backoff_delay((item.attempts or 1) - 1, OUTBOX_RETRY_BASE_S, OUTBOX_RETRY_MAX_S)
+                item.status = "queued"
+                item.error = res.get("error")
+                item.next_attempt_at = now + timedelta(seconds=delay)
+                item.updated_at = now
+                counts["retried"] += 1
+            else:
+                # provider_id is set when the outcome is unknown: a DLR may still mark it delivered
+                _finish(db, item, "failed", now, provider_id=res.get("provider_id"),
+                        error=res.get("error") or "send failed")
+                counts["failed"] += 1
+        db.commit()
+        return counts
+    finally:
+        db.close()
+
+
+def recover_stale(older_than_s: float = OUTBOX_STALE_S) -> int:
+    """
+    Rows left in 'sending' by a crashed worker. The provider may already have
+    taken them, so they are failed ('interrupted') rather than re-sent.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(OutboxItem)
+            .filter(OutboxItem.status == "sending",
+                    OutboxItem.claimed_at < now - timedelta(seconds=older_than_s))
+            .all()
+        )
+        for item in rows:
+            _finish(db, item, "failed", now, error="interrupted")
+        db.commit()
+        if rows:
+            log.warning("Outbox: %d interrupted sends marked failed", len(rows))
+        return len(rows)
+    finally:
+        db.close()
+
+
+def backfill_lanes() -> int:
+    """Rows queued before lanes existed."""
+    db = SessionLocal()
+    try:
+        n = (
+            db.query(OutboxItem)
+            .filter(OutboxItem.lane.is_(None))
+            .update({"lane": case(lanes.LANE_OF_KIND, value=OutboxItem.kind, else_=lanes.CAMPAIGN)},
+                    synchronize_session=False)
+        )
+        db.commit()
+        return n
+    finally:
+        db.close()
+
+
+async def maintain() -> None:
+    """Singleton loop (services/leader.py): lane backfill, then interrupted-send recovery."""
+    await asyncio.to_thread(backfill_lanes)
+    while True:
+        await asyncio.to_thread(recover_stale)
+        await asyncio.sleep(max(30.0, OUTBOX_STALE_S / 2))
+
+
+def depth() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return dict(db.query(OutboxItem.status, func.count(OutboxItem.id)).group_by(OutboxItem.status).all())
+    finally:
+        db.close()
+
+
+# ==== Worker pool ====
+class OutboxWorkers:
+    """
+    N pick lane → claim → rate-limit → send_many → record loops sharing one
+    token bucket. Claims are capped at `burst` rows, so a bulk batch holds at
+    most ~burst/TPS seconds of tokens ahead of the next reply.
+    """
+
+    def __init__(self, provider, workers: int = OUTBOX_WORKERS, tps: float = OUTBOX_TPS / OUTBOX_PROCESSES,
+                 burst: float = OUTBOX_BURST / OUTBOX_PROCESSES, batch: int = OUTBOX_BATCH):
+        self.provider = provider
+        self.workers = max(1, int(workers))
+        self.bucket = TokenBucket(tps, burst)
+        self.batch = max(1, min(int(batch), int(self.bucket.burst)))
+        self._tasks: List[asyncio.Task] = []
+        self._inflight: set = set()
+        self._event: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.scheduler = lanes.WeightedRoundRobin(lanes.LANE_WEIGHTS)
+        self.stats: Dict[str, Any] = {"batches": 0, "sent": 0, "retried": 0, "failed": 0, "errors": 0,
+                                      "last_batch": 0, "throttled_s": 0.0}
+        self.lane_stats: Dict[str, Dict[str, Any]] = {
+            lane: {"weight": lanes.LANE_WEIGHTS[lane], "due": 0, "oldest_s": 0.0, "claimed": 0,
+                   "wait_ms_avg": None, "wait_ms_max": 0.0}
+            for lane in lanes.LANES
+        }
+
+    def wake(self) -> None:
+        """Safe from any thread; a no-op before start()."""
+        if self._loop is not None and self._event is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def start(self) -> None:
+        global _active
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        _active = self
+        log.info("Outbox: %d workers, %.1f TPS (burst %.0f, batch %d)",
+                 self.workers, self.bucket.rate, self.bucket.burst, self.batch)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        global _active
+        if _active is self:
+            _active = None
+        for t in self._tasks:
+            t.cancel()
+        # let batches already handed to the provider record their outcome
+        if self._inflight:
+            await asyncio.wait(self._inflight, timeout=timeout)
+        self._tasks = []
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout=OUTBOX_IDLE_S)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+
+    async def _send(self, items: List[Dict[str, Any]]) -> None:
+        waited = await self.bucket.acquire(len(items))
+        self.stats["throttled_s"] = round(self.stats["throttled_s"] + waited, 3)
+        try:
+            results = await self.provider.send_many(items)
+        except Exception as e:
+            log.exception("Outbox send error: %s", e)
+            results = [{"ok": False, "error": str(e), "retryable": True} for _ in items]
+        counts = await asyncio.to_thread(record, list(zip(items, results)))
+        for k, v in counts.items():
+            self.stats[k] += v
+
+    def _observe_due(self, due: Dict[str, Tuple[int, Optional[datetime]]]) -> None:
+        now = datetime.utcnow()
+        for lane, st in self.lane_stats.items():
+            n, oldest = due.get(lane, (0, None))
+            st["due"] = n
+            st["oldest_s"] = round((now - oldest).total_seconds(), 3) if oldest else 0.0
+
+    def _observe_claim(self, lane: str, items: List[Dict[str, Any]]) -> None:
+        st = self.lane_stats.get(lane)
+        if st is None:
+            return
+        st["claimed"] += len(items)
+        for it in items:
+            ms = it["wait_s"] * 1000
+            st["wait_ms_max"] = round(max(st["wait_ms_max"], ms), 1)
+            avg = st["wait_ms_avg"]
+            st["wait_ms_avg"] = round(ms if avg is None else 0.9 * avg + 0.1 * ms, 1)
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        due = await asyncio.to_thread(due_lanes)
+        self._observe_due(due)
+        lane = self.scheduler.pick(due)
+        if lane is None:
+            return []
+        items = await asyncio.to_thread(claim, self.batch, lane)
+        self._observe_claim(lane, items)
+        return items
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            try:
+                items = await self._next_batch()
+            except Exception:
+                self.stats["errors"] += 1
+                log.exception("Outbox claim error")
+                items = []
+            if not items:
+                await self._idle()
+                continue
+
+            self.stats["batches"] += 1
+            self.stats["last_batch"] = len(items)
+            # shielded: a shutdown cancel must not strand claimed rows in 'sending'
+            task = asyncio.ensure_future(self._send(items))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            await asyncio.shield(task)
+
+
+_active: Optional[OutboxWorkers] = None
+
+
+def wake() -> None:
+    """Nudge the running worker pool (if any) after committing enqueued rows."""
+    if _active is not None:
+        _active.wake()
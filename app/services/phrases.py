@@ -0,0 +1,219 @@
+# app/services/phrases.py
+"""
+DNC / stop phrase matching for inbound SMS, without the LLM.
+
+Phrases and messages are folded the same way: lowercase, homoglyphs mapped
+to Latin (Cyrillic "а" in "Nedominа"), accents stripped as in
+matcher._norm_fold, punctuation turned into word breaks. All phrases are
+compiled into Aho-Corasick automata, so a message is scanned once, in
+time linear in its length, however many phrases there are.
+
+A match sets a permanent DNC without the LLM, so how a phrase may match
+depends on where it comes from:
+  - built-in opt-outs (DNC_DEFAULT_PHRASES=0 turns them off) only count
+    when they are (nearly) the whole message: at most
+    DNC_SHORT_EXTRA_WORDS other words and no question mark ("STOP!",
+    "Nedomina, ačiū"), never "Jei šis nedomina, ar yra kitas objektas?"
+  - operator-curated phrases match on whole words anywhere:
+      - DNC_PHRASES env, comma-separated
+      - DNC_PHRASES_FILE (default app/data/dnc_phrases.txt), one per line, # comments
+      - the `phrases` table
+A change in the file or table (insert, edit or delete) is picked up within
+PHRASES_CHECK_SECONDS, no restart.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.storage.db import SessionLocal
+from app.storage.models import Phrase
+
+log = logging.getLogger("phrases")
+
+DNC_DEFAULT_PHRASES = os.getenv("DNC_DEFAULT_PHRASES", "1") == "1"
+DNC_PHRASES_FILE = Path(os.getenv(
+    "DNC_PHRASES_FILE", str(Path(__file__).resolve().parents[1] / "data" / "dnc_phrases.txt")
+))
+PHRASES_CHECK_S = float(os.getenv("PHRASES_CHECK_SECONDS", "10"))
+DNC_SHORT_EXTRA_WORDS = int(os.getenv("DNC_SHORT_EXTRA_WORDS", "2"))
+
+DEFAULT_PHRASES = [
+    "stop", "unsubscribe", "atsisakau", "nedomina", "nebedomina",
+    "nerasykite daugiau", "nebeserasykite", "nebesiuskite", "netrukdykite",
+    "istrinkite mano numeri",
+]
+
+# lookalikes that keep a word from matching (after lowercasing)
+_CONFUSABLES = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s",
+    "α": "a", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p", "τ": "t",
+    "0": "o",
+})
+
+
+def fold(text: str) -> str:
+    """Lowercase, homoglyphs → Latin, no accents, words separated by single spaces."""
+    t = unicodedata.normalize("NFKD", (text or "").lower().translate(_CONFUSABLES))
+    out = []
+    for c in t:
+        if unicodedata.combining(c):
+            continue
+        out.append(c if c.isalnum() else " ")
+    return " ".join("".join(out).split())
+
+
+class PhraseAutomaton:
+    """Aho-Corasick over folded phrases, anchored on word boundaries."""
+
+    def __init__(self, phrases: Dict[str, str]):
+        self.size = 0
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[Tuple[str, str]]] = [None]
+        for phrase, kind in phrases.items():
+            if phrase:
+                self._add(f" {phrase} ", (phrase, kind))
+        self._link()
+
+    def _add(self, key: str, out: Tuple[str, str]) -> None:
+        s = 0
+        for ch in key:
+            nxt = self._goto[s].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._goto[s][ch] = nxt
+            s = nxt
+        self._out[s] = out
+        self.size += 1
+
+    def _link(self) -> None:
+        q = deque(self._goto[0].values())
+        while q:
+            r = q.popleft()
+            for ch, u in self._goto[r].items():
+                q.append(u)
+                f = self._fail[r]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[u] = self._goto[f].get(ch, 0) if r else 0
+                # any phrase that ends here via a suffix counts too
+                self._out[u] = self._out[u] or self._out[self._fail[u]]
+
+    def search(self, folded: str) -> Optional[Tuple[str, str]]:
+        """First (phrase, kind) found in an already folded text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        s = 0
+        for ch in f" {folded} ":
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                return out[s]
+        return None
+
+
+def _table_rows() -> List[Tuple[str, str]]:
+    db = SessionLocal()
+    try:
+        return sorted((p, kind or "dnc") for p, kind in db.query(Phrase.phrase, Phrase.kind) if p)
+    finally:
+        db.close()
+
+
+def _load(rows: Optional[List[Tuple[str, str]]]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """(phrases matched anywhere, built-ins matched only as a short whole message)"""
+    curated: Dict[str, str] = {}
+    curated.update((fold(p), "dnc") for p in os.getenv("DNC_PHRASES", "").split(",") if p.strip())
+    if DNC_PHRASES_FILE.exists():
+        for line in DNC_PHRASES_FILE.read_text(encoding="utf-8").splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                curated[fold(line)] = "dnc"
+    curated.update((fold(p), kind) for p, kind in rows or ())
+    curated.pop("", None)
+    builtin = {fold(p): "dnc" for p in DEFAULT_PHRASES} if DNC_DEFAULT_PHRASES else {}
+    for p in curated:
+        builtin.pop(p, None)  # listed by the operator: matches anywhere
+    return curated, builtin
+
+
+def _signature() -> Tuple[tuple, Optional[List[Tuple[str, str]]]]:
+    """
+    Change detector: file mtime/size + a digest of the table's rows (the
+    table is a short list, so reading it is cheap and edits in place count).
+    Returns (signature, rows); rows is None if the table is not readable.
+    """
+    try:
+        st = DNC_PHRASES_FILE.stat()
+        file_sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        file_sig = None
+    try:
+        rows = _table_rows()
+        table_sig = hashlib.sha1(repr(rows).encode("utf-8")).hexdigest()
+    except Exception:
+        log.exception("phrases table not readable; using built-in/env/file phrases")
+        rows, table_sig = None, None
+    return (file_sig, table_sig), rows
+
+
+class PhraseMatcher:
+    """The current automata, rebuilt when a source changes (checked at most every PHRASES_CHECK_SECONDS)."""
+
+    def __init__(self, check_s: float = PHRASES_CHECK_S):
+        self.check_s = check_s
+        self._automata: Optional[Tuple[PhraseAutomaton, PhraseAutomaton]] = None
+        self._sig: Optional[tuple] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _current(self) -> Tuple[PhraseAutomaton, PhraseAutomaton]:
+        now = time.monotonic()
+        if self._automata is not None and now - self._checked < self.check_s:
+            return self._automata
+        with self._lock:
+            if self._automata is not None and now - self._checked < self.check_s:
+                return self._automata
+            self._checked = now
+            try:
+                sig, rows = _signature()
+                if self._automata is None or sig != self._sig:
+                    curated, builtin = _load(rows)
+                    self._automata, self._sig = (PhraseAutomaton(curated), PhraseAutomaton(builtin)), sig
+                    self.reloads += 1
+                    log.info("DNC phrases loaded: %d curated, %d built-in", len(curated), len(builtin))
+            except Exception:
+                log.exception("DNC phrase reload failed; keeping the previous set")
+                if self._automata is None:
+                    self._automata = (PhraseAutomaton({}), PhraseAutomaton({}))
+            return self._automata
+
+    def match(self, text: str) -> Optional[Tuple[str, str]]:
+        """(phrase, kind) of the first phrase in `text`, or None."""
+        curated, builtin = self._current()
+        folded = fold(text)
+        hit = curated.search(folded)
+        if hit or "?" in (text or ""):
+            return hit
+        hit = builtin.search(folded)
+        if hit and len(folded.split()) <= len(hit[0].split()) + DNC_SHORT_EXTRA_WORDS:
+            return hit
+        return None
+
+
+matcher = PhraseMatcher()
+
+
+def match(text: str) -> Optional[Tuple[str, str]]:
+    return matcher.match(text)
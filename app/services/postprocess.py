@@ -0,0 +1,185 @@
+# app/services/postprocess.py
+"""
+Single-pass reply post-processor.
+
+The reply is split into sentences once; each sentence is lower-cased once and
+tagged with every guard pattern in the same pass. The guards then run as
+cheap filters over the tagged list instead of re-splitting the text per rule.
+Output is identical to the legacy chain of _strip_* helpers in llm.py, raw
+whitespace included: when no guard re-splits the reply, the model's own
+separators (newlines) are kept, as they were there.
+"""
+import re
+from typing import Callable, List, Pattern, Tuple
+
+_SENT_SPLIT = re.compile(r"(?<=[\.\!\?])\s+")
+_MULTI_WS = re.compile(r"\s{2,}")
+_LATIN_WORD = re.compile(r"[A-Za-z]{3,}")
+_LT_CHARS = re.compile(r"[ĄČĘĖĮŠŲŪŽąčęėįšųūž]")
+
+# Tag bits
+SALARY = 1      # phone-only topic (pay, clients, exact location…)
+AVAIL_Q = 2     # availability question
+PROBE = 4       # "Ką manote?"-style probe
+VALUE = 8       # the value line
+
+AVAIL_PHRASES = ("kada galėtumėte pradėti", "koks grafikas tinka")
+
+
+class Sentence:
+    __slots__ = ("text", "tags")
+
+    def __init__(self, text: str, tags: int):
+        self.text = text
+        self.tags = tags
+
+
+class ReplyPostProcessor:
+    def __init__(
+        self,
+        value_line: str,
+        salary_pat: Pattern,
+        probe_pat: Pattern,
+        label_pat: Pattern,
+        years_question: str,
+        non_lt_reply: str,
+    ):
+        self.value_line = value_line.lower()
+        self.salary_pat = salary_pat
+        self.probe_pat = probe_pat
+        self.label_pat = label_pat
+        self.years_question = years_question
+        self.non_lt_reply = non_lt_reply
+
+    # ---------- tagging ----------
+    def _tag_clean(self, text: str) -> int:
+        """PROBE/VALUE bits; evaluated on label-free text."""
+        tags = 0
+        if self.probe_pat.search(text):
+            tags |= PROBE
+        if self.value_line in text.lower():
+            tags |= VALUE
+        return tags
+
+    def tokenize(self, reply: str) -> Tuple[List[Sentence], List[bool]]:
+        """
+        Split once and tag. Returns (sentences, has_label) – SALARY and AVAIL_Q
+        are tagged on the raw text, PROBE/VALUE after label scrubbing, which
+        mirrors the order the guards have always run in.
+        """
+        out, labels = [], []
+        for raw in _SENT_SPLIT.split(reply or ""):
+            raw = raw.strip()
+            if not raw:
+                continue
+            low = raw.lower()
+            tags = 0
+            if self.salary_pat.search(raw):
+                tags |= SALARY
+            if AVAIL_PHRASES[0] in low or AVAIL_PHRASES[1] in low:
+                tags |= AVAIL_Q
+            has_label = bool(self.label_pat.search(raw))
+            if not has_label:
+                if self.probe_pat.search(raw):
+                    tags |= PROBE
+                if self.value_line in low:
+                    tags |= VALUE
+            out.append(Sentence(raw, tags))
+            labels.append(has_label)
+        return out, labels
+
+    # ---------- filters ----------
+    @staticmethod
+    def _drop(sents: List[Sentence], bit: int, keep_if_empty: bool = True) -> List[Sentence]:
+        kept = [s for s in sents if not s.tags & bit]
+        if not kept and keep_if_empty:
+            return sents
+        return kept
+
+    def run(
+        self,
+        reply: str,
+        *,
+        strip_salary: bool,
+        years_known: bool,
+        history_has_probe: Callable[[], bool],
+        history_has_value: Callable[[], bool],
+        strip_extras: bool,
+    ) -> Tuple[str, bool]:
+        """
+        strip_salary:      drop phone-only sentences (user didn't ask about them)
+        years_known:       availability may be asked
+        history_has_probe: a probe was already sent in this thread (lazy)
+        history_has_value: the value line was already sent in this thread (lazy)
+        strip_extras:      decline / maybe-later / unrelated / info-seeking turn
+        Returns (reply, rewritten) like llm._postprocess.
+        """
+        sents, labels = self.tokenize(reply)
+        rewritten = False
+        # Did a guard re-split the reply and join it with single spaces? If none
+        # did, the legacy chain kept the model's own separators (e.g. "\n").
+        joined = False
+
+        if strip_salary:
+            kept = self._drop(sents, SALARY)
+            joined = any(not s.tags & SALARY for s in sents)
+            if len(kept) != len(sents):
+                rewritten = True
+                labels = [lab for s, lab in zip(sents, labels) if not s.tags & SALARY]
+            sents = kept
+
+        if not years_known and any(s.tags & AVAIL_Q for s in sents):
+            sents, labels = [Sentence(self.years_question, self._tag_clean(self.years_question))], [False]
+            rewritten = True
+            joined = True
+
+        # Label scrubbing + whitespace squeeze (not counted as a rewrite)
+        scrubbed = []
+        for s, lab in zip(sents, labels):
+            if lab:
+                text = _MULTI_WS.sub(" ", self.label_pat.sub("", s.text)).strip()
+                if not text:
+                    continue
+                s = Sentence(text, (s.tags & (SALARY | AVAIL_Q)) | self._tag_clean(text))
+            else:
+                s.text = _MULTI_WS.sub(" ", s.text)
+            scrubbed.append(s)
+        sents = scrubbed
+
+        # History is only scanned when the reply carries something to drop, or
+        # to learn whether the legacy chain would have re-joined the sentences
+        n = len(sents)
+        tagged = 0
+        for s in sents:
+            tagged |= s.tags
+        if strip_extras or (tagged & PROBE and history_has_probe()):
+            joined |= any(not s.tags & PROBE for s in sents)
+            sents = self._drop(sents, PROBE)
+        if strip_extras:
+            joined |= any(not s.tags & VALUE for s in sents)
+            if tagged & VALUE:
+                sents = self._drop(sents, VALUE)
+        if (tagged & VALUE or not joined) and history_has_value():
+            joined = True
+            if tagged & VALUE:
+                sents = self._drop(sents, VALUE, keep_if_empty=False)
+        rewritten |= len(sents) != n
+
+        if joined:
+            text = " ".join(s.text for s in sents)
+        else:
+            # nothing was dropped: the reply as the legacy chain leaves it
+            text = _MULTI_WS.sub(" ", self.label_pat.sub("", reply or "").strip())
+
+        # Only one question max
+        if text.count("?") > 1:
+            first_q = text.split("?")[0] + "?"
+            text = first_q if len(first_q) <= 160 else (first_q[:157] + "…")
+            rewritten = True
+
+        # Enforce Lithuanian heuristic
+        if _LATIN_WORD.search(text) and not _LT_CHARS.search(text):
+            text = self.non_lt_reply
+            rewritten = True
+
+        return text, rewritten
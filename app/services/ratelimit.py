@@ -0,0 +1,36 @@
+# app/services/ratelimit.py
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens/s, up to `burst` saved up.
+    acquire(n) reserves n tokens right away (the balance may go negative)
+    and sleeps off the debt, so concurrent callers are served in call order
+    and a batch larger than `burst` is simply spread over time.
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = max(0.001, float(rate))
+        self.burst = max(1.0, float(burst if burst is not None else rate))
+        self._tokens = self.burst
+        self._t = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._t) * self.rate)
+        self._t = now
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    async def acquire(self, n: float = 1) -> float:
+        """Take n tokens; returns the seconds waited."""
+        self._refill()
+        self._tokens -= n
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
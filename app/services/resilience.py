@@ -0,0 +1,153 @@
+# app/services/resilience.py
+import time
+import random
+import logging
+import threading
+from typing import Callable, Optional, Tuple, Type, TypeVar
+
+log = logging.getLogger("resilience")
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling upstream while the breaker is open."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a call's overall deadline is spent before it succeeded."""
+
+
+# ==== Circuit breaker ====
+class CircuitBreaker:
+    """
+    Classic closed → open → half-open breaker, safe to share between threads.
+      - closed: calls pass; `failure_threshold` consecutive failures open it
+      - open: calls are refused for `reset_seconds`
+      - half-open: a single trial call; success closes, failure re-opens
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state_locked()
+
+    def _state_locked(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            st = self._state_locked()
+            if st == "closed":
+                return True
+            if st == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                log.info("breaker %s closed", self.name)
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """The call ended without telling us anything about upstream (e.g. cancelled)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            half_open_trial = self._trial_in_flight
+            self._trial_in_flight = False
+            if half_open_trial or self._failures >= self.failure_threshold:
+                if self._opened_at is None or half_open_trial:
+                    log.warning("breaker %s opened after %d failures", self.name, self._failures)
+                self._opened_at = time.monotonic()
+
+
+# ==== Retries with deadline ====
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff (attempt is 0-based)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def call_with_retries(
+    fn: Callable[[float], T],
+    *,
+    deadline_s: float,
+    attempts: int = 3,
+    base_delay: float = 0.25,
+    max_delay: float = 2.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+    alive_on: Tuple[Type[BaseException], ...] = (),
+    breaker: Optional[CircuitBreaker] = None,
+    name: str = "call",
+) -> T:
+    """
+    Call fn(remaining_seconds) until it succeeds, the attempts run out or the
+    overall deadline passes. fn should use remaining_seconds as its own timeout.
+    Only `retry_on` errors are retried; anything else propagates immediately.
+    For the breaker, `retry_on` errors and other exceptions are failures,
+    `alive_on` errors (upstream answered, the request was wrong: e.g. 400)
+    are successes, and cancellation leaves its state alone.
+    """
+    start = time.monotonic()
+    last_exc: Optional[BaseException] = None
+    for attempt in range(max(1, attempts)):
+        remaining = deadline_s - (time.monotonic() - start)
+        if remaining <= 0:
+            break
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"{name}: circuit {breaker.name} is open")
+        try:
+            out = fn(remaining)
+        except retry_on as e:
+            last_exc = e
+            if breaker is not None:
+                breaker.record_failure()
+            log.warning("%s attempt %d failed: %s", name, attempt + 1, e)
+        except alive_on:
+            # Upstream answered (e.g. 400) – it's alive, don't hold the breaker.
+            if breaker is not None:
+                breaker.record_success()
+            raise
+        except Exception:
+            # not worth retrying, but no proof upstream works either (auth, bugs)
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            # cancelled / interrupted: says nothing about upstream
+            if breaker is not None:
+                breaker.release_trial()
+            raise
+        else:
+            if breaker is not None:
+                breaker.record_success()
+            return out
+
+        if attempt + 1 < attempts:
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            remaining = deadline_s - (time.monotonic() - start)
+            if delay >= remaining:
+                break
+            time.sleep(delay)
+
+    raise DeadlineExceeded(f"{name}: gave up after {deadline_s:.1f}s") from last_exc
@@ -0,0 +1,113 @@
+# app/services/schedule.py
+"""
+Business-hours window and campaign pacing.
+
+All times are local wall-clock (same as the old within_business_hours()).
+  - BUSINESS_HOURS  "09:00-18:00"
+  - BUSINESS_DAYS   weekdays that have a window, 0=Mon … 6=Sun (default all)
+  - SKIP_BUSINESS_HOURS=1 → always open
+Pacing spreads what is left of a campaign evenly over what is left of
+today's window (CAMPAIGN_PACING=even), or sends at full TPS (fast); either
+way it never exceeds CAMPAIGN_TPS, and whatever does not fit rolls over to
+the next window.
+"""
+import os
+import math
+from datetime import datetime, timedelta, time as dtime
+from typing import Any, Dict, Optional
+
+SKIP_BH = os.getenv("SKIP_BUSINESS_HOURS", "0") == "1"
+PER_PERSON_MIN_SECONDS = int(os.getenv("PER_PERSON_MIN_SECONDS", "90"))
+CAMPAIGN_TPS = float(os.getenv("CAMPAIGN_TPS", os.getenv("OUTBOX_TPS", "10")))
+CAMPAIGN_PACING = os.getenv("CAMPAIGN_PACING", "even")  # even | fast
+
+
+def _parse_hours(raw: str):
+    start, _, end = raw.partition("-")
+    h1, m1 = (int(x) for x in start.strip().split(":"))
+    h2, m2 = (int(x) for x in end.strip().split(":"))
+    return dtime(h1, m1), dtime(h2, m2)
+
+
+OPEN_AT, CLOSE_AT = _parse_hours(os.getenv("BUSINESS_HOURS", "09:00-18:00"))
+DAYS = {int(d) for d in os.getenv("BUSINESS_DAYS", "0,1,2,3,4,5,6").split(",") if d.strip().isdigit()}
+
+WINDOW_LABEL = f"{OPEN_AT:%H:%M}–{CLOSE_AT:%H:%M}"
+
+
+def is_open(now: Optional[datetime] = None) -> bool:
+    if SKIP_BH:
+        return True
+    now = now or datetime.now()
+    return now.weekday() in DAYS and OPEN_AT <= now.time() < CLOSE_AT
+
+
+def next_open(now: Optional[datetime] = None) -> datetime:
+    """Start of the next window (now, if the window is open)."""
+    now = now or datetime.now()
+    if is_open(now) or not DAYS:
+        return now
+    day = now.date()
+    if now.time() >= OPEN_AT:
+        day += timedelta(days=1)
+    for _ in range(8):
+        if day.weekday() in DAYS:
+            return datetime.combine(day, OPEN_AT)
+        day += timedelta(days=1)
+    return now
+
+
+def remaining_seconds(now: Optional[datetime] = None) -> float:
+    """Seconds left in the current window (0 when closed, inf when hours are skipped)."""
+    if SKIP_BH:
+        return math.inf
+    now = now or datetime.now()
+    if not is_open(now):
+        return 0.0
+    return (datetime.combine(now.date(), CLOSE_AT) - now).total_seconds()
+
+
+def pace_rate(remaining: int, now: Optional[datetime] = None, tps: float = CAMPAIGN_TPS) -> float:
+    """Messages/s to feed right now so `remaining` is spread over the window."""
+    left = remaining_seconds(now)
+    if left <= 0 or remaining <= 0:
+        return 0.0
+    if CAMPAIGN_PACING == "fast" or math.isinf(left):
+        return tps
+    return min(tps, remaining / left)
+
+
+def plan(remaining: int, now: Optional[datetime] = None, tps: float = CAMPAIGN_TPS) -> Dict[str, Any]:
+    """
+    How many of `remaining` fit in the current (or next) window at `tps`,
+    and when the last one should go out. Windows are walked day by day.
+    """
+    now = now or datetime.now()
+    t = start = next_open(now)
+    first = remaining_seconds(start)
+    fits = remaining if math.isinf(first) else int(tps * first)
+    n = remaining
+    eta = t
+    days = 0
+    while n > 0 and days < 366:
+        left = remaining_seconds(t)
+        if math.isinf(left):
+            eta = t + timedelta(seconds=n / tps)
+            break
+        cap = tps * left
+        if n <= cap:
+            eta = t + timedelta(seconds=left if CAMPAIGN_PACING == "even" else n / tps)
+            break
+        n -= cap
+        t = next_open(t + timedelta(seconds=left))
+        days += 1
+    return {
+        "remaining": remaining,
+        "open": is_open(now),
+        "window": WINDOW_LABEL,
+        "next_open": None if is_open(now) else start.isoformat(timespec="minutes"),
+        "fits_this_window": min(remaining, fits),
+        "tps": tps,
+        "pacing": CAMPAIGN_PACING,
+        "eta": eta.isoformat(timespec="minutes") if remaining else None,
+    }
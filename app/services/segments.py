@@ -0,0 +1,138 @@
+# app/services/segments.py
+"""
+SMS encoding and segment counting.
+
+A message that fits the GSM 03.38 alphabet goes out as GSM-7: 160 septets
+in one segment, 153 per segment once concatenated (extension characters
+such as € or [ take two septets and never straddle a segment). Anything
+else forces UCS-2: 70 UTF-16 units, 67 per concatenated segment (emoji are
+surrogate pairs, two units, never split). One Lithuanian letter (ą, č, ė,
+š, ž…) therefore turns a 160-char reply into 3 billed segments.
+
+finalize() is what every outgoing text passes through:
+  - whitespace collapsed
+  - if typographic characters / emoji are all that keep the text out of
+    GSM-7, they are transliterated ("…" → "...", 🙂 → ":)"); with
+    SMS_FOLD_DIACRITICS=1 Lithuanian letters are folded too (ą → a)
+  - then trimmed to SMS_MAX_SEGMENTS: whole sentences from the end (a
+    question is kept over the statements around it), words with an
+    ellipsis only if a single sentence is still too long
+"""
+import os
+import re
+import unicodedata
+from typing import Dict, List
+
+SMS_MAX_SEGMENTS = int(os.getenv("SMS_MAX_SEGMENTS", "2"))
+SMS_FOLD_DIACRITICS = os.getenv("SMS_FOLD_DIACRITICS", "0") == "1"
+
+GSM7, UCS2 = "GSM-7", "UCS-2"
+
+_GSM_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+_GSM_EXT = set("^{}\\[~]|€\f")
+
+# single / concatenated segment capacity, in septets (GSM-7) or UTF-16 units (UCS-2)
+_LIMITS = {GSM7: (160, 153), UCS2: (70, 67)}
+
+# characters that only look different from a GSM-7 equivalent
+_TRANSLIT = {
+    "…": "...", "—": "-", "–": "-", "‑": "-", "−": "-", "•": "-",
+    "„": '"', "“": '"', "”": '"', "«": '"', "»": '"',
+    "‘": "'", "’": "'", "‚": "'", "´": "'", "`": "'",
+    "\u00a0": " ", "\u2009": " ", "\u202f": " ",
+    "🙂": ":)", "😊": ":)", "☺": ":)", "😀": ":D", "😃": ":D", "😄": ":D", "😁": ":D",
+    "😉": ";)", "🙁": ":(", "☹": ":(", "😞": ":(", "😅": ":)", "😂": ":D",
+}
+_DROP = {"\ufe0f", "\u200d", "\u200b"}  # variation selector, joiners
+
+
+def is_gsm7(text: str) -> bool:
+    return all(c in _GSM_BASIC or c in _GSM_EXT for c in text)
+
+
+def encoding(text: str) -> str:
+    return GSM7 if is_gsm7(text) else UCS2
+
+
+def _costs(text: str, enc: str) -> List[int]:
+    if enc == GSM7:
+        return [2 if c in _GSM_EXT else 1 for c in text]
+    return [2 if ord(c) > 0xFFFF else 1 for c in text]
+
+
+def count(text: str) -> int:
+    """Billed segments for `text` (0 for an empty text)."""
+    return info(text)["segments"]
+
+
+def info(text: str) -> Dict[str, object]:
+    """{"encoding", "units", "segments", "per_segment", "remaining"} for `text`."""
+    enc = encoding(text)
+    costs = _costs(text, enc)
+    single, multi = _LIMITS[enc]
+    units = sum(costs)
+    if units <= single:
+        n, per, used = (1 if units else 0), single, units
+    else:
+        n, per, used = 1, multi, 0
+        for c in costs:
+            if used + c > multi:  # a two-unit character never straddles segments
+                n, used = n + 1, 0
+            used += c
+    return {"encoding": enc, "units": units, "segments": n, "per_segment": per, "remaining": per - used}
+
+
+def to_gsm7(text: str, fold_diacritics: bool = SMS_FOLD_DIACRITICS) -> str:
+    """Best-effort GSM-7 rendering: typography and emoji transliterated or dropped."""
+    out = []
+    for c in text:
+        if c in _GSM_BASIC or c in _GSM_EXT:
+            out.append(c)
+        elif c in _TRANSLIT:
+            out.append(_TRANSLIT[c])
+        elif c in _DROP or ord(c) > 0xFFFF or unicodedata.category(c) == "So":
+            continue  # other emoji / pictographs
+        elif fold_diacritics:
+            base = unicodedata.normalize("NFKD", c)
+            out.append("".join(b for b in base if not unicodedata.combining(b)))
+        else:
+            out.append(c)
+    return re.sub(r" {2,}", " ", "".join(out)).strip()
+
+
+_SENT_SPLIT = re.compile(r"(?<=[.!?…])\s+")
+
+
+def fit(text: str, max_segments: int = SMS_MAX_SEGMENTS) -> str:
+    """Trim `text` to at most `max_segments`: sentences first, then words."""
+    if max_segments <= 0 or count(text) <= max_segments:
+        return text
+    sents = _SENT_SPLIT.split(text)
+    while len(sents) > 1 and count(" ".join(sents)) > max_segments:
+        # the question is what the reply is for: drop other sentences first, from the end
+        drop = next((i for i in range(len(sents) - 1, -1, -1) if not sents[i].endswith("?")), len(sents) - 1)
+        del sents[drop]
+    text = " ".join(sents)
+    if count(text) <= max_segments:
+        return text
+    ell = "…" if encoding(text) == UCS2 else "..."
+    words = text.split(" ")
+    while len(words) > 1 and count(" ".join(words) + ell) > max_segments:
+        words.pop()
+    text = " ".join(words).rstrip(" ,;:-")
+    while text and count(text + ell) > max_segments:  # one very long word
+        text = text[:-1]
+    return text + ell
+
+
+def finalize(text: str, max_segments: int = SMS_MAX_SEGMENTS) -> str:
+    """Outgoing SMS text: normalized, GSM-7 when that is only a transliteration away, within budget."""
+    text = re.sub(r"\s+", " ", (text or "")).strip()
+    if not is_gsm7(text):
+        gsm = to_gsm7(text)
+        if gsm and is_gsm7(gsm):
+            text = gsm
+    return fit(text, max_segments)
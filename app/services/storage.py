@@ -49,6 +49,8 @@ COLMAP = {
 }
 
 CANON_ORDER = ["match_id", "Miestas", "Specialybė", "Tel. nr", "sms_text"]
+# kept when present: contact state from the DB (routers/admin.py annotates)
+CANON_EXTRA = ["dnc", "thread_id"]
 
 def _normalize_headers(df: pd.DataFrame) -> pd.DataFrame:
     new_cols = []
@@ -106,7 +108,7 @@ def save_matches_df(df: pd.DataFrame) -> None:
     for col in CANON_ORDER:
         if col not in df.columns:
             df[col] = ""
-    df = df[CANON_ORDER].fillna("")
+    df = df[CANON_ORDER + [c for c in CANON_EXTRA if c in df.columns]].fillna("")
     df.to_json(CACHE_MATCHES, orient="records", force_ascii=False)
 
 def load_matches() -> list[dict]:
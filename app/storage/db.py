@@ -1,7 +1,10 @@
 import os
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from app.util import metrics
+
 # Choose DB from env; default to local SQLite for dev
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dev.db")
 
@@ -12,6 +15,36 @@ engine = create_engine(
     connect_args=connect_args,
     pool_pre_ping=True,
 )
+metrics.instrument_engine(engine)
 
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 Base = declarative_base()
+
+
+def ensure_columns() -> list[str]:
+    """
+    create_all() only creates missing tables; add columns (nullable, no
+    default) and indexes that models gained since a table was created.
+    """
+    insp = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have:
+                    ddl = col.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {ddl}"))
+                    added.append(f"{table.name}.{col.name}")
+    for table in Base.metadata.sorted_tables:
+        for idx in table.indexes:
+            try:
+                idx.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                # e.g. a unique index over rows that predate it; the app still dedups
+                logging.getLogger("db").warning("Index %s not created: %s", idx.name, e)
+    if added:
+        logging.getLogger("db").info("Added columns: %s", ", ".join(added))
+    return added
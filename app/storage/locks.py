@@ -0,0 +1,125 @@
+# app/storage/locks.py
+"""
+Cross-process locks for running several uvicorn workers on one database.
+
+Postgres: a session-level advisory lock (pg_advisory_lock) on a connection
+held for as long as the lock is. Otherwise (SQLite): flock() on a lock file
+next to the database. Either way the lock goes away with the process, so a
+crashed holder never blocks the others.
+"""
+import os
+import zlib
+import logging
+import tempfile
+from typing import Optional
+
+from sqlalchemy import text
+
+from app.storage.db import engine
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: a single process is assumed
+    fcntl = None
+
+log = logging.getLogger("locks")
+
+
+def _key(name: str) -> int:
+    return zlib.crc32(name.encode()) & 0x7FFFFFFF
+
+
+def _lock_path(name: str) -> str:
+    d = os.getenv("LOCK_DIR")
+    if not d:
+        db = engine.url.database if engine.dialect.name == "sqlite" else None
+        d = os.path.dirname(os.path.abspath(db)) if db and db != ":memory:" else tempfile.gettempdir()
+    return os.path.join(d, f".sms-bot.{name}.lock")
+
+
+class HeldLock:
+    """
+    A named lock held until release() or process exit.
+    acquire(blocking=False) is a try-lock; `with HeldLock(name):` waits.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.backend = "pg-advisory" if engine.dialect.name == "postgresql" else ("flock" if fcntl else "none")
+        self._conn = None
+        self._fd: Optional[int] = None
+        self._nolock = False  # backend "none": nothing to hold, just remember we "have" it
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None or self._fd is not None or self._nolock
+
+    def acquire(self, blocking: bool = False) -> bool:
+        if self.held:
+            return True
+        if self.backend == "pg-advisory":
+            conn = engine.connect()
+            try:
+                if blocking:
+                    conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": _key(self.name)})
+                    ok = True
+                else:
+                    ok = bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _key(self.name)}).scalar())
+                conn.commit()  # the lock is session-level; don't sit idle in a transaction
+            except Exception:
+                conn.close()
+                raise
+            if not ok:
+                conn.close()
+                return False
+            self._conn = conn
+            return True
+        if self.backend == "flock":
+            fd = os.open(_lock_path(self.name), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+        self._nolock = True
+        return True
+
+    def alive(self) -> bool:
+        """Still ours? (a dropped Postgres session has released the lock)"""
+        if self._conn is not None:
+            try:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            except Exception:
+                log.warning("Lock %s: holder connection lost", self.name)
+                self.release()
+                return False
+        return self.held
+
+    def release(self) -> None:
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _key(self.name)})
+                conn.commit()
+            except Exception:
+                pass  # closing the session releases it anyway
+            finally:
+                conn.close()
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            try:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+        self._nolock = False
+
+    def __enter__(self) -> "HeldLock":
+        self.acquire(blocking=True)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .db import Base
@@ -16,6 +16,13 @@ class Thread(Base):
     status = Column(String, default="open")  # open/closed
     last_user_ts = Column(DateTime)
 
+    # one open thread per phone, also when two deliveries for it race
+    __table_args__ = (
+        Index("uq_threads_open_phone", "phone", unique=True,
+              postgresql_where=(status == "open"),
+              sqlite_where=(status == "open")),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -23,6 +30,71 @@ class Message(Base):
     dir = Column(String)           # in | out
     body = Column(Text)
     ts = Column(DateTime, default=datetime.utcnow)
-    status = Column(String)        # queued/sent/delivered/failed
-    provider_id = Column(String)   # external id (for later)
+    status = Column(String)        # out: queued/sent/delivered/failed; in: pending (awaiting a reply turn)/delivered
+    provider_id = Column(String, index=True)   # external id (DLR lookups)
     userref = Column(String)       # your idempotency key
+    segments = Column(Integer)     # billed SMS segments (outbound; services/segments.py)
+
+    # idempotency: one inbound row per provider messageId, one outbound per userref
+    __table_args__ = (
+        Index("uq_messages_in_provider_id", "provider_id", unique=True,
+              postgresql_where=(dir == "in") & provider_id.isnot(None),
+              sqlite_where=(dir == "in") & provider_id.isnot(None)),
+        Index("uq_messages_out_userref", "userref", unique=True,
+              postgresql_where=(dir == "out") & userref.isnot(None),
+              sqlite_where=(dir == "out") & userref.isnot(None)),
+        # inbound rows still waiting for a reply turn (main._inbound_sweep)
+        Index("ix_messages_in_pending", "ts",
+              postgresql_where=(dir == "in") & (status == "pending"),
+              sqlite_where=(dir == "in") & (status == "pending")),
+    )
+
+class OutboxItem(Base):
+    __tablename__ = "outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    message_id = Column(Integer, ForeignKey("messages.id"))
+    phone = Column(String, index=True)
+    body = Column(Text)
+    userref = Column(String)
+    kind = Column(String)          # manual/batch/admin/llm-reply/dnc-goodbye
+    lane = Column(String, index=True)  # conversation/manual/campaign (services/lanes.py)
+    status = Column(String, default="queued", index=True)  # queued/sending/sent/failed
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claimed_at = Column(DateTime)
+    provider_id = Column(String)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String)
+    filter_city = Column(String)
+    filter_prof = Column(String)
+    status = Column(String, default="running", index=True)  # running/paused/done/cancelled
+    total = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+class CampaignRecipient(Base):
+    __tablename__ = "campaign_recipients"
+    __table_args__ = (UniqueConstraint("campaign_id", "phone", name="uq_campaign_recipient_phone"),)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), index=True)
+    match_id = Column(String)
+    phone = Column(String)
+    body = Column(Text)
+    status = Column(String, default="pending", index=True)  # pending/queued/skipped (then see outbox)
+    outbox_id = Column(Integer, ForeignKey("outbox.id"))
+    not_before = Column(DateTime)  # per-person throttle deferral (UTC)
+    error = Column(Text)
+
+class Phrase(Base):
+    __tablename__ = "phrases"      # extra DNC/stop phrases, hot-reloaded by services/phrases.py
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    phrase = Column(String, unique=True)
+    kind = Column(String, default="dnc")
+    created_at = Column(DateTime, default=datetime.utcnow)
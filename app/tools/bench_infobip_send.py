@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Per-send latency / throughput of InfobipProvider.send against a local stub
+of /sms/2/text/advanced, comparing the old transport (requests.post in a
+thread, new connection per SMS) with the shared pooled httpx client.
+
+  python -m app.tools.bench_infobip_send -n 2000 -c 20 --delay-ms 5
+"""
+import argparse, asyncio, json, os, statistics, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _stub_server(delay_ms: float) -> ThreadingHTTPServer:
+    class H(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(n) or b"{}")
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            msgs = [
+                {"to": d["to"], "messageId": f"stub-{time.time_ns()}", "status": {"groupName": "PENDING"}}
+                for m in req.get("messages", []) for d in m.get("destinations", [])
+            ]
+            body = json.dumps({"messages": msgs}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+async def _legacy_send(base: str, to: str, text: str) -> str:
+    import requests  # the pre-transport implementation
+    payload = {"messages": [{"from": "bench", "destinations": [{"to": to}], "text": text}]}
+    r = await asyncio.to_thread(
+        lambda: requests.post(f"{base}/sms/2/text/advanced", headers={"Authorization": "App x"},
+                              data=json.dumps(payload), timeout=(5, 15))
+    )
+    return r.json()["messages"][0]["messageId"]
+
+async def _run(label: str, send, n: int, concurrency: int):
+    sem = asyncio.Semaphore(concurrency)
+    lat = []
+
+    async def one(i: int):
+        async with sem:
+            t0 = time.perf_counter()
+            await send(f"3706{i:07d}", "Sveiki! Bandomoji žinutė.")
+            lat.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    print(f"{label:8s} n={n} c={concurrency}  p50={statistics.median(lat):6.2f}ms  "
+          f"p95={lat[int(len(lat) * 0.95) - 1]:6.2f}ms  throughput={n / wall:8.1f}/s")
+
+async def main_async(args):
+    srv = _stub_server(args.delay_ms)
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    os.environ.update({"INFOBIP_API_BASE": base, "INFOBIP_API_KEY": "bench", "INFOBIP_SENDER": "bench"})
+
+    from app.providers import transport
+    from app.providers.infobip import InfobipProvider
+    prov = InfobipProvider(dry_run=False)
+    await transport.startup()
+    try:
+        if not args.skip_legacy:
+            await _run("legacy", lambda to, text: _legacy_send(base, to, text), args.n, args.concurrency)
+        await _run("pooled", prov.send, args.n, args.concurrency)
+    finally:
+        await transport.shutdown()
+        srv.shutdown()
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark Infobip send transport against a local stub.")
+    p.add_argument("-n", type=int, default=1000, help="messages")
+    p.add_argument("-c", "--concurrency", type=int, default=20)
+    p.add_argument("--delay-ms", type=float, default=0.0, help="stub server latency")
+    p.add_argument("--skip-legacy", action="store_true")
+    asyncio.run(main_async(p.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Replay + microbenchmark for the reply post-processor.
+
+Runs every case through the legacy multi-pass guards and the single-pass
+engine, fails on any difference in the raw (reply, rewritten) output, before
+_final_sms (golden check), then times both.
+
+  python -m app.tools.bench_postprocess                    # synthetic corpus
+  python -m app.tools.bench_postprocess --corpus replay.jsonl
+
+Corpus lines: {"reply": str, "plan": {...}, "history": [...], "user_text": str}
+"""
+import argparse, json, random, sys, time
+
+from app.services import llm as L
+
+FRAGMENTS = [
+    "Kiek metų patirties turite?", "Ką manote?", "Kaip manote?", L.VALUE_LINE,
+    "Atlygį aptarsime telefonu su kolega.", "Nuo kada galėtumėte pradėti?",
+    "Koks grafikas tinka?", "Suprantu, esate atsargus.", "Gerai!",
+    "Projektas – statybos darbai objekte.", "Ačiū  už   atsakymą.",
+    "Klientas Vilniuje!", "Tikrai?\nGerai.", "Sounds good to me.",
+    "Gerai.\n\nKą manote?", "Suprantu.\nEsate atsargi.", "Ačiū!\n",
+]
+USER_TEXTS = ["kiek moka?", "taip, domina", "nedomina", "gal vėliau", "kas per projektas?", "labas"]
+HISTORIES = [
+    [],
+    [{"role": "assistant", "content": "Ką manote?"}],
+    [{"role": "assistant", "content": L.VALUE_LINE}],
+]
+
+def synthetic(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    for _ in range(n):
+        yield {
+            "reply": " ".join(rnd.choice(FRAGMENTS) for _ in range(rnd.randint(1, 4))),
+            "plan": {
+                "asked_salary": rnd.random() < 0.3,
+                "phone_only_topics": rnd.choice([[], ["salary"]]),
+                "have_years": rnd.random() < 0.5,
+                "intent": rnd.choice(["other", "unrelated", "project_question", "direct_question"]),
+                "hesitant": rnd.random() < 0.3,
+            },
+            "history": rnd.choice(HISTORIES),
+            "user_text": rnd.choice(USER_TEXTS),
+        }
+
+def load(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def _time(fn, cases, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for c in cases:
+            fn(c["reply"], c["plan"], c["history"], c["user_text"])
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    p = argparse.ArgumentParser(description="Golden check + microbenchmark for reply post-processing.")
+    p.add_argument("--corpus", help="JSONL replay corpus (default: synthetic)")
+    p.add_argument("-n", type=int, default=20000, help="synthetic cases")
+    p.add_argument("--seed", type=int, default=7, help="synthetic corpus seed")
+    p.add_argument("--repeat", type=int, default=5)
+    args = p.parse_args()
+
+    cases = list(load(args.corpus) if args.corpus else synthetic(args.n, args.seed))
+
+    diffs = 0
+    for c in cases:
+        old = L._postprocess_legacy(c["reply"], c["plan"], c["history"], c["user_text"])
+        new = L._postprocess(c["reply"], c["plan"], c["history"], c["user_text"])
+        if old != new:
+            diffs += 1
+            if diffs <= 5:
+                print(f"[diff] {c!r}\n  legacy={old!r}\n  engine={new!r}")
+    print(f"cases={len(cases)} diffs={diffs}")
+
+    t_old = _time(L._postprocess_legacy, cases, args.repeat)
+    t_new = _time(L._postprocess, cases, args.repeat)
+    per = 1e6 / max(1, len(cases))
+    print(f"legacy : {t_old * per:8.2f} µs/reply")
+    print(f"engine : {t_new * per:8.2f} µs/reply  ({t_old / t_new:.2f}x)")
+    sys.exit(1 if diffs else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+RoutingProvider against local stand-in Infobip servers with injected faults.
+
+Each route gets its own stub of /sms/2/text/advanced with a latency, an
+error rate (HTTP 503) and a stall rate (answers after --stall-ms). The
+first route can also go fully down for a window mid-run. Prints per-route
+health, hedge counts and how many sends ended failed.
+
+  python -m app.tools.bench_routing -n 2000 --batch 20 \
+      --a "delay=5,error=0.3" --b "delay=15" --down 2:5 --hedge-ms 200
+"""
+import argparse, asyncio, json, os, random, statistics, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _faults(raw: str) -> dict:
+    out = {"delay": 0.0, "error": 0.0, "stall": 0.0}
+    for part in raw.split(","):
+        k, _, v = part.partition("=")
+        if k.strip() in out and v.strip():
+            out[k.strip()] = float(v)
+    return out
+
+def _stub_server(faults: dict, stall_ms: float, down: list) -> ThreadingHTTPServer:
+    t_start = time.monotonic()
+
+    class H(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def _reply(self, code: int, body: dict):
+            raw = json.dumps(body).encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(n) or b"{}")
+            elapsed = time.monotonic() - t_start
+            if faults["delay"]:
+                time.sleep(faults["delay"] / 1000)
+            if random.random() < faults["stall"]:
+                time.sleep(stall_ms / 1000)
+            if any(a <= elapsed < b for a, b in down) or random.random() < faults["error"]:
+                return self._reply(503, {"requestError": {"serviceException": {"text": "injected"}}})
+            msgs = [
+                {"to": d["to"], "messageId": f"stub-{time.time_ns()}", "status": {"groupName": "PENDING"}}
+                for m in req.get("messages", []) for d in m.get("destinations", [])
+            ]
+            self._reply(200, {"messages": msgs})
+
+        def log_message(self, *a):
+            pass
+
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), H)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+async def main_async(args):
+    down = []
+    if args.down:
+        a, _, b = args.down.partition(":")
+        down = [(float(a), float(b))]
+    servers = {
+        "INFOBIP_A": _stub_server(_faults(args.a), args.stall_ms, down),
+        "INFOBIP_B": _stub_server(_faults(args.b), args.stall_ms, []),
+    }
+    for prefix, srv in servers.items():
+        os.environ.update({f"{prefix}_API_BASE": f"http://127.0.0.1:{srv.server_address[1]}",
+                           f"{prefix}_API_KEY": "bench", f"{prefix}_SENDER": "bench"})
+
+    from app.providers import transport
+    from app.providers.infobip import InfobipProvider
+    from app.providers.routing import RoutingProvider
+    routes = [InfobipProvider(dry_run=False, env_prefix=p) for p in servers]
+    prov = RoutingProvider([(r.name, r) for r in routes], hedge_ms=args.hedge_ms)
+
+    await transport.startup()
+    sem = asyncio.Semaphore(args.concurrency)
+    lat, failed, by_route = [], 0, {}
+
+    async def one(k: int):
+        nonlocal failed
+        items = [{"to": f"3706{k * args.batch + i:07d}", "text": "Sveiki! Bandomoji žinutė.", "userref": f"b{k}-{i}"}
+                 for i in range(args.batch)]
+        async with sem:
+            t0 = time.perf_counter()
+            res = await prov.send_many(items)
+            lat.append((time.perf_counter() - t0) * 1000)
+        for r in res:
+            failed += not r["ok"]
+            by_route[r.get("route")] = by_route.get(r.get("route"), 0) + r["ok"]
+        await asyncio.sleep(args.pause_ms / 1000)
+
+    try:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(k) for k in range(max(1, args.n // args.batch))))
+        wall = time.perf_counter() - t0
+    finally:
+        await transport.shutdown()
+        for srv in servers.values():
+            srv.shutdown()
+
+    lat.sort()
+    print(f"batches={len(lat)} x{args.batch}  wall={wall:.1f}s  p50={statistics.median(lat):.1f}ms  "
+          f"p95={lat[int(len(lat) * 0.95) - 1]:.1f}ms  p99={lat[int(len(lat) * 0.99) - 1]:.1f}ms")
+    print(f"sent by route: {by_route}  failed: {failed}")
+    print(json.dumps(prov.stats(), indent=2))
+
+def main():
+    p = argparse.ArgumentParser(description="Fault-injection bench for RoutingProvider.")
+    p.add_argument("-n", type=int, default=2000, help="messages")
+    p.add_argument("--batch", type=int, default=20, help="messages per send_many()")
+    p.add_argument("-c", "--concurrency", type=int, default=4, help="send_many() calls in flight")
+    p.add_argument("--pause-ms", type=float, default=20.0, help="pause per caller between batches")
+    p.add_argument("--a", default="delay=5", help="route A faults: delay=ms,error=p,stall=p")
+    p.add_argument("--b", default="delay=15", help="route B faults")
+    p.add_argument("--stall-ms", type=float, default=1500.0)
+    p.add_argument("--down", default="", help="route A fully down between seconds START:END")
+    p.add_argument("--hedge-ms", type=float, default=0.0, help="hedge budget (0 = off)")
+    asyncio.run(main_async(p.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Startup cost of the API process, as a regression guard.
+
+1) `python -X importtime -c "import app.main"` in a fresh interpreter: total
+   import time, the slowest top-level packages, and whether any module that
+   should load lazily (pandas, openpyxl, rapidfuzz, openai) got imported.
+2) uvicorn on a free port, timed from spawn until GET /healthz answers 200
+   (lifespan included: schema, transport, workers, leader election).
+
+Exits 1 if a lazy module was imported or a budget is exceeded.
+
+  python -m app.tools.bench_startup --max-import-ms 800 --max-ready-ms 3000
+"""
+import argparse, os, re, socket, subprocess, sys, tempfile, time, urllib.request
+
+LAZY = ("pandas", "openpyxl", "rapidfuzz", "openai")
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def _env(args) -> dict:
+    env = dict(os.environ)
+    env.setdefault("DRY_RUN", "1")
+    env.setdefault("INFOBIP_PULL", "0")
+    if not args.use_env_db:  # a throwaway SQLite db, so the run never touches real data
+        env["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='smsbot-start-')}/bench.db"
+    return env
+
+def import_profile(args) -> tuple:
+    """(total µs, {top-level package: cumulative µs}, imported lazy modules)"""
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                       env=_env(args), capture_output=True, text=True)
+    if p.returncode != 0:
+        sys.exit(f"import app.main failed:\n{p.stderr[-2000:]}")
+    # lines are post-order: a module's imports are listed (one level deeper) before it
+    total, top, seen, children = 0, {}, set(), []
+    for line in p.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        cum, level, name = int(m.group(2)), (len(m.group(3)) - 1) // 2, m.group(4)
+        seen.add(name.split(".")[0])
+        if level == 1:
+            children.append((name.split(".")[0], cum))
+        elif level == 0:
+            if name in ("app", "app.main"):
+                total += cum
+                for pkg, us in children:
+                    top[pkg] = top.get(pkg, 0) + us
+            children = []
+    return total, top, sorted(seen & set(LAZY))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_to_first_200(args) -> float:
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/healthz"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"], env=_env(args))
+    try:
+        while time.perf_counter() - t0 < args.timeout:
+            if proc.poll() is not None:
+                sys.exit(f"uvicorn exited with {proc.returncode} before serving")
+            try:
+                with urllib.request.urlopen(url, timeout=0.5) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                pass
+            time.sleep(0.02)
+        sys.exit(f"no 200 from {url} within {args.timeout}s")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+def main():
+    p = argparse.ArgumentParser(description="Import-time and cold-start guard for app.main.")
+    p.add_argument("--runs", type=int, default=3, help="cold starts to time (best is reported)")
+    p.add_argument("--top", type=int, default=10, help="slowest top-level packages to list")
+    p.add_argument("--max-import-ms", type=float, default=0.0, help="fail above this import time (0 = off)")
+    p.add_argument("--max-ready-ms", type=float, default=0.0, help="fail above this spawn-to-200 time (0 = off)")
+    p.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for the first 200")
+    p.add_argument("--use-env-db", action="store_true", help="use DATABASE_URL from the env instead of a temp SQLite")
+    args = p.parse_args()
+
+    failed = []
+    total, top, lazy = import_profile(args)
+    print(f"import app.main: {total / 1000:.0f}ms")
+    for pkg, us in sorted(top.items(), key=lambda kv: -kv[1])[: args.top]:
+        print(f"  {us / 1000:8.1f}ms  {pkg}")
+    if lazy:
+        failed.append(f"imported at startup but should load lazily: {', '.join(lazy)}")
+    if args.max_import_ms and total / 1000 > args.max_import_ms:
+        failed.append(f"import {total / 1000:.0f}ms > {args.max_import_ms:.0f}ms")
+
+    ready = [time_to_first_200(args) for _ in range(max(1, args.runs))]
+    print(f"spawn -> first 200: best {min(ready):.0f}ms, runs {', '.join(f'{r:.0f}' for r in ready)}ms")
+    if args.max_ready_ms and min(ready) > args.max_ready_ms:
+        failed.append(f"first 200 after {min(ready):.0f}ms > {args.max_ready_ms:.0f}ms")
+
+    for f in failed:
+        print(f"FAIL: {f}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -36,7 +36,8 @@ def main():
             # 2) Simulate you replying by calling inbound MO webhook
             mo_payload = {"msisdn": args.msisdn, "message": user_text}
             try:
-                mo_resp = post(args.base, "/webhooks/mo", mo_payload)
+                # wait=1: hold the request until the reply is ready (webhooks ack fast by default)
+                mo_resp = post(args.base, "/webhooks/mo?wait=1", mo_payload)
             except requests.HTTPError as he:
                 print(f"[server HTTP {he.response.status_code}] {he.response.text}")
                 continue
@@ -0,0 +1,242 @@
+# app/util/metrics.py
+"""
+Prometheus text-format metrics for GET /metrics, without a client library.
+
+Hot-path cost is a dict lookup and a couple of list/float updates: no lock
+is taken on observe()/inc(). Series are created with dict.setdefault (atomic
+under the GIL); updates from different threads (SQL events fire in
+to_thread workers) can in rare races lose an increment, which is fine for
+monitoring and cheaper than a lock on every query.
+
+  - Counter / Histogram: updated where the work happens (HTTP middleware,
+    SQLAlchemy engine events, llm._complete, provider sends, the poller)
+  - gauge(): a callback read at scrape time, for state that is already kept
+    elsewhere (outbox depth, lane backlog, route health, leader, ...)
+
+Metrics are per process; with several uvicorn workers each scrape sees the
+worker that answered it (label by instance in Prometheus or scrape each).
+"""
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple, Union
+
+log = logging.getLogger("metrics")
+
+# seconds; HTTP and provider calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# seconds; single SQL statements
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+# seconds; LLM stages and inbound lag
+SLOW_BUCKETS = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 60.0)
+
+_metrics: List["_Metric"] = []
+
+
+def _esc(v: str) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        _metrics.append(self)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, List[float]] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        cell = self._values.get(labels)
+        if cell is None:
+            cell = self._values.setdefault(labels, [0])
+        cell[0] += amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(v[0])}" for k, v in list(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per series: [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        cells = self._series.get(labels)
+        if cells is None:
+            cells = self._series.setdefault(labels, [0] * (len(self.buckets) + 1) + [0.0])
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def _samples(self) -> List[str]:
+        out = []
+        for k, cells in list(self._series.items()):
+            cum = 0
+            for le, n in zip(self.buckets + (float("inf"),), cells):
+                cum += n
+                le_label = 'le="%s"' % _num(le)
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le_label)} {cum}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {_num(cells[-1])}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {cum}")
+        return out
+
+
+GaugeValue = Union[float, Dict[tuple, float]]
+
+
+class _CallbackGauge(_Metric):
+    def __init__(self, name: str, help: str, fn: Callable[[], GaugeValue],
+                 labelnames: Tuple[str, ...] = (), kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self.fn = fn
+
+    def _samples(self) -> List[str]:
+        try:
+            v = self.fn()
+        except Exception:
+            log.exception("metrics: %s callback failed", self.name)
+            return []
+        if v is None:
+            return []
+        if not isinstance(v, dict):
+            return [f"{self.name} {_num(v)}"]
+        return [f"{self.name}{_labels(self.labelnames, k)} {_num(x)}" for k, x in v.items() if x is not None]
+
+
+def gauge(name: str, help: str, fn: Callable[[], GaugeValue], labelnames: Tuple[str, ...] = (),
+          kind: str = "gauge") -> None:
+    """
+    A value read at scrape time. fn() returns a number, or {label values tuple: number}
+    for labelled series. kind="counter" for totals that are counted elsewhere.
+    """
+    _CallbackGauge(name, help, fn, labelnames, kind)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in list(_metrics):
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ==== Hot-path metrics ====
+HTTP_SECONDS = Histogram("sms_http_request_duration_seconds",
+                         "HTTP request latency by route template, until the response body is sent.",
+                         ("method", "route", "status"))
+SQL_SECONDS = Histogram("sms_db_query_duration_seconds", "SQL statement execution time by statement kind.",
+                        ("op",), buckets=SQL_BUCKETS)
+SQL_ERRORS = Counter("sms_db_query_errors_total", "SQL statements that raised.", ("op",))
+LLM_SECONDS = Histogram("sms_llm_call_duration_seconds",
+                        "LLM call latency per stage and model, retries included.",
+                        ("stage", "model", "outcome"), buckets=SLOW_BUCKETS)
+LLM_TOKENS = Counter("sms_llm_tokens_total", "LLM tokens per stage; kind is prompt, cached or completion.",
+                     ("stage", "kind"))
+PROVIDER_SECONDS = Histogram("sms_provider_request_duration_seconds",
+                             "SMS provider HTTP request latency per route and call.", ("route", "call"))
+PROVIDER_REQUESTS = Counter("sms_provider_requests_total",
+                            "SMS provider HTTP requests per route, call and HTTP status (error = transport).",
+                            ("route", "call", "status"))
+PROVIDER_MESSAGES = Counter("sms_provider_messages_total", "Messages handed to the provider, by route and result.",
+                            ("route", "result"))
+POLLER_FETCH_SECONDS = Histogram("sms_poller_fetch_duration_seconds", "Inbound pull request latency.")
+POLLER_LAG_SECONDS = Histogram("sms_poller_lag_seconds",
+                               "Provider receivedAt to pulled by the poller, per MO.", buckets=SLOW_BUCKETS)
+
+
+# ==== HTTP ====
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware: streaming responses pass
+    through untouched). Labels by the matched route template, so /admin/
+    campaigns/{camp_id} is one series; unmatched paths share one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            route = scope.get("route")
+            HTTP_SECONDS.observe(time.perf_counter() - t0, scope.get("method", ""),
+                                 getattr(route, "path", None) or "unmatched", str(status[0]))
+
+
+# ==== SQLAlchemy ====
+_SQL_OPS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"}
+
+
+def _op(statement: str) -> str:
+    head = statement.lstrip()[:6].upper()
+    return head if head in _SQL_OPS else ("WITH" if head.startswith("WITH") else "OTHER")
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement on `engine` (cursor execute → result, per statement)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_metrics_t0", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_metrics_t0")
+        if stack:
+            SQL_SECONDS.observe(time.perf_counter() - stack.pop(), _op(statement))
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("_metrics_t0") if ctx.connection is not None else None
+        if stack:
+            stack.pop()
+        SQL_ERRORS.inc(_op(ctx.statement or ""))
+
@@ -0,0 +1,15 @@
+# tests/conftest.py
+"""
+Runs before any app module is imported: a throwaway SQLite db (app.storage.db
+binds its engine at import), no provider traffic, no background pulling.
+"""
+import os, sys, tempfile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='smsbot-test-')}/test.db"
+os.environ.setdefault("DRY_RUN", "1")
+os.environ.setdefault("INFOBIP_PULL", "0")
+os.environ.setdefault("OPENAI_API_KEY", "test")
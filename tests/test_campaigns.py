@@ -0,0 +1,115 @@
+# tests/test_campaigns.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import campaigns, outbox
+from app.storage.db import Base, SessionLocal, engine
+from app.storage.models import Campaign, CampaignRecipient, Contact, Message, OutboxItem, Thread
+
+
+@pytest.fixture(autouse=True)
+def db(monkeypatch):
+    monkeypatch.setattr(campaigns, "CAMPAIGN_TICK_S", 0.01)
+    Base.metadata.create_all(bind=engine)
+    s = SessionLocal()
+
+    def wipe():
+        s.rollback()
+        for model in (CampaignRecipient, Campaign, OutboxItem, Message, Thread, Contact):
+            s.query(model).delete()
+        s.commit()
+    wipe()
+    yield s
+    wipe()
+    s.close()
+
+
+def _match(i, text="Labas, ar domina darbas?"):
+    return {"Tel. nr": f"370630000{i:02d}", "sms_text": text, "match_id": i}
+
+
+def _create(db, matches):
+    camp = campaigns.create(db, matches, name="t")
+    db.commit()
+    return camp.id
+
+
+def _recipients(db, cid):
+    db.expire_all()
+    return db.query(CampaignRecipient).filter_by(campaign_id=cid).order_by(CampaignRecipient.id).all()
+
+
+def test_create_skips_rows_without_phone_or_text_and_repeated_phones(db):
+    cid = _create(db, [_match(1), _match(2, text=""), {"sms_text": "x"}, _match(1)])
+    rs = _recipients(db, cid)
+    assert [(r.status, r.error) for r in rs] == [
+        ("pending", None), ("skipped", "missing to/text"), ("skipped", "missing to/text"),
+        ("skipped", "duplicate phone 37063000001"),
+    ]
+    assert db.get(Campaign, cid).total == 4
+    assert campaigns.pending_count(cid) == 1
+
+
+def test_feed_batch_queues_in_the_campaign_lane_then_finishes(db):
+    cid = _create(db, [_match(i) for i in range(5)])
+    assert campaigns.feed_batch(cid, limit=3) == 3
+    assert campaigns.backlog() == 3
+    assert campaigns.feed_batch(cid, limit=3) == 2
+    rs = _recipients(db, cid)
+    assert {r.status for r in rs} == {"queued"}
+    items = [db.get(OutboxItem, r.outbox_id) for r in rs]
+    assert {(it.lane, it.kind) for it in items} == {("campaign", "campaign")}
+    assert items[0].userref == f"c{cid}-{rs[0].id}"
+    assert db.get(Campaign, cid).status == "running"
+    assert campaigns.feed_batch(cid) == 0
+    db.expire_all()
+    assert db.get(Campaign, cid).status == "done"
+
+
+def test_feed_batch_skips_dnc_and_defers_recent_recipients(db):
+    cid = _create(db, [_match(1), _match(2), _match(3)])
+    db.add(Contact(phone="37063000001", dnc=True))
+    db.commit()
+    outbox.enqueue(db, "37063000002", "Ką tik rašėme", kind="manual")
+    db.commit()
+    assert campaigns.feed_batch(cid) == 2  # dnc skipped + one queued; the throttled one waits
+    skipped, deferred, queued = _recipients(db, cid)
+    assert (skipped.status, skipped.error) == ("skipped", "dnc")
+    assert deferred.status == "pending" and deferred.not_before > datetime.utcnow() + timedelta(seconds=60)
+    assert queued.status == "queued"
+    assert campaigns.feed_batch(cid) == 0
+    assert db.get(Campaign, cid).status == "running"  # the deferred one is still pending
+
+
+def test_pause_takes_back_unclaimed_rows_and_resume_feeds_them_again(db):
+    cid = _create(db, [_match(i) for i in range(4)])
+    campaigns.feed_batch(cid)
+    (claimed,) = outbox.claim(1, lane="campaign")  # a worker already took one
+
+    assert asyncio.run(campaigns.pause(cid)) == 3
+    rs = _recipients(db, cid)
+    assert db.get(Campaign, cid).status == "paused"
+    assert [r.status for r in rs] == ["queued", "pending", "pending", "pending"]
+    assert rs[0].outbox_id == claimed["id"]
+    assert campaigns.backlog() == 0
+    assert db.query(OutboxItem).count() == 1 and db.query(Message).count() == 1
+    assert campaigns.feed_batch(cid) == 0  # paused: nothing is fed
+
+    assert asyncio.run(campaigns.resume(cid)) is True
+    assert campaigns.feed_batch(cid) == 3
+    assert {r.status for r in _recipients(db, cid)} == {"queued"}
+
+
+def test_progress_reports_outbox_and_delivery_states(db):
+    cid = _create(db, [_match(i) for i in range(3)] + [_match(9, text="")])
+    campaigns.feed_batch(cid, limit=2)
+    sent, failed = outbox.claim(10, lane="campaign")
+    outbox.record([(sent, {"ok": True, "provider_id": "p-1"}), (failed, {"ok": False, "error": "rejected"})])
+    p = campaigns.progress(cid)
+    assert p["counts"] == {"sent": 1, "failed": 1, "pending": 1, "skipped": 1}
+    assert p["delivery"] == {"delivered": 0, "undelivered": 0, "awaiting_report": 1, "delivery_rate": 0.0}
+    assert p["schedule"]["remaining"] == 1
+    assert p["finished"] is False
+    assert campaigns.progress(10 ** 6) is None
@@ -0,0 +1,93 @@
+# tests/test_coalescer.py
+import asyncio
+
+from app.services.coalescer import InboundCoalescer
+
+
+class Recorder:
+    def __init__(self, prepare_s=0.0, commit_s=0.0):
+        self.prepare_s, self.commit_s = prepare_s, commit_s
+        self.prepared, self.committed = [], []
+
+    async def prepare(self, key, text):
+        self.prepared.append((key, text))
+        await asyncio.sleep(self.prepare_s)
+        return text.upper()
+
+    async def commit(self, key, result):
+        await asyncio.sleep(self.commit_s)
+        self.committed.append((key, result))
+        return {"reply": result}
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_burst_is_merged_and_only_the_last_caller_gets_the_result():
+    rec = Recorder()
+    c = InboundCoalescer(rec.prepare, rec.commit, window_s=0.05)
+
+    async def main():
+        async def later(delay, text):
+            await asyncio.sleep(delay)
+            return await c.submit("a", text)
+        return await asyncio.gather(later(0, "taip"), later(0.01, "domina"), later(0.02, "kiek moka?"))
+    results = _run(main())
+    assert results == [None, None, {"reply": "TAIP DOMINA KIEK MOKA?", "fragments": 3}]
+    assert rec.committed == [("a", "TAIP DOMINA KIEK MOKA?")]
+    assert c.pending() == 0 and not c.active("a")
+
+
+def test_fragment_during_prepare_restarts_it():
+    rec = Recorder(prepare_s=0.1)
+    c = InboundCoalescer(rec.prepare, rec.commit, window_s=0.02)
+
+    async def main():
+        first = asyncio.create_task(c.submit("a", "taip"))
+        await asyncio.sleep(0.06)  # window over, prepare running
+        assert c.active("a")
+        second = await c.submit("a", "domina")
+        return await first, second
+    first, second = _run(main())
+    assert first is None
+    assert second["fragments"] == 2
+    assert [t for _, t in rec.prepared] == ["taip", "taip domina"]
+    assert rec.committed == [("a", "TAIP DOMINA")]
+
+
+def test_fragment_during_commit_waits_for_it_and_starts_a_new_turn():
+    rec = Recorder(commit_s=0.1)
+    c = InboundCoalescer(rec.prepare, rec.commit, window_s=0.02)
+
+    async def main():
+        first = asyncio.create_task(c.submit("a", "taip"))
+        await asyncio.sleep(0.06)  # committing now
+        second = await c.submit("a", "kiek moka?")
+        return await first, second
+    first, second = _run(main())
+    assert first == {"reply": "TAIP", "fragments": 1}
+    assert second == {"reply": "KIEK MOKA?", "fragments": 1}
+    assert rec.committed == [("a", "TAIP"), ("a", "KIEK MOKA?")]  # in order, never merged into a sent turn
+
+
+def test_keys_do_not_wait_for_each_other():
+    rec = Recorder()
+    c = InboundCoalescer(rec.prepare, rec.commit, window_s=0.02)
+
+    async def main():
+        return await asyncio.gather(c.submit("a", "taip"), c.submit("b", "ne"))
+    assert _run(main()) == [{"reply": "TAIP", "fragments": 1}, {"reply": "NE", "fragments": 1}]
+
+
+def test_dropped_caller_does_not_cancel_the_turn():
+    rec = Recorder(prepare_s=0.05)
+    c = InboundCoalescer(rec.prepare, rec.commit, window_s=0.01)
+
+    async def main():
+        caller = asyncio.create_task(c.submit("a", "taip"))
+        await asyncio.sleep(0.02)
+        caller.cancel()  # webhook connection went away
+        await asyncio.sleep(0.1)
+    _run(main())
+    assert rec.committed == [("a", "TAIP")]
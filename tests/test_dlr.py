@@ -0,0 +1,176 @@
+# tests/test_dlr.py
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services import dlr
+from app.services.dlr import DlrBatcher
+
+
+def _report(pid, status="DELIVERED"):
+    return {"provider_id": pid, "status": status}
+
+
+async def _drain(b, timeout=2.0):
+    t0 = time.monotonic()
+    while b.buffered() or (b._flusher is not None and not b._flusher.done()):
+        if time.monotonic() - t0 > timeout:
+            break
+        await asyncio.sleep(0.01)
+
+
+def test_final_status_mapping():
+    assert dlr.final_status("delivered_to_handset") == "delivered"
+    assert dlr.final_status("REJECTED") == "failed"
+    assert dlr.final_status("PENDING") is None
+    assert dlr.final_status(None) is None
+
+
+def test_submit_ignores_non_final_and_anonymous_reports():
+    async def go():
+        b = DlrBatcher(flush_ms=10_000)
+        n = b.submit([_report("a"), _report("b", "PENDING"), _report(None)])
+        assert n == 1 and b.buffered() == 1
+        assert b.stats["ignored"] == 2
+        b._flusher.cancel()
+    asyncio.run(go())
+
+
+def test_reports_arriving_during_a_slow_apply_are_flushed(monkeypatch):
+    batches = []
+
+    def slow_apply(batch):
+        time.sleep(0.1)
+        batches.append(dict(batch))
+        return len(batch)
+    monkeypatch.setattr(dlr, "apply", slow_apply)
+
+    async def go():
+        b = DlrBatcher(flush_ms=10)
+        b.submit([_report("a")])
+        await asyncio.sleep(0.05)  # the first apply is running now
+        b.submit([_report("b", "FAILED")])
+        await _drain(b)
+        return b
+    b = asyncio.run(go())
+    assert batches == [{"a": "delivered"}, {"b": "failed"}]
+    assert b.buffered() == 0
+    assert b.stats["flushes"] == 2 and b.stats["applied"] == 2
+
+
+def test_failed_apply_is_retried_without_a_new_submit(monkeypatch):
+    calls = []
+
+    def flaky_apply(batch):
+        calls.append(dict(batch))
+        if len(calls) == 1:
+            raise RuntimeError("db down")
+        return len(batch)
+    monkeypatch.setattr(dlr, "apply", flaky_apply)
+    monkeypatch.setattr(dlr, "DLR_RETRY_S", 0.02)
+
+    async def go():
+        b = DlrBatcher(flush_ms=10)
+        b.submit([_report("a"), _report("b")])
+        await _drain(b)
+        return b
+    b = asyncio.run(go())
+    assert calls == [{"a": "delivered", "b": "delivered"}] * 2
+    assert b.buffered() == 0
+    assert b.stats["errors"] == 1 and b.stats["applied"] == 2
+
+
+def test_a_newer_report_wins_over_a_kept_batch(monkeypatch):
+    calls = []
+
+    def flaky_apply(batch):
+        calls.append(dict(batch))
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise RuntimeError("db down")
+        return len(batch)
+    monkeypatch.setattr(dlr, "apply", flaky_apply)
+    monkeypatch.setattr(dlr, "DLR_RETRY_S", 0.02)
+
+    async def go():
+        b = DlrBatcher(flush_ms=10)
+        b.submit([_report("a")])
+        await asyncio.sleep(0.03)
+        b.submit([_report("a", "FAILED")])
+        await _drain(b)
+    asyncio.run(go())
+    assert calls[-1] == {"a": "failed"}
+
+
+# ==== /webhooks/dlr ====
+@pytest.fixture
+def client():
+    from app.main import app
+    with TestClient(app) as c:
+        yield c
+
+
+def _outbound(provider_id):
+    from app.storage.db import SessionLocal
+    from app.storage.models import Message
+    db = SessionLocal()
+    try:
+        db.add(Message(dir="out", body="x", status="sent", provider_id=provider_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _status(provider_id):
+    from app.storage.db import SessionLocal
+    from app.storage.models import Message
+    db = SessionLocal()
+    try:
+        return db.query(Message.status).filter(Message.provider_id == provider_id).scalar()
+    finally:
+        db.close()
+
+
+def _settle(client, before):
+    """Stats once the submitted reports were written (the buffer empties when a write starts)."""
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < 3:
+        st = client.get("/dlr/stats").json()
+        if not st["buffered"] and st["flushes"] + st["errors"] > before["flushes"] + before["errors"]:
+            break
+        time.sleep(0.02)
+    return st
+
+
+@pytest.mark.parametrize("payload", [
+    {"id": "dlr-base-1", "status": "delivered"},
+    {"results": [{"messageId": "dlr-ib-1", "to": "37060000001",
+                  "status": {"groupName": "DELIVERED", "name": "DELIVERED_TO_HANDSET"},
+                  "callbackData": "ref-1"}]},
+], ids=["base", "infobip"])
+def test_dlr_webhook_applies_status(client, payload):
+    pid = payload.get("id") or payload["results"][0]["messageId"]
+    _outbound(pid)
+    before = client.get("/dlr/stats").json()
+    r = client.post("/webhooks/dlr", json=payload)
+    assert r.status_code == 200
+    assert r.json() == {"ok": True, "received": 1, "accepted": 1}
+    after = _settle(client, before)
+    assert after["buffered"] == 0
+    assert after["received"] - before["received"] == 1
+    assert after["applied"] - before["applied"] == 1
+    assert _status(pid) == "delivered"
+
+
+def test_dlr_webhook_counts_unmatched_and_ignored(client):
+    before = client.get("/dlr/stats").json()
+    r = client.post("/webhooks/dlr", json={"results": [
+        {"messageId": "dlr-nobody", "status": {"groupName": "UNDELIVERABLE"}},
+        {"messageId": "dlr-pending", "status": {"groupName": "PENDING"}},
+    ]})
+    assert r.json() == {"ok": True, "received": 2, "accepted": 1}
+    after = _settle(client, before)
+    assert after["ignored"] - before["ignored"] == 1
+    assert after["unmatched"] - before["unmatched"] == 1
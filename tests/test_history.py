@@ -0,0 +1,64 @@
+# tests/test_history.py
+import pytest
+
+from app.services.history import (
+    HISTORY_MIN_TURNS, compact_history, estimate_messages, estimate_tokens,
+)
+
+
+def _thread(n, text="Labas, kaip sekasi? Ar domina darbas?"):
+    return [{"role": "user" if i % 2 else "assistant", "content": f"{i} {text}"} for i in range(n)]
+
+
+def _count(older):
+    return {"folded": len(older)}
+
+
+def test_estimate_counts_utf8_bytes():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("ąčęė") == 2  # 2 bytes per diacritic
+    assert estimate_messages([{"role": "user", "content": "abcd"}]) == 1 + 4
+
+
+def test_short_history_is_kept_verbatim():
+    h = _thread(4)
+    out = compact_history(h, _count, keep_turns=6, budget=1000)
+    assert out == {"summary": None, "turns": h}
+
+
+def test_older_turns_fold_into_the_summary():
+    h = _thread(10)
+    out = compact_history(h, _count, keep_turns=6, budget=1000)
+    assert out["summary"] == {"folded": 4}
+    assert out["turns"] == h[4:]
+
+
+def test_budget_folds_more_of_the_tail():
+    h = _thread(10)
+    budget = estimate_messages(h[-3:]) + 20
+    out = compact_history(h, _count, keep_turns=6, budget=budget)
+    assert out["turns"] == h[-3:]
+    assert out["summary"] == {"folded": 7}
+
+
+@pytest.mark.parametrize("n", [20, 200, 2000])
+def test_size_is_bounded_by_the_budget_not_the_thread(n):
+    out = compact_history(_thread(n), _count, keep_turns=6, budget=120)
+    assert len(out["turns"]) >= HISTORY_MIN_TURNS
+    assert estimate_messages(out["turns"]) <= 120
+
+
+def test_over_long_messages_are_clipped():
+    h = _thread(2, text="ž" * 2000)
+    out = compact_history(h, _count, keep_turns=6, budget=100)
+    assert len(out["turns"]) == 2
+    for m in out["turns"]:
+        assert m["content"].endswith("…")
+        assert estimate_tokens(m["content"]) < 60
+
+
+def test_summarizer_not_called_without_older_turns():
+    def boom(older):
+        raise AssertionError("summarize called")
+    assert compact_history(_thread(3), boom, keep_turns=6)["summary"] is None
@@ -0,0 +1,106 @@
+# tests/test_idempotency.py
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import main
+from app.services import dedup
+from app.services.dedup import RecentIds
+from app.storage.db import SessionLocal
+from app.storage.models import Contact, Message, Thread
+
+
+# ==== RecentIds ====
+def test_seen_is_check_and_add():
+    ids = RecentIds()
+    assert ids.seen("m1") is False
+    assert ids.seen("m1") is True
+    assert ids.get("m2") is None
+    ids.put("m2", 42)
+    assert ids.get("m2") == 42 and len(ids) == 2
+
+
+def test_least_recently_used_key_is_evicted():
+    ids = RecentIds(maxsize=2)
+    ids.put("a")
+    ids.put("b")
+    ids.get("a")  # refresh a
+    ids.put("c")
+    assert ids.get("b") is None
+    assert ids.get("a") and ids.get("c")
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedup, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    ids = RecentIds(ttl_s=60)
+    ids.put("a")
+    now[0] += 59
+    assert ids.get("a")
+    now[0] += 61  # the get above does not extend the entry's age
+    assert ids.get("a") is None and len(ids) == 0
+
+
+# ==== inbound MO, keyed on the provider messageId ====
+@pytest.fixture(autouse=True)
+def schema():
+    main._init_schema()
+    main.recent_mo._d.clear()
+    yield
+    main.recent_mo._d.clear()
+    db = SessionLocal()
+    try:
+        for model in (Message, Thread, Contact):
+            db.query(model).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _stored(phone):
+    db = SessionLocal()
+    try:
+        return [m.provider_id for m in db.query(Message).join(Thread, Thread.id == Message.thread_id)
+                .filter(Thread.phone == phone, Message.dir == "in").order_by(Message.id)]
+    finally:
+        db.close()
+
+
+def _mo(pid, text="Kiek mokate?", phone="37064000001"):
+    return {"from": phone, "text": text, "provider_id": pid}
+
+
+def test_repeat_within_a_batch_is_stored_once():
+    todo, dups = main._store_inbound_batch([_mo("mo-1"), _mo("mo-1"), _mo("mo-2", "O kur?")])
+    assert [m["provider_id"] for m in todo] == ["mo-1", "mo-2"] and dups == 1
+    assert _stored("37064000001") == ["mo-1", "mo-2"]
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "db"])
+def test_webhook_retry_is_dropped(cached):
+    main._store_inbound_batch([_mo("mo-3")])
+    if not cached:
+        main.recent_mo._d.clear()  # another worker stored it
+    todo, dups = main._store_inbound_batch([_mo("mo-3"), _mo("mo-4", "Ir dar")])
+    assert [m["provider_id"] for m in todo] == ["mo-4"] and dups == 1
+    assert _stored("37064000001") == ["mo-3", "mo-4"]
+
+
+def test_mos_without_a_message_id_are_never_deduplicated():
+    todo, dups = main._store_inbound_batch([_mo(None), _mo(None)])
+    assert len(todo) == 2 and dups == 0
+    assert _stored("37064000001") == [None, None]
+
+
+def test_duplicate_row_is_rejected_by_the_database():
+    main._store_inbound_batch([_mo("mo-5")])
+    db = SessionLocal()
+    try:
+        t = db.query(Thread).filter_by(phone="37064000001").one()
+        db.add(Message(thread_id=t.id, dir="in", body="x", provider_id="mo-5"))
+        with pytest.raises(IntegrityError):
+            db.flush()
+    finally:
+        db.rollback()
+        db.close()
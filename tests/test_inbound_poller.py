@@ -0,0 +1,148 @@
+# tests/test_inbound_poller.py
+"""AdaptivePoller against a local stub of Infobip's GET /messages-api/1/inbound."""
+import asyncio
+
+import httpx
+import pytest
+
+from app.providers import infobip
+from app.services.inbound_poller import AdaptivePoller
+
+
+class StubInbound:
+    """Serves queued pages; each step is (n_results, pendingMessageCount), a Response or an exception."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.requests = []
+        self.n = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        step = self.steps.pop(0) if self.steps else (0, 0)
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, httpx.Response):
+            return step
+        count, pending = step
+        results = []
+        for _ in range(count):
+            self.n += 1
+            results.append({"messageId": f"mo-{self.n}", "from": "37060000001", "to": "1234",
+                            "text": f"žinutė {self.n}", "receivedAt": "2024-05-02T10:15:30.123+0000"})
+        return httpx.Response(200, json={"results": results, "messageCount": count,
+                                         "pendingMessageCount": pending})
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(infobip, "API_BASE", "http://infobip.stub")
+    monkeypatch.setattr(infobip, "API_KEY", "test-key")
+    return StubInbound()
+
+
+def _poller(stub, handle=None, limit=10, min_s=0.5, max_s=4.0):
+    pages = []
+
+    async def _handle(items):
+        pages.append(items)
+
+    async def fetch(n):
+        async with httpx.AsyncClient(transport=httpx.MockTransport(stub)) as client:
+            return await infobip.fetch_inbound_async(limit=n, client=client)
+    return AdaptivePoller(fetch=fetch, handle=handle or _handle, limit=limit, min_s=min_s, max_s=max_s), pages
+
+
+def _poll(p, times=1):
+    async def go():
+        return [await p.poll_once() for _ in range(times)]
+    return asyncio.run(go())
+
+
+def test_request_and_normalized_page(stub):
+    stub.steps = [(2, 0)]
+    p, pages = _poller(stub)
+    assert _poll(p) == [2]
+    req = stub.requests[0]
+    assert req.url.path == "/messages-api/1/inbound"
+    assert req.url.params["limit"] == "10" and req.url.params["channel"] == "SMS"
+    assert req.headers["Authorization"] == "App test-key"
+    assert [m["provider_id"] for m in pages[0]] == ["mo-1", "mo-2"]
+    assert pages[0][0]["text"] == "žinutė 1" and pages[0][0]["received_at"] > 0
+
+
+def test_repolls_at_once_while_backlog_or_full_page(stub):
+    stub.steps = [(3, 25), (10, 0), (4, 0)]
+    p, _ = _poller(stub, limit=10)
+    _poll(p)
+    assert p.delay == 0.0  # provider reports a backlog
+    _poll(p)
+    assert p.delay == 0.0  # a full page: likely more
+    _poll(p)
+    assert p.delay == p.min_s  # partial page, no backlog
+
+
+def test_idle_backoff_doubles_up_to_max(stub):
+    p, _ = _poller(stub, min_s=0.5, max_s=4.0)
+    delays = []
+    for _ in range(6):
+        _poll(p)
+        delays.append(p.delay)
+    assert delays == [1.0, 2.0, 4.0, 4.0, 4.0, 4.0]
+    stub.steps = [(1, 0)]
+    _poll(p)
+    assert p.delay == 0.5  # traffic again: back to the short wait
+
+
+def test_fetch_errors_back_off(stub):
+    stub.steps = [httpx.ConnectError("refused"), httpx.ConnectError("refused"), (2, 0)]
+    p, pages = _poller(stub, min_s=0.5, max_s=4.0)
+    assert _poll(p, 2) == [0, 0]
+    assert p.stats["errors"] == 2 and p.delay == 2.0
+    assert p.stats["polls"] == 0
+    assert _poll(p) == [2]
+    assert p.delay == 0.5 and len(pages) == 1
+
+
+def test_http_error_status_counts_as_idle(stub):
+    stub.steps = [httpx.Response(503, json={"requestError": "busy"})]
+    p, pages = _poller(stub)
+    assert _poll(p) == [0]
+    assert pages == [] and p.delay == 1.0
+
+
+def test_latency_and_backlog_stats(stub):
+    stub.steps = [(3, 7), (0, 0)]
+    p, _ = _poller(stub)
+    _poll(p)
+    st = p.stats
+    assert st["polls"] == 1 and st["messages"] == 3 and st["last_batch"] == 3
+    assert st["backlog"] == 7 and st["next_delay_s"] == 0.0
+    assert st["last_latency_ms"] is not None and st["avg_latency_ms"] == st["last_latency_ms"]
+    assert st["last_message_at"] == st["last_poll_at"]
+    _poll(p)
+    assert st["polls"] == 2 and st["backlog"] == 0 and st["last_batch"] == 0
+    assert st["last_message_at"] <= st["last_poll_at"]
+
+
+def test_handler_error_does_not_stop_the_loop(stub):
+    stub.steps = [(1, 0), (1, 0), (1, 0)]
+    seen = []
+
+    async def handle(items):
+        seen.append(items[0]["provider_id"])
+        if len(seen) == 1:
+            raise RuntimeError("db down")
+
+    p, _ = _poller(stub, handle=handle, min_s=0.0, max_s=0.0)
+
+    async def go():
+        stop = asyncio.Event()
+        task = asyncio.create_task(p.run(stop))
+        while len(seen) < 3:
+            await asyncio.sleep(0.01)
+        stop.set()
+        await asyncio.wait_for(task, 1)
+    asyncio.run(asyncio.wait_for(go(), 5))
+    assert seen == ["mo-1", "mo-2", "mo-3"]
+    assert p.stats["errors"] == 1
@@ -0,0 +1,91 @@
+# tests/test_inbound_sweep.py
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import main
+from app.storage.db import SessionLocal
+from app.storage.models import Contact, Message, Thread
+
+
+@pytest.fixture(autouse=True)
+def schema():
+    main._init_schema()
+    yield
+    db = SessionLocal()
+    try:
+        for model in (Message, Thread, Contact):
+            db.query(model).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _inbound(phone):
+    db = SessionLocal()
+    try:
+        return (db.query(Message).join(Thread, Thread.id == Message.thread_id)
+                  .filter(Thread.phone == phone, Message.dir == "in").order_by(Message.id).all())
+    finally:
+        db.close()
+
+
+def _age(phone, delta):
+    db = SessionLocal()
+    try:
+        ids = [m.id for m in _inbound(phone)]
+        db.query(Message).filter(Message.id.in_(ids)).update({Message.ts: datetime.utcnow() - delta},
+                                                             synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_llm_bound_mos_are_stored_pending():
+    todo, _ = main._store_inbound_batch([{"from": "37060000001", "text": "Kiek mokate?", "provider_id": "mo-1"},
+                                         {"from": "37060000002", "text": "Nedomina", "provider_id": "mo-2"}])
+    assert [m["from"] for m in todo] == ["37060000001"]
+    assert [m.status for m in _inbound("37060000001")] == ["pending"]
+    assert [m.status for m in _inbound("37060000002")] == ["delivered"]  # DNC phrase, answered at once
+
+
+def test_commit_marks_the_turn_answered():
+    main._store_inbound_batch([{"from": "37060000003", "text": "Kiek mokate?", "provider_id": "mo-3"}])
+    started = datetime.utcnow()
+    res = asyncio.run(main._commit_turn("37060000003", {"intent": "questions", "reply": "", "started_at": started}))
+    assert "started_at" not in res
+    assert [m.status for m in _inbound("37060000003")] == ["delivered"]
+
+
+def test_commit_leaves_fragments_that_arrived_after_prepare_started():
+    main._store_inbound_batch([{"from": "37060000004", "text": "Taip", "provider_id": "mo-4"}])
+    started = datetime.utcnow()
+    main._store_inbound_batch([{"from": "37060000004", "text": "kiek moka?", "provider_id": "mo-5"}])
+    asyncio.run(main._commit_turn("37060000004", {"intent": "other", "reply": "", "started_at": started}))
+    assert [m.status for m in _inbound("37060000004")] == ["delivered", "pending"]
+
+
+def test_sweep_picks_up_only_stale_pending_rows():
+    main._store_inbound_batch([{"from": "37060000005", "text": "Labas", "provider_id": "mo-6"},
+                               {"from": "37060000006", "text": "Kas per darbas?", "provider_id": "mo-7"},
+                               {"from": "37060000007", "text": "Sveiki", "provider_id": "mo-8"}])
+    _age("37060000005", timedelta(seconds=main.INBOUND_SWEEP_GRACE_SECONDS + 60))
+    _age("37060000007", timedelta(hours=main.INBOUND_SWEEP_MAX_AGE_HOURS + 1))
+    due = main._unanswered_inbound(datetime.utcnow())
+    assert due == [("37060000005", "Labas")]
+    assert [m.status for m in _inbound("37060000006")] == ["pending"]      # a turn may still be running
+    assert [m.status for m in _inbound("37060000007")] == ["delivered"]    # too late to answer
+
+
+def test_sweep_skips_contacts_that_became_dnc():
+    main._store_inbound_batch([{"from": "37060000008", "text": "Labas", "provider_id": "mo-9"}])
+    _age("37060000008", timedelta(seconds=main.INBOUND_SWEEP_GRACE_SECONDS + 60))
+    db = SessionLocal()
+    try:
+        db.query(Contact).filter(Contact.phone == "37060000008").update({Contact.dnc: True})
+        db.commit()
+    finally:
+        db.close()
+    assert main._unanswered_inbound(datetime.utcnow()) == []
+    assert [m.status for m in _inbound("37060000008")] == ["delivered"]
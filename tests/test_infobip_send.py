@@ -0,0 +1,155 @@
+# tests/test_infobip_send.py
+"""InfobipProvider.send_many against a stub /sms/2/text/advanced (httpx.MockTransport)."""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.providers import infobip, transport
+from app.providers.infobip import InfobipProvider
+from app.providers.routing import RoutingProvider
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """Scripted API: each step is an exception to raise, a Response or a status code; 200 echoes the messageIds."""
+    monkeypatch.setenv("IBTEST_API_BASE", "http://infobip.stub")
+    monkeypatch.setenv("IBTEST_API_KEY", "k")
+    monkeypatch.setenv("IBTEST_SENDER", "Valandinis")
+    script, bodies = [], []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        bodies.append(body)
+        step = script.pop(0) if script else 200
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, httpx.Response):
+            return step
+        if step != 200:
+            return httpx.Response(step, json={"requestError": {"serviceException": {"text": "nope"}}})
+        return httpx.Response(200, json={"messages": [
+            {"to": d["to"], "messageId": d.get("messageId") or "ib-generated",
+             "status": {"groupName": "PENDING", "name": "PENDING_ENROUTE"}}
+            for m in body["messages"] for d in m["destinations"]]})
+
+    monkeypatch.setattr(transport, "get_client",
+                        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return script, bodies
+
+
+ITEMS = [{"to": "37060000001", "text": "Labas", "userref": "llm-reply:aaa"},
+         {"to": "37060000002", "text": "Labas", "userref": None}]
+
+
+def _send(provider, items=ITEMS):
+    return asyncio.run(provider.send_many([dict(it) for it in items]))
+
+
+def test_destinations_carry_our_message_id(api):
+    _, bodies = api
+    res = _send(InfobipProvider(env_prefix="IBTEST"))
+    dests = bodies[0]["messages"][0]["destinations"]
+    assert dests[0] == {"to": "37060000001", "messageId": "llm-reply:aaa"}
+    assert len(dests[1]["messageId"]) == 32  # no userref: a random id
+    assert [r["ok"] for r in res] == [True, True]
+    assert [r["provider_id"] for r in res] == [d["messageId"] for d in dests]
+
+
+@pytest.mark.parametrize("exc", [httpx.ConnectError("refused"), httpx.ConnectTimeout("connect"),
+                                 httpx.PoolTimeout("pool")], ids=lambda e: type(e).__name__)
+def test_errors_before_the_request_went_out_are_retryable(api, exc):
+    script, _ = api
+    script.append(exc)
+    res = _send(InfobipProvider(env_prefix="IBTEST"))
+    assert all(not r["ok"] and r["retryable"] and not r.get("unknown") for r in res)
+    assert all(r["provider_id"] is None for r in res)
+
+
+@pytest.mark.parametrize("exc", [httpx.ReadTimeout("read"), httpx.WriteTimeout("write"),
+                                 httpx.RemoteProtocolError("peer closed")], ids=lambda e: type(e).__name__)
+def test_ambiguous_errors_are_not_retried(api, exc):
+    script, _ = api
+    script.append(exc)
+    res = _send(InfobipProvider(env_prefix="IBTEST"))
+    assert all(not r["ok"] and r["retryable"] is False and r["unknown"] for r in res)
+    assert res[0]["provider_id"] == "llm-reply:aaa"  # a DLR for it can still settle the outcome
+    assert res[1]["provider_id"]
+
+
+@pytest.mark.parametrize("status,retryable", [(503, True), (429, True), (400, False), (401, False)])
+def test_http_errors(api, status, retryable):
+    script, _ = api
+    script.append(status)
+    res = _send(InfobipProvider(env_prefix="IBTEST"))
+    assert all(not r["ok"] and r["retryable"] is retryable and r["error"] == f"http {status}" for r in res)
+
+
+def test_identical_texts_share_a_message_and_requests_are_chunked(api, monkeypatch):
+    _, bodies = api
+    monkeypatch.setattr(infobip, "BULK_MAX_DESTINATIONS", 2)
+    items = [{"to": f"3706000000{i}", "text": "A" if i % 2 else "B", "userref": f"r{i}"} for i in range(5)]
+    res = _send(InfobipProvider(env_prefix="IBTEST"), items)
+    sent = [[(m["text"], [d["to"][-1] for d in m["destinations"]]) for m in b["messages"]] for b in bodies]
+    assert sorted(sent) == sorted([[("B", ["0", "2"])], [("B", ["4"]), ("A", ["1"])], [("A", ["3"])]])
+    assert [r["provider_id"] for r in res] == [f"r{i}" for i in range(5)]  # input order
+    assert all(r["ok"] for r in res)
+
+
+def test_rejected_destinations_fail_alone(api):
+    script, _ = api
+    script.append(httpx.Response(200, json={"messages": [
+        {"to": "37060000002", "messageId": "m2", "status": {"groupName": "REJECTED", "description": "bad number"}},
+        {"to": "37060000001", "messageId": "llm-reply:aaa", "status": {"groupName": "PENDING"}},
+    ]}))
+    res = _send(InfobipProvider(env_prefix="IBTEST"))
+    assert res[0]["ok"] and res[0]["status"] == "PENDING"
+    assert not res[1]["ok"] and res[1]["error"] == "bad number"  # matched on `to`, not position
+
+
+def test_routing_does_not_fail_over_after_a_read_timeout(api):
+    script, bodies = api
+    script.append(httpx.ReadTimeout("read"))
+    rp = RoutingProvider([("a", InfobipProvider(env_prefix="IBTEST")),
+                          ("b", InfobipProvider(env_prefix="IBTEST"))])
+    res = _send(rp)
+    assert len(bodies) == 1  # no second SMS through route b
+    assert all(r["route"] == "a" and r["unknown"] for r in res)
+
+
+def test_routing_fails_over_after_a_connect_error(api):
+    script, bodies = api
+    script.append(httpx.ConnectError("refused"))
+    rp = RoutingProvider([("a", InfobipProvider(env_prefix="IBTEST")),
+                          ("b", InfobipProvider(env_prefix="IBTEST"))])
+    res = _send(rp)
+    assert len(bodies) == 2
+    assert all(r["route"] == "b" and r["ok"] for r in res)
+
+
+def test_unknown_outcome_is_failed_in_the_outbox_and_settled_by_dlr():
+    from app.services import dlr, outbox
+    from app.storage.db import Base, SessionLocal, engine
+    from app.storage.models import Message, OutboxItem
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        item = outbox.enqueue(db, "37060000009", "Labas", userref="llm-reply:unknown-1", kind="llm-reply")
+        item.attempts = 1
+        db.commit()
+        item_id, msg_id = item.id, item.message_id
+    finally:
+        db.close()
+    counts = outbox.record([({"id": item_id}, {"ok": False, "retryable": False, "unknown": True,
+                                               "provider_id": "llm-reply:unknown-1",
+                                               "error": "outcome unknown: ReadTimeout"})])
+    assert counts == {"sent": 0, "retried": 0, "failed": 1}
+    assert dlr.apply({"llm-reply:unknown-1": "delivered"}) == 1
+    db = SessionLocal()
+    try:
+        assert db.get(OutboxItem, item_id).status == "failed"
+        assert db.get(Message, msg_id).status == "delivered"
+    finally:
+        db.close()
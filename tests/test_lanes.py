@@ -0,0 +1,82 @@
+# tests/test_lanes.py
+import asyncio
+from collections import Counter
+from itertools import groupby
+
+import pytest
+
+from app.services import lanes, outbox
+from app.services.lanes import CAMPAIGN, CONVERSATION, MANUAL, WeightedRoundRobin
+from app.storage.db import Base, SessionLocal, engine
+from app.storage.models import Contact, Message, OutboxItem, Thread
+
+WEIGHTS = {CONVERSATION: 8, MANUAL: 3, CAMPAIGN: 1}
+
+
+@pytest.mark.parametrize("kind,lane", [
+    ("llm-reply", CONVERSATION), ("dnc-goodbye", CONVERSATION), ("manual", MANUAL),
+    ("batch", CAMPAIGN), ("admin", CAMPAIGN), ("campaign", CAMPAIGN), (None, CAMPAIGN),
+])
+def test_lane_for(kind, lane):
+    assert lanes.lane_for(kind) == lane
+
+
+def test_parse_weights():
+    assert lanes._parse_weights("") == WEIGHTS
+    assert lanes._parse_weights("conversation:20, campaign:2,bogus:9,manual:x") == {
+        CONVERSATION: 20, MANUAL: 3, CAMPAIGN: 2}
+    assert lanes._parse_weights("campaign:0")[CAMPAIGN] == 1
+
+
+def test_all_busy_picks_follow_the_weights():
+    wrr = WeightedRoundRobin(WEIGHTS)
+    picks = [wrr.pick(lanes.LANES) for _ in range(12 * 10)]
+    assert Counter(picks) == {CONVERSATION: 80, MANUAL: 30, CAMPAIGN: 10}
+
+
+def test_bulk_is_interleaved_not_starved():
+    wrr = WeightedRoundRobin(WEIGHTS)
+    picks = [wrr.pick(lanes.LANES) for _ in range(12)]
+    assert picks[0] == CONVERSATION
+    assert picks.count(CAMPAIGN) == 1
+    # conversation never runs more than its share back to back
+    assert max(len(list(run)) for lane, run in groupby(picks) if lane == CONVERSATION) < 8
+
+
+def test_idle_lanes_are_skipped_and_their_share_redistributed():
+    wrr = WeightedRoundRobin(WEIGHTS)
+    assert wrr.pick([]) is None
+    assert wrr.pick(["unknown"]) is None
+    assert {wrr.pick([CAMPAIGN]) for _ in range(5)} == {CAMPAIGN}
+    picks = Counter(wrr.pick([MANUAL, CAMPAIGN]) for _ in range(40))
+    assert picks == {MANUAL: 30, CAMPAIGN: 10}
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    s = SessionLocal()
+
+    def wipe():
+        s.rollback()
+        for model in (OutboxItem, Message, Thread, Contact):
+            s.query(model).delete()
+        s.commit()
+    wipe()
+    yield s
+    wipe()
+    s.close()
+
+
+def test_reply_is_claimed_ahead_of_a_queued_blast(db):
+    for i in range(20):
+        outbox.enqueue(db, f"370600001{i:02d}", "Akcija", kind="campaign")
+    reply = outbox.enqueue(db, "37060000999", "Ačiū", kind="llm-reply")
+    db.commit()
+
+    async def main():
+        w = outbox.OutboxWorkers(provider=None, tps=1000, burst=5)
+        return await w._next_batch(), w
+    batch, w = asyncio.run(main())
+    assert [it["id"] for it in batch] == [reply.id]
+    assert w.lane_stats[CAMPAIGN]["due"] == 20 and w.lane_stats[CONVERSATION]["claimed"] == 1
@@ -0,0 +1,134 @@
+# tests/test_leader.py
+import asyncio
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from app.services.leader import Leader
+from app.storage.locks import HeldLock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+pytestmark = pytest.mark.skipif(HeldLock("probe").backend != "flock", reason="flock backend only")
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("LOCK_DIR", str(tmp_path))
+    return tmp_path
+
+
+def test_lock_is_exclusive_until_released():
+    a, b = HeldLock("t"), HeldLock("t")
+    assert a.acquire() and a.held
+    assert a.acquire()  # re-entrant for the holder
+    assert not b.acquire() and not b.held
+    assert HeldLock("other").acquire()
+    a.release()
+    assert b.acquire()
+    b.release()
+
+
+def test_lock_goes_away_with_the_holding_process(lock_dir):
+    holder = subprocess.Popen(
+        [sys.executable, "-c", textwrap.dedent("""
+            import sys
+            from app.storage.locks import HeldLock
+            assert HeldLock("t").acquire()
+            print("held", flush=True)
+            sys.stdin.read()
+        """)],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, cwd=ROOT,
+    )
+    try:
+        assert holder.stdout.readline().strip() == "held"
+        assert not HeldLock("t").acquire()
+    finally:
+        holder.kill()
+        holder.wait()
+    lock = HeldLock("t")
+    assert lock.acquire()
+    lock.release()
+
+
+def _until(cond, timeout=3.0):
+    async def wait():
+        loop = asyncio.get_running_loop()
+        end = loop.time() + timeout
+        while not cond():
+            assert loop.time() < end, "condition not reached"
+            await asyncio.sleep(0.01)
+    return wait()
+
+
+def test_one_leader_runs_the_singletons_and_a_follower_takes_over():
+    runs = []
+
+    def job(who):
+        async def loop():
+            runs.append(who)
+            await asyncio.Event().wait()
+        return loop
+
+    async def main():
+        first, second = Leader("lead-t", retry_s=0.01), Leader("lead-t", retry_s=0.01)
+        first.singleton("poller", job("first"))
+        second.singleton("poller", job("second"))
+        await first.start()
+        await _until(lambda: first.is_leader)
+        await second.start()
+        await asyncio.sleep(0.1)
+        assert not second.is_leader and runs == ["first"]
+        assert first.stats()["jobs"] == {"poller": True}
+
+        await first.stop()  # the leader goes away; its lock with it
+        await _until(lambda: second.is_leader)
+        await _until(lambda: runs == ["first", "second"])
+        assert second.elections == 1 and not first.is_leader
+        await second.stop()
+    asyncio.run(main())
+
+
+def test_crashed_job_is_restarted():
+    starts = []
+
+    async def flaky():
+        starts.append(1)
+        if len(starts) < 3:
+            raise RuntimeError("boom")
+        await asyncio.Event().wait()
+
+    async def main():
+        leader = Leader("crash-t", retry_s=0.01)
+        leader.singleton("flaky", flaky)
+        await leader.start()
+        await _until(lambda: len(starts) == 3)
+        await asyncio.sleep(0.05)
+        assert len(starts) == 3
+        await leader.stop()
+    asyncio.run(main())
+
+
+def test_lost_lock_stops_the_singletons():
+    cancelled = []
+
+    async def job():
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        leader = Leader("lost-t", retry_s=0.01)
+        leader.singleton("job", job)
+        await leader.start()
+        await _until(lambda: leader.stats()["jobs"]["job"])
+        leader.lock.alive = lambda: False  # e.g. the Postgres session dropped
+        leader.lock.acquire = lambda blocking=False: False
+        await _until(lambda: cancelled == [1])
+        assert not leader.is_leader
+        await leader.stop()
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# tests/test_matcher.py
+import pandas as pd
+import pytest
+
+from app.services.matcher import build_matches, normalize_phones
+
+
+@pytest.mark.parametrize("raw,e164", [
+    ("860012345", "37060012345"),
+    ("8 600 12345", "37060012345"),
+    ("8-600-12345", "37060012345"),
+    ("60012345", "37060012345"),
+    ("+37060012345", "37060012345"),
+    ("0037060012345", "37060012345"),
+    ("37060012345", "37060012345"),
+    ("+370 (8) 600 12345", "37060012345"),
+    (" +370 600 12345 ", "37060012345"),
+    (37060012345.0, "37060012345"),       # Excel numeric cell
+    ("37060012345.0", "37060012345"),
+    ("+44 7700 900123", "447700900123"),
+    ("0044 7700 900123", "447700900123"),
+    ("447700900123", ""),                 # foreign numbers need + / 00
+    ("6001234", ""),                      # too short
+    ("+370600123456", ""),                # too long for LT
+    ("", ""),
+    (None, ""),
+    ("nėra", ""),
+])
+def test_normalize_phones(raw, e164):
+    assert normalize_phones(pd.Series([raw], dtype=object)).iat[0] == e164
+
+
+def test_normalize_keeps_the_index_and_length():
+    col = pd.Series(["860012345", None, "+37060012346"], index=[10, 20, 30], dtype=object)
+    out = normalize_phones(col)
+    assert out.index.tolist() == [10, 20, 30]
+    assert out.tolist() == ["37060012345", "", "37060012346"]
+
+
+def test_build_matches_dedups_people_by_normalized_phone():
+    people = pd.DataFrame({
+        "Miestas": ["Vilnius", "Vilniaus", "Kaunas", "Kaunas"],
+        "Specialybė": ["Mūrininkas", "mūrininkas", "Dažytojas", "Dažytojas"],
+        "Tel. nr": ["860012345", "+370 600 12345", "60012399", "bad"],
+    })
+    projects = pd.DataFrame({
+        "Miestas": ["Vilnius", "Lietuva"],
+        "Specialybė": ["Mūrininkas", "Dažytojas"],
+        "Aktualūs": [1, 2],
+    })
+    out = build_matches(people, projects)
+    assert out["Tel. nr"].tolist() == ["37060012345", "37060012399"]
+    assert out["match_id"].tolist() == [1, 2]
+    assert "Mūrininkas" in out["sms_text"].iat[0]
+
+
+def test_build_matches_without_required_columns_is_empty():
+    out = build_matches(pd.DataFrame({"Tel. nr": ["860012345"]}), pd.DataFrame())
+    assert out.empty and "sms_text" in out.columns
+
+
+def test_uploaded_numbers_find_contacts_created_by_inbound_senders():
+    from app.services import outbox
+    from app.storage.db import Base, SessionLocal, engine
+    from app.storage.models import Contact, Thread
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        outbox.ensure_contact_thread(db, "37060077701")  # MO sender, Infobip MSISDN form
+        db.add(Contact(phone="37060077702", dnc=True))
+        db.commit()
+        uploaded = normalize_phones(pd.Series(["8 600 77701", "+370 600 77702", "60077703"]))
+        state = outbox.contact_state(db, uploaded.tolist())
+        assert set(state) == {"37060077701", "37060077702"}
+        assert state["37060077701"]["thread_id"] is not None and not state["37060077701"]["dnc"]
+        assert state["37060077702"] == {"dnc": True, "thread_id": None}
+    finally:
+        db.rollback()
+        db.query(Thread).filter(Thread.phone.in_(["37060077701", "37060077702"])).delete(synchronize_session=False)
+        db.query(Contact).filter(Contact.phone.in_(["37060077701", "37060077702"])).delete(synchronize_session=False)
+        db.commit()
+        db.close()
@@ -0,0 +1,99 @@
+# tests/test_metrics.py
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.util import metrics
+
+SAMPLE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Metrics made by a test stay out of the process-wide registry."""
+    monkeypatch.setattr(metrics, "_metrics", [])
+    return metrics._metrics
+
+
+def test_counter_renders_labelled_series(registry):
+    c = metrics.Counter("t_total", "Things.", ("kind",))
+    c.inc("a")
+    c.inc("a", amount=2)
+    c.inc('we"ird\\')
+    assert metrics.render().splitlines() == [
+        "# HELP t_total Things.",
+        "# TYPE t_total counter",
+        't_total{kind="a"} 3',
+        't_total{kind="we\\"ird\\\\"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    h = metrics.Histogram("t_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.1, 0.5, 3.0):
+        h.observe(v, "x")
+    lines = metrics.render().splitlines()
+    assert lines[1] == "# TYPE t_seconds histogram"
+    assert lines[2:] == [
+        't_seconds_bucket{route="x",le="0.1"} 2',   # le is inclusive
+        't_seconds_bucket{route="x",le="1.0"} 3',
+        't_seconds_bucket{route="x",le="+Inf"} 4',
+        't_seconds_sum{route="x"} 3.65',
+        't_seconds_count{route="x"} 4',
+    ]
+
+
+def test_unlabelled_histogram(registry):
+    metrics.Histogram("t_lag", "Lag.", buckets=(1.0,)).observe(2.0)
+    assert 't_lag_bucket{le="1.0"} 0' in metrics.render()
+    assert "t_lag_count 1" in metrics.render()
+
+
+def test_gauges_are_read_at_scrape_time(registry):
+    state = {"n": 1}
+    metrics.gauge("t_depth", "Depth.", lambda: state["n"])
+    metrics.gauge("t_lanes", "Per lane.", lambda: {("a",): 2, ("b",): None}, ("lane",))
+    metrics.gauge("t_none", "Nothing yet.", lambda: None)
+    metrics.gauge("t_events_total", "Events.", lambda: 5, kind="counter")
+    state["n"] = 7
+    text = metrics.render()
+    assert "t_depth 7\n" in text
+    assert 't_lanes{lane="a"} 2\n' in text and 'lane="b"' not in text
+    assert "# TYPE t_none gauge\n" in text and "\nt_none " not in text
+    assert "# TYPE t_events_total counter\nt_events_total 5\n" in text
+
+
+def test_failing_gauge_does_not_break_the_scrape(registry):
+    metrics.gauge("t_bad", "Raises.", lambda: 1 / 0)
+    metrics.gauge("t_good", "Fine.", lambda: 1)
+    text = metrics.render()
+    assert "# HELP t_bad Raises." in text and "t_good 1" in text
+
+
+@pytest.mark.parametrize("sql,op", [
+    ("SELECT 1", "SELECT"), ("  insert into x values (1)", "INSERT"), ("UPDATE t SET a=1", "UPDATE"),
+    ("DELETE FROM t", "DELETE"), ("WITH q AS (SELECT 1) SELECT * FROM q", "WITH"), ("PRAGMA x", "OTHER"),
+])
+def test_sql_statement_kind(sql, op):
+    assert metrics._op(sql) == op
+
+
+def test_metrics_endpoint_exposes_the_hot_paths():
+    from app import main
+    with TestClient(main.app) as client:
+        assert client.get("/dlr/stats").status_code == 200
+        client.get("/no/such/path")
+        r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == metrics.CONTENT_TYPE
+    text = r.text
+    assert 'sms_http_request_duration_seconds_count{method="GET",route="/dlr/stats",status="200"}' in text
+    assert 'route="unmatched",status="404"' in text
+    assert re.search(r'sms_db_query_duration_seconds_count\{op="SELECT"\} [1-9]', text)
+    for name in ("sms_outbox_depth", "sms_leader", "sms_llm_breaker_open", "sms_dlr_buffered"):
+        assert f"# TYPE {name} " in text
+    for line in text.splitlines():
+        assert line.startswith("# ") or SAMPLE.match(line), line
+    helps = [line.split()[2] for line in text.splitlines() if line.startswith("# HELP")]
+    assert len(helps) == len(set(helps))
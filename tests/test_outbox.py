@@ -0,0 +1,181 @@
+# tests/test_outbox.py
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.services import lanes, outbox
+from app.storage.db import Base, SessionLocal, engine
+from app.storage.models import Contact, Message, OutboxItem, Thread
+
+
+@pytest.fixture(autouse=True)
+def db():
+    Base.metadata.create_all(bind=engine)
+    s = SessionLocal()
+
+    def wipe():
+        s.rollback()
+        for model in (OutboxItem, Message, Thread, Contact):
+            s.query(model).delete()
+        s.commit()
+    wipe()
+    yield s
+    wipe()
+    s.close()
+
+
+def _queue(db, phone, body="Labas", kind="manual", **kw):
+    item = outbox.enqueue(db, phone, body, kind=kind, **kw)
+    db.commit()
+    return item.id
+
+
+def _item(db, item_id):
+    db.expire_all()
+    return db.get(OutboxItem, item_id)
+
+
+def test_enqueue_writes_a_queued_message_and_outbox_row(db):
+    item = _item(db, _queue(db, "37060000001", "Sveiki", userref="r1"))
+    msg = db.get(Message, item.message_id)
+    assert (item.status, item.lane, item.attempts) == ("queued", lanes.MANUAL, 0)
+    assert (msg.dir, msg.status, msg.userref, msg.segments) == ("out", "queued", "r1", 1)
+
+
+def test_claim_moves_rows_to_sending_once(db):
+    ids = [_queue(db, f"3706000000{i}") for i in range(3)]
+    claimed = outbox.claim(2)
+    assert [c["id"] for c in claimed] == ids[:2]
+    assert claimed[0]["attempts"] == 1 and claimed[0]["to"] == "37060000000"
+    assert [c["id"] for c in outbox.claim(10)] == ids[2:]
+    assert outbox.claim(10) == []
+    assert {_item(db, i).status for i in ids} == {"sending"}
+
+
+def test_claim_skips_rows_not_yet_due_and_other_lanes(db):
+    later = _queue(db, "37060000001", not_before=datetime.utcnow() + timedelta(hours=1))
+    reply = _queue(db, "37060000002", kind="llm-reply")
+    bulk = _queue(db, "37060000003", kind="campaign")
+    assert [c["id"] for c in outbox.claim(10, lane=lanes.CAMPAIGN)] == [bulk]
+    assert [c["id"] for c in outbox.claim(10)] == [reply]
+    assert _item(db, later).status == "queued"
+
+
+def test_claim_fails_rows_for_dnc_contacts_except_the_goodbye(db):
+    plain = _queue(db, "37060000001")
+    bye = _queue(db, "37060000001", body="Atsisakėte", kind="dnc-goodbye")
+    db.get(Contact, "37060000001").dnc = True
+    db.commit()
+    assert [c["id"] for c in outbox.claim(10)] == [bye]
+    item = _item(db, plain)
+    assert (item.status, item.error) == ("failed", "dnc")
+    assert db.get(Message, item.message_id).status == "failed"
+
+
+def test_record_sent_retried_and_failed(db):
+    ok, retry, bad = (_queue(db, f"3706000000{i}") for i in range(3))
+    claimed = {c["id"]: c for c in outbox.claim(10)}
+    t0 = datetime.utcnow()
+    counts = outbox.record([
+        (claimed[ok], {"ok": True, "provider_id": "p-1"}),
+        (claimed[retry], {"ok": False, "retryable": True, "error": "503"}),
+        (claimed[bad], {"ok": False, "retryable": False, "error": "invalid destination"}),
+    ])
+    assert counts == {"sent": 1, "retried": 1, "failed": 1}
+
+    sent = _item(db, ok)
+    assert (sent.status, sent.provider_id) == ("sent", "p-1")
+    assert db.get(Message, sent.message_id).status == "sent"
+
+    again = _item(db, retry)
+    assert (again.status, again.error) == ("queued", "503")
+    cap = outbox.OUTBOX_RETRY_BASE_S  # first retry: up to base * 2**0
+    assert t0 <= again.next_attempt_at <= datetime.utcnow() + timedelta(seconds=cap)
+
+    dead = _item(db, bad)
+    assert (dead.status, dead.error) == ("failed", "invalid destination")
+
+
+def test_retry_backoff_grows_with_attempts(db, monkeypatch):
+    seen = []
+    monkeypatch.setattr(outbox, "backoff_delay", lambda attempt, base, cap: seen.append((attempt, base, cap)) or 0.0)
+    item_id = _queue(db, "37060000001")
+    for _ in range(3):
+        (it,) = outbox.claim(1)
+        outbox.record([(it, {"ok": False, "retryable": True, "error": "timeout"})])
+    assert [a for a, _, _ in seen] == [0, 1, 2]
+    assert {(b, c) for _, b, c in seen} == {(outbox.OUTBOX_RETRY_BASE_S, outbox.OUTBOX_RETRY_MAX_S)}
+    assert _item(db, item_id).attempts == 3
+
+
+def test_retries_stop_at_max_attempts(db, monkeypatch):
+    monkeypatch.setattr(outbox, "backoff_delay", lambda attempt, base, cap: 0.0)
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    item_id = _queue(db, "37060000001")
+    results = []
+    for _ in range(3):
+        claimed = outbox.claim(1)
+        if claimed:
+            results.append(outbox.record([(claimed[0], {"ok": False, "retryable": True, "error": "503"})]))
+    assert results == [{"sent": 0, "retried": 1, "failed": 0}, {"sent": 0, "retried": 0, "failed": 1}]
+    assert _item(db, item_id).status == "failed"
+
+
+def test_recover_stale_fails_interrupted_sends(db):
+    item_id = _queue(db, "37060000001")
+    outbox.claim(1)
+    assert outbox.recover_stale(older_than_s=60) == 0
+    item = _item(db, item_id)
+    item.claimed_at = datetime.utcnow() - timedelta(minutes=5)
+    db.commit()
+    assert outbox.recover_stale(older_than_s=60) == 1
+    item = _item(db, item_id)
+    assert (item.status, item.error) == ("failed", "interrupted")
+
+
+class FakeProvider:
+    def __init__(self, fail_first=False):
+        self.batches = []
+        self.fail_first = fail_first
+
+    async def send_many(self, items):
+        self.batches.append([it["id"] for it in items])
+        if self.fail_first and len(self.batches) == 1:
+            raise RuntimeError("provider down")
+        return [{"ok": True, "provider_id": f"p-{it['id']}"} for it in items]
+
+
+def _drain(provider, db, ids, timeout=5.0):
+    async def main():
+        w = outbox.OutboxWorkers(provider, workers=2, tps=1000, burst=100)
+        await w.start()
+        try:
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                db.expire_all()
+                if all(db.get(OutboxItem, i).status == "sent" for i in ids):
+                    return w.stats
+                w.wake()
+                await asyncio.sleep(0.02)
+            raise AssertionError("outbox did not drain")
+        finally:
+            await w.stop()
+    return asyncio.run(main())
+
+
+def test_workers_send_everything_queued(db):
+    ids = [_queue(db, f"3706000000{i}", kind=k) for i, k in enumerate(["campaign", "manual", "llm-reply"])]
+    provider = FakeProvider()
+    stats = _drain(provider, db, ids)
+    assert stats["sent"] == 3
+    assert sorted(i for b in provider.batches for i in b) == sorted(ids)
+
+
+def test_workers_retry_after_a_provider_exception(db, monkeypatch):
+    monkeypatch.setattr(outbox, "backoff_delay", lambda attempt, base, cap: 0.0)
+    item_id = _queue(db, "37060000001")
+    stats = _drain(FakeProvider(fail_first=True), db, [item_id])
+    assert stats["retried"] == 1 and stats["sent"] == 1
+    assert _item(db, item_id).attempts == 2
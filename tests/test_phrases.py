@@ -0,0 +1,133 @@
+# tests/test_phrases.py
+import os
+
+import pytest
+
+from app.services import phrases
+from app.services.phrases import PhraseAutomaton, PhraseMatcher, fold
+from app.storage.db import Base, SessionLocal, engine
+from app.storage.models import Phrase
+
+
+@pytest.fixture
+def phrase_file(tmp_path, monkeypatch):
+    path = tmp_path / "dnc_phrases.txt"
+    monkeypatch.setattr(phrases, "DNC_PHRASES_FILE", path)
+    monkeypatch.delenv("DNC_PHRASES", raising=False)
+    return path
+
+
+@pytest.fixture
+def table():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.query(Phrase).delete()
+    db.commit()
+    yield db
+    db.rollback()
+    db.query(Phrase).delete()
+    db.commit()
+    db.close()
+
+
+@pytest.fixture
+def m(phrase_file, table):
+    return PhraseMatcher(check_s=0)
+
+
+@pytest.mark.parametrize("raw,folded", [
+    ("NEDOMINA!!!", "nedomina"),
+    ("Nerašykite   daugiau.", "nerasykite daugiau"),
+    ("Nedominа", "nedomina"),        # Cyrillic а
+    ("ST0P", "stop"),
+    ("Ištrinkite-mano numerį", "istrinkite mano numeri"),
+])
+def test_fold(raw, folded):
+    assert fold(raw) == folded
+
+
+def test_automaton_matches_whole_words_only():
+    ac = PhraseAutomaton({"stop": "dnc", "nerasykite daugiau": "dnc"})
+    assert ac.size == 2
+    assert ac.search("stop") == ("stop", "dnc")
+    assert ac.search("prasau nerasykite daugiau man") == ("nerasykite daugiau", "dnc")
+    assert ac.search("stopas") is None
+    assert ac.search("autostop") is None
+    assert ac.search("nerasykite daugiaus") is None
+
+
+def test_automaton_finds_phrases_through_suffix_links():
+    ac = PhraseAutomaton({"ne": "dnc", "labai ne": "other", "ai ne tas": "dnc"})
+    assert ac.search("labai ne") == ("labai ne", "other")  # the longer phrase ending at the same place
+    assert ac.search("ai ne tas") == ("ne", "dnc")         # " ne " ends first, inside the longer phrase
+    assert ac.search("tai ne") == ("ne", "dnc")
+    assert PhraseAutomaton({}).search("bet kas") is None
+
+
+@pytest.mark.parametrize("text,hit", [
+    ("STOP", True),
+    ("Nedomina, ačiū", True),
+    ("Nedominа", True),
+    ("nebesiuskite man daugiau", True),
+    ("Jei šis nedomina, ar yra kitas objektas?", False),   # a question is not an opt-out
+    ("Šis objektas nedomina, bet gal turite darbo Vilniuje arba Kaune", False),  # too many other words
+    ("Domina", False),
+])
+def test_builtins_count_only_as_a_short_whole_message(m, text, hit):
+    assert (m.match(text) is not None) is hit
+
+
+def test_curated_phrases_match_anywhere(m, phrase_file, monkeypatch):
+    monkeypatch.setenv("DNC_PHRASES", "Nebenoriu žinučių")
+    phrase_file.write_text("# operator list\nišbraukite mane  # from support\n", encoding="utf-8")
+    m = PhraseMatcher(check_s=0)
+    assert m.match("Labas, išbraukite mane iš sąrašo, ar galite?") == ("isbraukite mane", "dnc")
+    assert m.match("Sveiki, nebenoriu žinučių iš jūsų, kaip ir sakiau anksčiau") == ("nebenoriu zinuciu", "dnc")
+
+
+def test_curated_copy_of_a_builtin_matches_anywhere(m, table):
+    long_question = "Jei šis nedomina, ar yra kitas objektas?"
+    assert m.match(long_question) is None
+    table.add(Phrase(phrase="Nedomina"))
+    table.commit()
+    assert m.match(long_question) == ("nedomina", "dnc")
+
+
+def test_table_edits_are_picked_up_without_restart(m, table):
+    assert m.match("gal vėliau kada nors") is None
+    loads = m.reloads
+    table.add(Phrase(phrase="gal vėliau", kind="later"))
+    table.commit()
+    assert m.match("gal vėliau kada nors") == ("gal veliau", "later")
+    assert m.reloads == loads + 1
+    m.match("x")
+    assert m.reloads == loads + 1  # nothing changed: no rebuild
+
+    row = table.query(Phrase).one()
+    row.phrase = "kada nors"
+    table.commit()
+    assert m.match("gal vėliau kada nors") == ("kada nors", "later")
+    table.delete(row)
+    table.commit()
+    assert m.match("gal vėliau kada nors") is None
+
+
+def test_file_edits_are_picked_up(m, phrase_file):
+    assert m.match("prašau išbraukti mano numerį iš sąrašo") is None
+    phrase_file.write_text("išbraukti mano numerį\n", encoding="utf-8")
+    os.utime(phrase_file, ns=(1, 10 ** 18))
+    assert m.match("prašau išbraukti mano numerį iš sąrašo") == ("isbraukti mano numeri", "dnc")
+
+
+def test_builtins_can_be_turned_off(m, monkeypatch):
+    monkeypatch.setattr(phrases, "DNC_DEFAULT_PHRASES", False)
+    assert PhraseMatcher(check_s=0).match("STOP") is None
+
+
+def test_check_interval_caches_the_automata(phrase_file, table):
+    m = PhraseMatcher(check_s=3600)
+    assert m.match("gal vėliau") is None
+    table.add(Phrase(phrase="gal vėliau"))
+    table.commit()
+    assert m.match("gal vėliau") is None  # not re-checked yet
+    assert m.reloads == 1
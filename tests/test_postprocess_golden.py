@@ -0,0 +1,28 @@
+# tests/test_postprocess_golden.py
+"""The single-pass engine must match the legacy guards byte for byte (raw output, before _final_sms)."""
+import os
+
+import pytest
+
+from app.services import llm as L
+from app.tools.bench_postprocess import load, synthetic
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "data", "postprocess_golden.jsonl")
+
+
+def _both(c):
+    args = (c["reply"], c["plan"], c["history"], c["user_text"])
+    return L._postprocess_legacy(*args), L._postprocess(*args)
+
+
+@pytest.mark.parametrize("case", list(load(GOLDEN)), ids=lambda c: c["reply"][:30])
+def test_golden_corpus(case):
+    legacy, engine = _both(case)
+    assert engine == legacy
+
+
+@pytest.mark.parametrize("seed", [1, 2, 7])
+def test_synthetic_corpus(seed):
+    diffs = [(c, *_both(c)) for c in synthetic(5000, seed)]
+    diffs = [d for d in diffs if d[1] != d[2]]
+    assert not diffs, diffs[:3]
@@ -0,0 +1,105 @@
+# tests/test_prompt_prefix.py
+"""
+What the provider sees across consecutive turns: request bodies captured from
+a stub OpenAI API. The leading messages must be byte-identical from one call
+to the next, with per-turn data only after them.
+"""
+import json
+
+import httpx
+import pytest
+from openai import OpenAI
+
+from app.services import llm
+from app.services.resilience import CircuitBreaker
+
+THREAD = [
+    {"role": "assistant", "content": "Sveiki, ar domintų darbas statybose Kaune?"},
+    {"role": "user", "content": "Gal ir domintų, kokia alga?"},
+]
+TURNS = [  # (user SMS, assistant reply) in order
+    ("Nuo kito mėnesio galėčiau", "Ačiū. Kokią patirtį turite?"),
+    ("Dirbau mūrininku 5 metus", "Puiku. Ar turite savo transportą?"),
+]
+
+
+@pytest.fixture
+def bodies(monkeypatch):
+    llm.get_client()  # resolves the SDK exception classes
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.content)
+        return httpx.Response(200, json={
+            "id": "c", "object": "chat.completion", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": '{"interest": "yes"}'}}],
+        })
+
+    client = OpenAI(api_key="test", base_url="http://stub.local/v1", max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm, "_client", client)
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker("openai-test"))
+    return seen
+
+
+def _wire(msg: dict) -> bytes:
+    """A message as the SDK serializes it inside the request body."""
+    return json.dumps(msg).encode()
+
+
+def _system_prefix(body: bytes, content: str) -> bytes:
+    head = b'{"messages": [' + _wire({"role": "system", "content": content})
+    assert body.startswith(head)
+    return head
+
+
+def test_analyze_consecutive_turns_share_the_leading_messages(bodies):
+    history = list(THREAD)
+    for text, reply in TURNS:
+        llm.analyze(text, history)
+        history += [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+    first, second = bodies
+    # turn 1's request minus its final user message is, byte for byte, the start of turn 2's
+    cut = first.rindex(_wire({"role": "user", "content": TURNS[0][0]}))
+    assert second[:cut] == first[:cut]
+    _system_prefix(first, llm.ANALYZER_SYS)
+    # the per-turn message only appears after that prefix
+    assert json.dumps(TURNS[1][0])[1:-1].encode() not in second[:cut]
+    assert json.loads(second)["messages"][-1] == {"role": "user", "content": TURNS[1][0]}
+
+
+def test_generate_consecutive_turns_share_the_system_prompt(bodies):
+    history = list(THREAD)
+    plans = [{"interest": "yes", "intent": "other"}, {"interest": "unsure", "intent": "direct_question"}]
+    for (text, reply), plan in zip(TURNS, plans):
+        llm.generate_sms(plan, history + [{"role": "user", "content": text}])
+        history += [{"role": "user", "content": text}, {"role": "assistant", "content": reply}]
+    heads = [_system_prefix(b, llm.GENERATOR_SYS) for b in bodies]
+    assert heads[0] == heads[1]
+    for body, plan in zip(bodies, plans):
+        msgs = json.loads(body)["messages"]
+        assert len(msgs) == 2 and msgs[1]["role"] == "user"
+        assert json.loads(msgs[1]["content"])["plan"] == plan  # plan and history only in the last message
+
+
+def test_other_threads_share_the_same_system_message(bodies):
+    llm.analyze("Kiek mokate?", [])
+    llm.analyze("Kas per objektas?", THREAD)
+    heads = [_system_prefix(b, llm.ANALYZER_SYS) for b in bodies]
+    assert heads[0] == heads[1]
+
+
+def test_analyze_sends_history_as_chat_turns(bodies):
+    llm.analyze("Kiek mokate?", THREAD)
+    msgs = json.loads(bodies[0])["messages"]
+    assert msgs[1:-1] == THREAD
+    assert msgs[-1] == {"role": "user", "content": "Kiek mokate?"}
+
+
+def test_compacted_summary_follows_the_static_prefix(bodies):
+    long_thread = THREAD * 6
+    llm.analyze("Kiek mokate?", long_thread)
+    msgs = json.loads(bodies[0])["messages"]
+    assert msgs[0] == {"role": "system", "content": llm.ANALYZER_SYS}
+    assert msgs[1]["role"] == "system" and msgs[1]["content"].startswith("Earlier in this thread: ")
@@ -0,0 +1,61 @@
+# tests/test_ratelimit.py
+import asyncio
+import time
+
+import pytest
+
+from app.services.ratelimit import TokenBucket
+
+
+def test_burst_is_available_at_once():
+    b = TokenBucket(rate=10, burst=5)
+
+    async def main():
+        return [await b.acquire() for _ in range(5)]
+    assert asyncio.run(main()) == [0.0] * 5
+    assert b.available() < 1
+
+
+def test_debt_is_slept_off_at_the_rate():
+    b = TokenBucket(rate=50, burst=1)
+
+    async def main():
+        await b.acquire()
+        t0 = time.monotonic()
+        waited = await b.acquire()
+        return waited, time.monotonic() - t0
+    waited, took = asyncio.run(main())
+    assert waited == pytest.approx(0.02, abs=0.005)
+    assert took >= 0.015
+
+
+def test_batch_larger_than_burst_is_spread():
+    b = TokenBucket(rate=100, burst=10)
+    waited = asyncio.run(b.acquire(30))
+    assert waited == pytest.approx(0.2, abs=0.01)  # 20 tokens of debt at 100/s
+
+
+def test_concurrent_callers_are_served_in_call_order():
+    b = TokenBucket(rate=100, burst=1)
+    done = []
+
+    async def take(i):
+        await b.acquire()
+        done.append(i)
+
+    async def main():
+        await asyncio.gather(*(take(i) for i in range(5)))
+    asyncio.run(main())
+    assert done == [0, 1, 2, 3, 4]
+
+
+def test_refill_is_capped_at_burst():
+    b = TokenBucket(rate=1000, burst=3)
+    time.sleep(0.02)
+    assert b.available() == 3
+
+
+def test_defaults_and_floors():
+    b = TokenBucket(rate=0)
+    assert b.rate > 0 and b.burst == 1.0
+    assert TokenBucket(rate=7).burst == 7.0
@@ -0,0 +1,318 @@
+# tests/test_resilience.py
+import time
+from datetime import datetime
+
+import httpx
+import pytest
+from openai import OpenAI
+
+from app.services import llm, resilience
+from app.services.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceeded, call_with_retries,
+)
+
+
+class Flaky(Exception):
+    pass
+
+
+class Rejected(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, base, cap: 0.0)
+
+
+def _stub(*outcomes):
+    """fn(remaining) that raises / returns the given outcomes in order."""
+    calls = []
+
+    def fn(remaining):
+        calls.append(remaining)
+        out = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(out, BaseException):
+            raise out
+        return out
+    return fn, calls
+
+
+# ==== call_with_retries ====
+def test_retries_until_success():
+    fn, calls = _stub(Flaky("1"), Flaky("2"), "ok")
+    assert call_with_retries(fn, deadline_s=5, attempts=3, retry_on=(Flaky,)) == "ok"
+    assert len(calls) == 3
+
+
+def test_gives_up_after_attempts():
+    fn, calls = _stub(Flaky("down"))
+    with pytest.raises(DeadlineExceeded) as ei:
+        call_with_retries(fn, deadline_s=5, attempts=3, retry_on=(Flaky,))
+    assert len(calls) == 3
+    assert isinstance(ei.value.__cause__, Flaky)
+
+
+def test_non_retryable_propagates_at_once():
+    fn, calls = _stub(Rejected("400"))
+    with pytest.raises(Rejected):
+        call_with_retries(fn, deadline_s=5, attempts=3, retry_on=(Flaky,))
+    assert len(calls) == 1
+
+
+def test_deadline_bounds_the_attempts():
+    def slow(remaining):
+        time.sleep(min(remaining, 0.05))
+        raise Flaky("timeout")
+    t0 = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(slow, deadline_s=0.12, attempts=10, retry_on=(Flaky,))
+    assert time.monotonic() - t0 < 0.5
+
+
+def test_remaining_time_shrinks_between_attempts():
+    fn, calls = _stub(Flaky("1"), Flaky("2"), "ok")
+    call_with_retries(fn, deadline_s=5, attempts=3, retry_on=(Flaky,))
+    assert calls[0] <= 5 and calls[0] >= calls[1] >= calls[2]
+
+
+# ==== CircuitBreaker ====
+def test_breaker_opens_after_threshold_and_refuses():
+    br = CircuitBreaker("t", failure_threshold=2, reset_seconds=60)
+    fn, calls = _stub(Flaky("down"))
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(fn, deadline_s=5, attempts=2, retry_on=(Flaky,), breaker=br)
+    assert br.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_with_retries(fn, deadline_s=5, attempts=2, retry_on=(Flaky,), breaker=br)
+    assert len(calls) == 2
+
+
+def test_breaker_half_open_single_trial():
+    br = CircuitBreaker("t", failure_threshold=1, reset_seconds=0.01)
+    br.record_failure()
+    assert br.state == "open"
+    time.sleep(0.02)
+    assert br.state == "half_open"
+    assert br.allow() is True
+    assert br.allow() is False  # one trial at a time
+    br.record_success()
+    assert br.state == "closed"
+
+
+def test_failed_trial_reopens():
+    br = CircuitBreaker("t", failure_threshold=3, reset_seconds=0.01)
+    for _ in range(3):
+        br.record_failure()
+    time.sleep(0.02)
+    fn, _ = _stub(Flaky("still down"))
+    with pytest.raises(DeadlineExceeded):
+        call_with_retries(fn, deadline_s=5, attempts=1, retry_on=(Flaky,), breaker=br)
+    assert br.state == "open"
+
+
+def test_alive_errors_count_as_success():
+    br = CircuitBreaker("t", failure_threshold=2, reset_seconds=60)
+    br.record_failure()
+    fn, _ = _stub(Rejected("400"))
+    with pytest.raises(Rejected):
+        call_with_retries(fn, deadline_s=5, retry_on=(Flaky,), alive_on=(Rejected,), breaker=br)
+    br.record_failure()
+    assert br.state == "closed"  # the 400 reset the failure count
+
+
+def test_other_errors_count_as_failure():
+    br = CircuitBreaker("t", failure_threshold=2, reset_seconds=60)
+    fn, _ = _stub(PermissionError("401"))
+    for _ in range(2):
+        with pytest.raises(PermissionError):
+            call_with_retries(fn, deadline_s=5, retry_on=(Flaky,), alive_on=(Rejected,), breaker=br)
+    assert br.state == "open"
+
+
+def test_cancellation_releases_the_trial_without_closing():
+    br = CircuitBreaker("t", failure_threshold=1, reset_seconds=0.01)
+    br.record_failure()
+    time.sleep(0.02)
+    fn, _ = _stub(KeyboardInterrupt())
+    with pytest.raises(KeyboardInterrupt):
+        call_with_retries(fn, deadline_s=5, retry_on=(Flaky,), breaker=br)
+    assert br.state == "half_open"
+    assert br.allow() is True  # the trial slot is free again
+
+
+# ==== llm._complete against a stub OpenAI API ====
+def _completion(content: str) -> dict:
+    return {
+        "id": "c1", "object": "chat.completion", "created": 0, "model": "stub",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """Route the OpenAI client to a scripted handler; a fresh breaker per test."""
+    llm.get_client()  # resolves the SDK exception classes
+    script = []
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        step = script[min(len(requests), len(script)) - 1]
+        if callable(step):
+            return step(request)
+        if isinstance(step, Exception):
+            raise step
+        status, body = step
+        return httpx.Response(status, json=body)
+
+    client = OpenAI(api_key="test", base_url="http://stub.local/v1", max_retries=0,
+                    http_client=httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm, "_client", client)
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker("openai-test", failure_threshold=3, reset_seconds=60))
+    return script, requests
+
+
+def test_complete_retries_5xx_then_succeeds(stub_api):
+    script, requests = stub_api
+    script += [(500, {"error": {"message": "boom"}}), (503, {"error": {"message": "busy"}}),
+               (200, _completion('{"intent": "questions", "confidence": 0.9}'))]
+    assert llm.classify_lt("Kiek mokate?") == {"intent": "questions", "confidence": 0.9}
+    assert len(requests) == 3
+    assert llm.breaker.state == "closed"
+
+
+def test_complete_timeouts_open_the_breaker(stub_api):
+    script, requests = stub_api
+    script.append(httpx.ReadTimeout("stub timeout"))
+    with pytest.raises(llm.LLMUnavailable):
+        llm._complete("classify", messages=[{"role": "user", "content": "x"}])
+    assert len(requests) == 3
+    assert llm.breaker.state == "open"
+    with pytest.raises(llm.LLMUnavailable) as ei:
+        llm._complete("classify", messages=[{"role": "user", "content": "x"}])
+    assert isinstance(ei.value.__cause__, CircuitOpenError)
+    assert len(requests) == 3
+
+
+def test_complete_400_is_not_retried_and_keeps_breaker_closed(stub_api):
+    script, requests = stub_api
+    script.append((400, {"error": {"message": "bad request"}}))
+    for _ in range(5):
+        with pytest.raises(llm.LLMUnavailable):
+            llm._complete("classify", messages=[{"role": "user", "content": "x"}])
+    assert len(requests) == 5
+    assert llm.breaker.state == "closed"
+
+
+def test_complete_401_counts_against_the_breaker(stub_api):
+    script, requests = stub_api
+    script.append((401, {"error": {"message": "bad key"}}))
+    for _ in range(3):
+        with pytest.raises(llm.LLMUnavailable):
+            llm._complete("classify", messages=[{"role": "user", "content": "x"}])
+    assert len(requests) == 3
+    assert llm.breaker.state == "open"
+
+
+@pytest.mark.parametrize("text", ["Nedomina", "Ne, ačiū, bet ar yra kitas darbas?", "Kiek mokate?"])
+def test_classify_fallback_never_declines(stub_api, text):
+    script, _ = stub_api
+    script.append(httpx.ConnectError("stub down"))
+    assert llm.classify_lt(text) == {"intent": "other", "confidence": 0.0}
+
+
+def test_classify_fallback_while_breaker_open(stub_api):
+    script, requests = stub_api
+    for _ in range(3):
+        llm.breaker.record_failure()
+    assert llm.classify_lt("Nedomina, ačiū") == {"intent": "other", "confidence": 0.0}
+    assert requests == []
+
+
+# ==== generate_reply_lt fallback: the SMS that goes out when the LLM is down ====
+FALLBACK_TEMPLATES = {llm.INTEREST_QUESTION, llm.DECLINE_TX, llm.CLOSE_TX, *llm.SLOT_QUESTIONS.values()}
+
+
+@pytest.fixture
+def thread_db():
+    from app.storage.db import Base, SessionLocal, engine
+    from app.storage.models import Contact, Message, Thread
+    Base.metadata.create_all(bind=engine)
+    made = []
+
+    def make(phone, turns):
+        db = SessionLocal()
+        try:
+            db.add(Contact(phone=phone))
+            t = Thread(phone=phone)
+            db.add(t)
+            db.flush()
+            for i, (direction, body) in enumerate(turns):
+                db.add(Message(thread_id=t.id, dir=direction, body=body,
+                               ts=datetime(2026, 1, 1, 12, i), status="delivered"))
+            db.commit()
+            made.append(phone)
+        finally:
+            db.close()
+    yield make
+    db = SessionLocal()
+    try:
+        for phone in made:
+            ids = [t.id for t in db.query(Thread).filter_by(phone=phone)]
+            db.query(Message).filter(Message.thread_id.in_(ids)).delete(synchronize_session=False)
+            db.query(Thread).filter_by(phone=phone).delete()
+            db.query(Contact).filter_by(phone=phone).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def _assert_fallback(reply, expected):
+    assert reply == expected
+    assert reply.strip() and reply in FALLBACK_TEMPLATES
+    assert "lietuviškai" not in reply and "error" not in reply.lower()
+
+
+REPLY_CASES = [  # (SMS, thread so far, expected fallback)
+    ("Kiek mokate?", [], llm.INTEREST_QUESTION),
+    ("Nedomina, ačiū", [], llm.DECLINE_TX),
+    ("Taip, domina", [], llm.SLOT_QUESTIONS["years"]),
+    ("Nuo kitos savaitės", [("out", llm.INTEREST_QUESTION), ("in", "Taip, domina"),
+                            ("out", llm.SLOT_QUESTIONS["years"]), ("in", "5 metus")], llm.CLOSE_TX),
+    ("O kur objektas?", [("out", llm.INTEREST_QUESTION), ("in", "Taip"),
+                         ("out", llm.SLOT_QUESTIONS["years"]), ("in", "Dirbau 3 metus")],
+     llm.SLOT_QUESTIONS["availability"]),
+]
+
+
+@pytest.mark.parametrize("text,turns,expected", REPLY_CASES)
+def test_reply_fallback_while_breaker_open(stub_api, thread_db, text, turns, expected):
+    script, requests = stub_api
+    phone = f"3706100{REPLY_CASES.index((text, turns, expected)):04d}"
+    thread_db(phone, turns)
+    for _ in range(3):
+        llm.breaker.record_failure()
+    _assert_fallback(llm.generate_reply_lt({"msisdn": phone}, text), expected)
+    assert requests == []
+
+
+@pytest.mark.parametrize("text,turns,expected", REPLY_CASES)
+def test_reply_fallback_after_deadline(stub_api, thread_db, monkeypatch, text, turns, expected):
+    script, requests = stub_api
+    phone = f"3706200{REPLY_CASES.index((text, turns, expected)):04d}"
+    thread_db(phone, turns)
+    monkeypatch.setattr(llm, "breaker", CircuitBreaker("openai-test", failure_threshold=100))
+    monkeypatch.setattr(llm, "LLM_RETRY_ATTEMPTS", 50)
+    monkeypatch.setattr(llm, "LLM_DEADLINES", {"analyze": 0.1, "generate": 0.1})
+
+    def slow(request):
+        time.sleep(0.03)
+        raise httpx.ReadTimeout("stub timeout")
+    script.append(slow)
+    t0 = time.monotonic()
+    _assert_fallback(llm.generate_reply_lt({"msisdn": phone}, text), expected)
+    assert time.monotonic() - t0 < 1.0
+    assert 0 < len(requests) < 50  # the deadline, not the attempt budget, ended both stages
@@ -0,0 +1,140 @@
+# tests/test_routing.py
+import asyncio
+import time
+import types
+
+import pytest
+
+from app.providers import routing
+from app.providers.routing import RoutingProvider
+
+
+class FakeRoute:
+    """A provider whose send_many answers ok, fails retryably, raises or stalls on demand."""
+
+    def __init__(self, name, mode="ok", delay=0.0):
+        self.name = name
+        self.mode = mode
+        self.delay = delay
+        self.batches = []
+
+    async def send_many(self, items):
+        self.batches.append([it["to"] for it in items])
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.mode == "raise":
+            raise ConnectionError(f"{self.name} down")
+        ok = self.mode == "ok"
+        return [{"to": it["to"], "userref": it.get("userref"), "ok": ok,
+                 "provider_id": f"{self.name}-{it['to']}" if ok else None,
+                 "error": None if ok else "503", "retryable": not ok} for it in items]
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # only routing's view of time; the event loop keeps the real clock
+    c = Clock()
+    monkeypatch.setattr(routing, "time", types.SimpleNamespace(monotonic=c, perf_counter=time.perf_counter))
+    return c
+
+
+def _items(n=2):
+    return [{"to": f"3706000000{i}", "text": "x", "userref": str(i)} for i in range(n)]
+
+
+def _send(rp, n=2):
+    return asyncio.run(rp.send_many(_items(n)))
+
+
+def test_failover_to_next_route(clock):
+    a, b = FakeRoute("a", "fail"), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)])
+    res = _send(rp)
+    assert [r["route"] for r in res] == ["b", "b"]
+    assert all(r["ok"] for r in res)
+    assert len(a.batches) == 1 and len(b.batches) == 1
+
+
+def test_raising_route_fails_over(clock):
+    a, b = FakeRoute("a", "raise"), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)])
+    assert all(r["ok"] and r["route"] == "b" for r in _send(rp))
+
+
+def test_every_route_failing_keeps_last_error(clock):
+    rp = RoutingProvider([("a", FakeRoute("a", "fail")), ("b", FakeRoute("b", "fail"))])
+    res = _send(rp)
+    assert [r["route"] for r in res] == ["b", "b"]
+    assert not any(r["ok"] for r in res) and all(r["retryable"] for r in res)
+
+
+def _park(rp, route):
+    route.mode = "fail"
+    h = rp.routes[0]
+    while h.available(routing.time.monotonic()):
+        _send(rp)
+    return h
+
+
+def test_degraded_route_is_parked_and_skipped(clock):
+    a, b = FakeRoute("a"), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)])
+    h = _park(rp, a)
+    assert h.success < routing.ROUTING_MIN_SUCCESS
+    assert rp.stats()["a"]["available"] is False
+    a.mode = "ok"
+    n = len(a.batches)
+    clock.t += routing.ROUTING_COOLDOWN_S / 2
+    _send(rp)
+    assert len(a.batches) == n  # parked: b goes first
+
+
+def test_successful_probe_brings_route_back(clock):
+    a, b = FakeRoute("a"), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)])
+    h = _park(rp, a)
+    # a long outage: a is still tried as the last resort while b fails too
+    b.mode = "fail"
+    for _ in range(5):
+        _send(rp)
+    assert h.success < 0.2
+    a.mode = b.mode = "ok"
+    clock.t += routing.ROUTING_COOLDOWN_S + 1
+    # make a the first pick once it is available again
+    rp.routes[1].latency_ms = 10_000.0
+    res = _send(rp)
+    assert [r["route"] for r in res] == ["a", "a"]
+    assert h.available(clock.t)
+    assert h.success >= routing.ROUTING_MIN_SUCCESS
+    # and it stays in rotation on the following calls
+    for _ in range(3):
+        assert all(r["route"] == "a" for r in _send(rp))
+    assert rp.stats()["a"]["available"] is True
+
+
+def test_failed_probe_parks_again(clock):
+    a, b = FakeRoute("a"), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)])
+    h = _park(rp, a)
+    clock.t += routing.ROUTING_COOLDOWN_S + 1
+    rp.routes[1].latency_ms = 10_000.0
+    res = _send(rp)
+    assert [r["route"] for r in res] == ["b", "b"]  # probe failed, failed over
+    assert not h.available(clock.t)
+    assert h.down_until == pytest.approx(clock.t + routing.ROUTING_COOLDOWN_S)
+
+
+def test_hedge_sends_to_backup_when_first_is_slow(clock):
+    a, b = FakeRoute("a", delay=0.2), FakeRoute("b")
+    rp = RoutingProvider([("a", a), ("b", b)], hedge_ms=20)
+    res = _send(rp)
+    assert all(r["route"] == "b" for r in res)
+    assert rp.routes[1].hedges == 1 and rp.routes[1].hedge_wins == 1
@@ -0,0 +1,85 @@
+# tests/test_schedule.py
+from datetime import datetime, time as dtime
+
+import pytest
+
+from app.services import schedule
+
+MON = datetime(2026, 10, 19, 10, 0)   # Monday, window open, 8h left
+FRI_EVENING = datetime(2026, 10, 23, 20, 0)
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(schedule, "SKIP_BH", False)
+    monkeypatch.setattr(schedule, "OPEN_AT", dtime(9, 0))
+    monkeypatch.setattr(schedule, "CLOSE_AT", dtime(18, 0))
+    monkeypatch.setattr(schedule, "DAYS", {0, 1, 2, 3, 4})
+    monkeypatch.setattr(schedule, "CAMPAIGN_PACING", "even")
+
+
+def test_parse_hours():
+    assert schedule._parse_hours("08:30 - 17:15") == (dtime(8, 30), dtime(17, 15))
+
+
+@pytest.mark.parametrize("now,open_", [
+    (MON, True), (datetime(2026, 10, 19, 8, 59), False), (datetime(2026, 10, 19, 18, 0), False),
+    (datetime(2026, 10, 24, 12, 0), False),  # Saturday
+])
+def test_is_open(now, open_):
+    assert schedule.is_open(now) is open_
+
+
+@pytest.mark.parametrize("now,expected", [
+    (MON, MON),
+    (datetime(2026, 10, 19, 7, 0), datetime(2026, 10, 19, 9, 0)),
+    (datetime(2026, 10, 19, 19, 0), datetime(2026, 10, 20, 9, 0)),
+    (FRI_EVENING, datetime(2026, 10, 26, 9, 0)),
+])
+def test_next_open(now, expected):
+    assert schedule.next_open(now) == expected
+
+
+def test_remaining_seconds():
+    assert schedule.remaining_seconds(MON) == 8 * 3600
+    assert schedule.remaining_seconds(FRI_EVENING) == 0
+
+
+def test_pace_rate_spreads_over_the_rest_of_the_window():
+    five_pm = datetime(2026, 10, 19, 17, 0)
+    assert schedule.pace_rate(360, five_pm, tps=10) == pytest.approx(0.1)
+    assert schedule.pace_rate(10 ** 6, five_pm, tps=10) == 10  # capped at TPS
+    assert schedule.pace_rate(360, FRI_EVENING, tps=10) == 0.0
+    assert schedule.pace_rate(0, five_pm, tps=10) == 0.0
+
+
+def test_pace_rate_fast_and_always_open(monkeypatch):
+    monkeypatch.setattr(schedule, "CAMPAIGN_PACING", "fast")
+    assert schedule.pace_rate(1, MON, tps=7) == 7
+    monkeypatch.setattr(schedule, "CAMPAIGN_PACING", "even")
+    monkeypatch.setattr(schedule, "SKIP_BH", True)
+    assert schedule.pace_rate(1, FRI_EVENING, tps=7) == 7
+
+
+def test_plan_fits_in_the_current_window():
+    p = schedule.plan(100, MON, tps=1)
+    assert (p["open"], p["next_open"], p["fits_this_window"]) == (True, None, 100)
+    assert p["eta"] == "2026-10-19T18:00"  # even pacing uses the whole window
+
+
+def test_plan_rolls_over_to_later_windows():
+    p = schedule.plan(8 * 3600 + 9 * 3600 + 100, MON, tps=1)
+    assert p["fits_this_window"] == 8 * 3600
+    assert p["eta"] == "2026-10-21T18:00"  # Mon rest + all of Tue, the last 100 on Wed
+
+
+def test_plan_when_closed_starts_at_the_next_window(monkeypatch):
+    monkeypatch.setattr(schedule, "CAMPAIGN_PACING", "fast")
+    p = schedule.plan(3600, FRI_EVENING, tps=1)
+    assert (p["open"], p["next_open"]) == (False, "2026-10-26T09:00")
+    assert p["fits_this_window"] == 3600
+    assert p["eta"] == "2026-10-26T10:00"  # fast: n / tps after opening
+
+
+def test_plan_nothing_left():
+    assert schedule.plan(0, MON)["eta"] is None
@@ -0,0 +1,72 @@
+# tests/test_segments.py
+import pytest
+
+from app.services import segments
+from app.services.segments import GSM7, UCS2
+
+
+@pytest.mark.parametrize("text,enc,n", [
+    ("", GSM7, 0),
+    ("a" * 160, GSM7, 1),
+    ("a" * 161, GSM7, 2),
+    ("a" * 306, GSM7, 2),
+    ("a" * 307, GSM7, 3),
+    ("€" * 80, GSM7, 1),      # extension characters take two septets
+    ("€" * 81, GSM7, 2),
+    ("ą" * 70, UCS2, 1),      # one Lithuanian letter → UCS-2
+    ("ą" * 71, UCS2, 2),
+    ("ą" * 134, UCS2, 2),
+    ("ą" * 135, UCS2, 3),
+    ("a" * 159 + "ą", UCS2, 3),
+    ("🙂" * 35, UCS2, 1),     # surrogate pairs: two UTF-16 units
+    ("🙂" * 36, UCS2, 2),
+])
+def test_count(text, enc, n):
+    assert segments.encoding(text) == enc
+    assert segments.count(text) == n
+
+
+def test_two_unit_characters_never_straddle_a_segment():
+    gsm = "a" * 152 + "€" + "a" * 10       # 164 septets; € would cross the 153 boundary
+    assert segments.info(gsm) == {"encoding": GSM7, "units": 164, "segments": 2,
+                                  "per_segment": 153, "remaining": 153 - 12}
+    ucs = "ą" * 66 + "🙂" + "ą" * 5         # 73 units; the emoji would cross 67
+    assert segments.info(ucs)["segments"] == 2
+    assert segments.info(ucs)["remaining"] == 67 - 7
+
+
+def test_info_single_segment():
+    assert segments.info("Labas") == {"encoding": GSM7, "units": 5, "segments": 1,
+                                      "per_segment": 160, "remaining": 155}
+
+
+def test_to_gsm7_transliterates_typography_and_emoji():
+    assert segments.to_gsm7("Sveiki… „Valandinis“ – darbas 🙂👍") == 'Sveiki... "Valandinis" - darbas :)'
+    assert segments.to_gsm7("Ačiū") == "Ačiū"
+    assert segments.to_gsm7("Ačiū", fold_diacritics=True) == "Aciu"
+
+
+def test_finalize_prefers_gsm7_when_only_typography_blocks_it():
+    out = segments.finalize("Labas!  Ar domintų?")
+    assert out == "Labas! Ar domintų?" and segments.encoding(out) == UCS2
+    out = segments.finalize("Hello…  see you 🙂")
+    assert out == "Hello... see you :)" and segments.encoding(out) == GSM7
+
+
+def test_fit_drops_statements_before_the_question():
+    long = "Siūlome lanksčius grafikus ir greitą pradžią. " * 3
+    text = long + "Ar domintų darbas Kaune? Ačiū už atsakymą."
+    out = segments.fit(text, max_segments=1)
+    assert segments.count(out) == 1
+    assert out.endswith("Ar domintų darbas Kaune?")
+
+
+def test_fit_cuts_words_with_an_ellipsis_when_one_sentence_is_too_long():
+    out = segments.fit("žodis " * 40, max_segments=1)
+    assert out.endswith("…") and segments.count(out) == 1
+    assert segments.fit("a" * 400, max_segments=1) == "a" * 157 + "..."
+
+
+def test_fit_leaves_short_text_alone():
+    assert segments.fit("Labas", 1) == "Labas"
+    assert segments.fit("a" * 500, 0) == "a" * 500
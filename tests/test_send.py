@@ -0,0 +1,122 @@
+# tests/test_send.py
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.storage.db import SessionLocal
+from app.storage.models import Contact, OutboxItem
+
+
+@pytest.fixture(scope="module")
+def client():
+    # lifespan runs the outbox workers against the dry-run provider
+    with TestClient(main.app) as c:
+        yield c
+
+
+def _outbox_status(outbox_id):
+    db = SessionLocal()
+    try:
+        return db.get(OutboxItem, outbox_id).status
+    finally:
+        db.close()
+
+
+def _wait_sent(outbox_id, timeout=5.0):
+    t0 = time.monotonic()
+    while _outbox_status(outbox_id) != "sent" and time.monotonic() - t0 < timeout:
+        time.sleep(0.05)
+    return _outbox_status(outbox_id)
+
+
+def test_send_queues_and_returns_ids(client):
+    r = client.post("/send?force=true", json={"to": "37061000001", "body": "Labas", "userref": "send-t1"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["status"] == "queued" and body["id"] and body["outbox_id"]
+    assert "duplicate" not in body
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["cached", "db"])
+def test_duplicate_userref_reports_the_current_status(client, cached):
+    ref = f"send-dup-{cached}"
+    to = "37061000002" if cached else "37061000003"
+    first = client.post("/send?force=true", json={"to": to, "body": "Labas", "userref": ref}).json()
+    assert _wait_sent(first["outbox_id"]) == "sent"
+    if not cached:
+        main.recent_sends._d.clear()
+    again = client.post("/send?force=true", json={"to": to, "body": "Kitas tekstas", "userref": ref})
+    assert again.status_code == 200  # not the per-person throttle: the retry is answered first
+    assert again.json() == {"id": first["id"], "outbox_id": first["outbox_id"], "status": "sent", "duplicate": True}
+
+
+def test_missing_body_is_rejected(client):
+    assert client.post("/send", json={"to": "37061000004"}).status_code == 400
+
+
+def test_dnc_contact_is_refused(client):
+    db = SessionLocal()
+    try:
+        db.add(Contact(phone="37061000005", dnc=True))
+        db.commit()
+    finally:
+        db.close()
+    r = client.post("/send?force=true", json={"to": "37061000005", "body": "Labas"})
+    assert r.status_code == 403
+
+
+def test_per_person_throttle(client):
+    assert client.post("/send?force=true", json={"to": "37061000006", "body": "Labas"}).status_code == 200
+    assert client.post("/send?force=true", json={"to": "37061000006", "body": "Dar kartą"}).status_code == 429
+
+
+# ==== /send-batch ====
+def _ndjson(r):
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    return lines[:-1], lines[-1]
+
+
+def test_send_batch_streams_one_line_per_item_then_a_summary(client, monkeypatch):
+    monkeypatch.setattr(main, "SEND_BATCH_CHUNK", 2)
+    items = [{"to": f"3706200000{i}", "body": f"Labas {i}", "userref": f"batch-{i}"} for i in range(5)]
+    items += [
+        {"to": "37062000010"},                                           # no body
+        {"to": "37062000011", "body": "x", "userref": "batch-0"},        # userref repeated in the batch
+        {"to": "37062000000", "body": "Antras"},                         # same phone twice
+    ]
+    results, done = _ndjson(client.post("/send-batch?force=true", json={"items": items}))
+    assert done == {"done": True, "total": 8, "ok": 5, "failed": 3}
+    by_index = {r["index"]: r for r in results}
+    assert sorted(by_index) == list(range(8))
+    assert all(by_index[i]["ok"] and by_index[i]["status"] == "queued" for i in range(5))
+    assert by_index[5]["error"] == "Missing body/text"
+    assert by_index[6]["error"] == "Duplicate userref batch-0"
+    assert by_index[7]["error"] == "Per-person throttle"
+
+
+def test_send_batch_answers_known_userrefs_as_duplicates(client):
+    first = client.post("/send?force=true", json={"to": "37062000020", "body": "Labas", "userref": "batch-dup"}).json()
+    r = client.post("/send-batch?force=true&stream=0", json={"items": [
+        {"to": "37062000020", "body": "Labas", "userref": "batch-dup"},
+        {"to": "37062000021", "body": "Labas"},
+    ]})
+    dup, fresh = r.json()["results"]  # stream=0: input order, no index
+    assert dup["ok"] and dup["duplicate"] and dup["id"] == first["id"]
+    assert fresh["ok"] and fresh["to"] == "37062000021" and "index" not in fresh
+
+
+def test_send_batch_skips_dnc_contacts(client):
+    db = SessionLocal()
+    try:
+        db.add(Contact(phone="37062000030", dnc=True))
+        db.commit()
+    finally:
+        db.close()
+    results, done = _ndjson(client.post("/send-batch?force=true", json={"items": [
+        {"to": "37062000030", "body": "Labas"}, {"to": "37062000031", "body": "Labas"}]}))
+    assert {r["to"]: r.get("error") for r in results} == {"37062000030": "DNC/STOP on this contact", "37062000031": None}
+    assert (done["ok"], done["failed"]) == (1, 1)
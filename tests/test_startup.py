@@ -0,0 +1,36 @@
+# tests/test_startup.py
+"""
+The API process starts without the heavy optional modules. Runs in a fresh
+interpreter: other tests import openai (and may import pandas) in this one.
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from app.tools.bench_startup import LAZY
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SCRIPT = """
+import json, sys
+from fastapi.testclient import TestClient
+from app.main import app
+
+with TestClient(app) as client:  # runs the lifespan: schema, transport, workers, leader
+    status = client.get("/healthz").status_code
+print(json.dumps({"status": status, "loaded": sorted(m for m in %r if m in sys.modules)}))
+"""
+
+
+def test_lifespan_start_skips_lazy_modules():
+    env = dict(os.environ)
+    env.update(DATABASE_URL=f"sqlite:///{tempfile.mkdtemp(prefix='smsbot-start-')}/start.db",
+               DRY_RUN="1", INFOBIP_PULL="0")
+    p = subprocess.run([sys.executable, "-c", _SCRIPT % (LAZY,)], cwd=_ROOT, env=env,
+                       capture_output=True, text=True, timeout=120)
+    assert p.returncode == 0, p.stderr[-2000:]
+    out = json.loads(p.stdout.strip().splitlines()[-1])
+    assert out["status"] == 200
+    assert out["loaded"] == []
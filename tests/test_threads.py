@@ -0,0 +1,70 @@
+# tests/test_threads.py
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app.services import outbox
+from app.storage.db import Base, SessionLocal, engine
+from app.storage.models import Contact, Thread
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    s = SessionLocal()
+    yield s
+    s.rollback()
+    s.query(Thread).delete()
+    s.query(Contact).delete()
+    s.commit()
+    s.close()
+
+
+def _committed_thread(phone):
+    """Another worker's transaction opens a thread for `phone` and commits."""
+    other = SessionLocal()
+    try:
+        if other.get(Contact, phone) is None:
+            other.add(Contact(phone=phone))
+            other.flush()
+        other.add(Thread(phone=phone))
+        other.commit()
+    finally:
+        other.close()
+
+
+def test_second_open_thread_per_phone_is_rejected(db):
+    _committed_thread("37060000001")
+    db.add(Thread(phone="37060000001"))
+    with pytest.raises(IntegrityError):
+        db.flush()
+
+
+def test_closed_threads_do_not_count(db):
+    _committed_thread("37060000002")
+    db.query(Thread).filter(Thread.phone == "37060000002").update({Thread.status: "closed"})
+    db.flush()
+    _, t = outbox.ensure_contact_thread(db, "37060000002")
+    db.commit()
+    assert t.status == "open"
+    assert db.query(Thread).filter(Thread.phone == "37060000002").count() == 2
+
+
+def test_open_threads_reuses_one_opened_concurrently(db):
+    # both callers saw no open thread; the other one committed first
+    db.add_all([Contact(phone="37060000003"), Contact(phone="37060000004")])
+    db.commit()
+    _committed_thread("37060000003")
+    threads = outbox._open_threads(db, ["37060000003", "37060000004"])
+    db.commit()
+    assert set(threads) == {"37060000003", "37060000004"}
+    open_ = db.query(Thread.phone).filter(Thread.status == "open").all()
+    assert sorted(p for p, in open_) == ["37060000003", "37060000004"]
+
+
+def test_ensure_threads_one_open_thread_per_phone(db):
+    _committed_thread("37060000005")
+    threads = outbox.ensure_threads(db, ["37060000005", "37060000006", "37060000005"])
+    db.commit()
+    assert set(threads) == {"37060000005", "37060000006"}
+    again = outbox.ensure_threads(db, ["37060000005", "37060000006"])
+    assert {p: t.id for p, t in again.items()} == {p: t.id for p, t in threads.items()}